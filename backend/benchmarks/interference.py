@@ -0,0 +1,138 @@
+"""
+Latencia de /full_search mientras el servidor hace trabajo en segundo plano.
+
+Arranca uvicorn sobre un corpus sintético (como suite.py --http) y reproduce
+registros de queries en tres fases con la misma concurrencia:
+- idle: sin nada más en marcha,
+- reindex: desde GET /reindex hasta que /reindex/status deja de estar en curso,
+- download: desde GET /download_wikipedia_html hasta que la descarga termina.
+
+Cada fase usa un registro con otra semilla para no servirla desde la caché
+de resultados de la anterior; con --uncached todas las queries piden
+"profile" y se puntúan sin pasar por la caché. Las fases con trabajo en segundo plano solo
+cuentan las queries lanzadas mientras ese trabajo sigue en marcha. Si p99 no
+sube respecto a idle, la puntuación no está compitiendo con la
+reconstrucción ni con la descarga.
+
+Uso (desde backend/):
+    python -m benchmarks.interference --docs 3000 --concurrency 8 --uncached --output interferencia.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import httpx
+from benchmarks.synthetic_corpus import write_corpus, MEDIAN_WORDS
+from benchmarks.query_log import generate_query_log, replay_http
+from benchmarks.suite import wait_for_server, git_commit, BACKEND_DIR, HTTP_PORT
+
+PHASES = ("idle", "reindex", "download")
+# Segundos entre consultas del estado de la tarea en segundo plano
+POLL_INTERVAL = 0.2
+# Queries de cada registro: las fases con tarea se cortan al terminar ésta
+PHASE_QUERIES = 100000
+
+def _watch(url: str, path: str, stop: threading.Event, timings: dict):
+    # Activa stop cuando la tarea de url + path deja de estar en curso
+    while not stop.is_set():
+        try:
+            state = httpx.get(url + path, timeout = 30).json().get("state")
+        except httpx.HTTPError:
+            state = None
+        if state not in ("pending", "running", None):
+            timings["state"] = state
+            break
+        time.sleep(POLL_INTERVAL)
+    timings["seconds"] = time.perf_counter() - timings["started"]
+    stop.set()
+
+def start_background(url: str, phase: str) -> str:
+    # Lanza la tarea de la fase y devuelve la ruta con su estado
+    if phase == "reindex":
+        httpx.get(url + "/reindex", timeout = 30).raise_for_status()
+        return "/reindex/status"
+    response = httpx.get(url + "/download_wikipedia_html", timeout = 30).json()
+    return f"/crawl_jobs/{response['job_id']}"
+
+def run_phase(url: str, phase: str, entries: list, concurrency: int, queries: int) -> dict:
+    if phase == "idle":
+        return replay_http(url, entries[:queries], concurrency)
+
+    stop = threading.Event()
+    timings = {"started": time.perf_counter()}
+    watcher = threading.Thread(target = _watch, args = (url, start_background(url, phase), stop, timings))
+    watcher.start()
+    result = replay_http(url, entries, concurrency, stop = stop)
+    watcher.join()
+
+    result["background"] = {"state": timings.get("state"), "seconds": timings["seconds"]}
+    return result
+
+def run(args) -> dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix = "ri_bench_")
+    os.environ["RI_INDEX_PATH"] = os.path.join(workdir, "index", "corpus.idx")
+    print(f"Generando corpus sintético de {args.docs} documentos en {workdir}...")
+    corpus = write_corpus(os.path.join(workdir, "docs"), args.docs, args.seed, args.median_words)
+    os.environ["RI_DOCS_PATH"] = corpus["path"]
+
+    # Importados aquí: leen RI_DOCS_PATH y RI_INDEX_PATH
+    from crawler.crawler import load_docs
+    from build_index import build_index_file
+
+    documents = load_docs()
+    build_index_file(os.environ["RI_INDEX_PATH"])
+
+    url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd = BACKEND_DIR, env = dict(os.environ)
+    )
+    phases = {}
+    try:
+        wait_for_server(url, process)
+        for i, phase in enumerate(args.phases):
+            entries = generate_query_log(documents, PHASE_QUERIES, args.seed + i + 1)
+            if args.uncached:
+                entries = [{**entry, "profile": True} for entry in entries]
+            result = run_phase(url, phase, entries, args.concurrency, args.queries)
+            phases[phase] = result
+            background = result.get("background")
+            print(f"  {phase:9} {result['count']:6d} queries  p50 {result['p50_ms']:7.1f} ms  "
+                  f"p99 {result['p99_ms']:7.1f} ms  {result['statuses']}"
+                  + (f"  ({background['state']} en {background['seconds']:.1f} s)" if background else ""))
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "meta": {"commit": git_commit(), "cpus": os.cpu_count(), "args": vars(args)},
+        "corpus": {"documents": len(documents)},
+        "phases": phases
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type = int, default = 3000)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--median-words", type = int, default = MEDIAN_WORDS)
+    parser.add_argument("--workdir", default = None)
+    parser.add_argument("--queries", type = int, default = 2000, help = "queries de la fase idle")
+    parser.add_argument("--concurrency", type = int, default = 8)
+    parser.add_argument("--uncached", action = "store_true", help = "puntuar todas las queries sin la caché de resultados")
+    parser.add_argument("--phases", type = lambda value: value.split(","), default = list(PHASES))
+    parser.add_argument("--port", type = int, default = HTTP_PORT)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w", encoding = "utf-8") as f:
+            json.dump(results, f, ensure_ascii = False, indent = 2)
+        print(f"Resultados en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Resumen de latencias común a los benchmarks: rendimiento y percentiles.
+"""
+import time
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+def summarize(latencies: list, elapsed: float = None) -> dict:
+    """
+    Resumen de una lista de latencias en segundos: nº de operaciones,
+    rendimiento (operaciones/s sobre elapsed, o sobre la suma de latencias si
+    se midieron una detrás de otra) y media, p50/p95/p99 y máximo en ms.
+    """
+    count = len(latencies)
+    if count == 0:
+        return {"count": 0}
+
+    values = np.asarray(latencies, dtype = np.float64)
+    total = float(values.sum()) if elapsed is None else elapsed
+    summary = {
+        "count": count,
+        "seconds": total,
+        "throughput": count / total if total > 0 else None,
+        "mean_ms": float(values.mean()) * 1000
+    }
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}_ms"] = float(value) * 1000
+    summary["max_ms"] = float(values.max()) * 1000
+
+    return summary
+
+def timed(fn, items) -> tuple:
+    # Aplica fn a cada elemento midiendo cada llamada: (resultados, latencias)
+    results = []
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
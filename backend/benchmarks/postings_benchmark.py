@@ -0,0 +1,165 @@
+"""
+Listas invertidas comprimidas (postings/postings.py) frente a las listas de
+Python de build_wand_index: memoria, velocidad de codificación y
+decodificación (lista completa, next y advance) y top-k con WAND.
+
+Cada documento de docs/ se trocea en pasajes de --passage-size términos para
+tener listas largas (varios bloques por término).
+
+Uso (desde backend/):
+    python -m benchmarks.postings_benchmark --passage-size 50 --k 10
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+from crawler.crawler import load_docs
+from corpus.corpus import process_text, build_index_from_counts
+from codec.codec import encode_varint, decode_varint
+from indexer.indexer import (
+    build_sparse_inverted_index,
+    build_wand_index,
+    compute_sparse_tfidf,
+    compute_sparse_tfidf_from_counts,
+    search_top_k
+)
+from postings.postings import build_postings, POSTINGS_BLOCK
+
+QUERIES = [
+    "inteligencia artificial",
+    "caballero andante",
+    "Sancho Panza escudero",
+    "aprendizaje automático redes neuronales",
+    "recuperación de información",
+    "molinos de viento gigantes",
+    "Melibea Calisto amor",
+    "Lazarillo ciego pan",
+]
+
+def build_passages(passage_size: int) -> list:
+    passages = []
+    for doc in load_docs():
+        tokens = process_text(doc["text"])
+        for start in range(0, len(tokens), passage_size):
+            passages.append(tokens[start:start + passage_size])
+    return passages
+
+def list_index_bytes(wand_index: dict) -> int:
+    # Tamaño aproximado de las listas de Python: listas, enteros y floats
+    total = sys.getsizeof(wand_index)
+    for entry in wand_index.values():
+        total += sys.getsizeof(entry) + sys.getsizeof(entry["doc_ids"]) + sys.getsizeof(entry["weights"])
+        total += sum(sys.getsizeof(doc_id) for doc_id in entry["doc_ids"])
+        total += sum(sys.getsizeof(weight) for weight in entry["weights"])
+    return total
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--passage-size", type = int, default = 50)
+    parser.add_argument("--k", type = int, default = 10)
+    args = parser.parse_args()
+
+    passages = build_passages(args.passage_size)
+    documents = [{"id": doc_id, "name": f"pasaje_{doc_id}"} for doc_id in range(len(passages))]
+    index = build_index_from_counts(documents, [Counter(tokens) for tokens in passages])
+    matrix, vocabulary, idf, norms = index["matrix"], index["vocabulary"], index["idf"], index["norms"]
+    postings = index["wand_index"]
+    num_postings = int(postings.arrays["term_ptr"][-1])
+
+    sparse_documents = [
+        {"id": doc["id"], "tfidf": compute_sparse_tfidf_from_counts(Counter(tokens), idf)}
+        for doc, tokens in zip(documents, passages)
+    ]
+    wand_index = build_wand_index(build_sparse_inverted_index(sparse_documents), norms)
+
+    print(f"Documentos: {len(passages)}  Vocabulario: {len(vocabulary)}  Entradas: {num_postings}  Bloque: {POSTINGS_BLOCK}")
+
+    # Memoria
+    list_bytes = list_index_bytes(wand_index)
+    packed_bytes = postings.nbytes()
+    print(f"Listas de Python: {list_bytes / 1e6:8.2f} MB  ({list_bytes / num_postings:.1f} B/entrada)")
+    print(f"Comprimidas:      {packed_bytes / 1e6:8.2f} MB  ({packed_bytes / num_postings:.1f} B/entrada, {list_bytes / packed_bytes:.1f}x menos)")
+
+    # Codificación
+    t_build = timed(lambda: build_postings(matrix, vocabulary, idf, norms))
+    print(f"build_postings:   {t_build * 1000:8.1f} ms  ({num_postings / t_build / 1e6:.2f} M entradas/s)")
+
+    gaps = decode_varint(postings.arrays["doc_data"])
+    t_encode = timed(lambda: encode_varint(gaps))
+    t_decode = timed(lambda: decode_varint(postings.arrays["doc_data"]))
+    print(f"varint codificar: {t_encode * 1000:8.1f} ms  ({len(gaps) / t_encode / 1e6:.1f} M enteros/s)")
+    print(f"varint decodificar:{t_decode * 1000:7.1f} ms  ({len(gaps) / t_decode / 1e6:.1f} M enteros/s)")
+
+    # Decodificación por lista y recorridos
+    t_lists = timed(lambda: [postings[term].doc_ids() for term in vocabulary])
+    print(f"doc_ids() de todas las listas: {t_lists * 1000:.1f} ms  ({num_postings / t_lists / 1e6:.2f} M entradas/s)")
+
+    long_terms = sorted(vocabulary, key = lambda term: -len(postings[term]))[:50]
+    long_postings = sum(len(postings[term]) for term in long_terms)
+
+    def walk():
+        for term in long_terms:
+            cursor = postings[term].iterator()
+            while cursor.doc is not None:
+                cursor.next()
+
+    t_next = timed(walk)
+    print(f"next() sobre las 50 listas más largas: {t_next * 1000:.1f} ms  ({long_postings / t_next / 1e6:.2f} M entradas/s)")
+
+    random.seed(0)
+    targets = sorted(random.sample(range(len(passages)), min(200, len(passages))))
+
+    def skip():
+        for term in long_terms:
+            cursor = postings[term].iterator()
+            for target in targets:
+                if cursor.advance(target) is None:
+                    break
+
+    t_advance = timed(skip)
+    print(f"advance() a {len(targets)} destinos en las 50 listas más largas: {t_advance * 1000:.1f} ms")
+
+    # Comprobación de advance frente a la lista completa
+    for term in long_terms[:10]:
+        doc_ids = postings[term].doc_ids()
+        cursor = postings[term].iterator()
+        for target in targets:
+            expected = next((d for d in doc_ids if d >= target), None)
+            if cursor.advance(target) != expected:
+                print(f"AVISO: advance({target}) incorrecto en '{term}'")
+                break
+
+    # Top-k con WAND: listas de Python frente a comprimidas (con cotas por bloque)
+    print(f"{'query':45} {'t_listas(ms)':>12} {'t_bloques(ms)':>13} {'docs':>6} {'docs_bloques':>12}")
+    for query in QUERIES:
+        q_tfidf = compute_sparse_tfidf(process_text(query), idf)
+
+        list_stats = {}
+        start = time.perf_counter()
+        expected = search_top_k(q_tfidf, wand_index, norms, args.k, list_stats)
+        t_list = (time.perf_counter() - start) * 1000
+
+        block_stats = {}
+        start = time.perf_counter()
+        top_k = search_top_k(q_tfidf, postings, norms, args.k, block_stats)
+        t_block = (time.perf_counter() - start) * 1000
+
+        if list(top_k.items()) != list(expected.items()):
+            print(f"  AVISO: el top-k con listas comprimidas difiere para '{query}'")
+
+        print(
+            f"{query:45} {t_list:>12.2f} {t_block:>13.2f} "
+            f"{list_stats['documents_scored']:>6} {block_stats['documents_scored']:>12}"
+        )
+
+if __name__ == "__main__":
+    main()
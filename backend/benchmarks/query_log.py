@@ -0,0 +1,145 @@
+"""
+Registro de queries para los benchmarks: generación a partir de un corpus,
+lectura y escritura en JSONL (una query por línea) y reproducción contra
+/full_search por HTTP con varias peticiones concurrentes.
+
+Las queries salen de los propios documentos (2-4 palabras seguidas con al
+menos una que no sea vacía), con algunas frases entre comillas y algunas con
+AND/NOT, y su popularidad sigue una distribución de Zipf: las más populares
+se repiten, como en un registro real, y aprovechan la caché de resultados.
+
+Uso (desde backend/):
+    python -m benchmarks.query_log generate --queries 5000 --output /tmp/queries.jsonl
+    python -m benchmarks.query_log replay /tmp/queries.jsonl --url http://127.0.0.1:8000 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import httpx
+from crawler.crawler import load_docs
+from processing.processing import lexical_analysis, tokenize, STOP_WORDS
+from benchmarks.latency import summarize
+
+# Queries distintas del registro (el resto son repeticiones)
+DISTINCT_QUERIES = 1000
+PHRASE_RATE = 0.1
+BOOLEAN_RATE = 0.05
+K_VALUES = [5, 10, 10, 20]
+
+def _query_from_text(rng: random.Random, words: list) -> str:
+    for _ in range(10):
+        size = rng.randint(2, 4)
+        start = rng.randrange(max(1, len(words) - size))
+        chosen = words[start:start + size]
+        content = [word for word in chosen if word not in STOP_WORDS and len(word) > 2]
+        if not content:
+            continue
+
+        draw = rng.random()
+        if draw < PHRASE_RATE:
+            return '"' + " ".join(chosen) + '"'
+        if draw < PHRASE_RATE + BOOLEAN_RATE and len(content) > 1:
+            operator = rng.choice(["AND", "NOT"])
+            return f"{content[0]} {operator} {content[1]}"
+        return " ".join(chosen)
+    return None
+
+def generate_query_log(documents: list, num_queries: int, seed: int = 0,
+                       distinct: int = DISTINCT_QUERIES) -> list:
+    """
+    Devuelve num_queries entradas {"query", "k"} sacadas de documents (con
+    "text"). Se generan distinct queries distintas y se eligen con una
+    distribución de Zipf (la i-ésima, con probabilidad proporcional a 1/i).
+    """
+    rng = random.Random(seed)
+    texts = [tokenize(lexical_analysis(doc["text"])) for doc in documents]
+    texts = [words for words in texts if len(words) > 4]
+    if not texts:
+        return []
+
+    pool = []
+    for _ in range(distinct * 3):
+        if len(pool) >= distinct:
+            break
+        query = _query_from_text(rng, rng.choice(texts))
+        if query is not None:
+            pool.append({"query": query, "k": rng.choice(K_VALUES)})
+
+    weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+    return rng.choices(pool, weights = weights, k = num_queries)
+
+def save_query_log(entries: list, path: str):
+    with open(path, "w", encoding = "utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii = False) + "\n")
+
+def load_query_log(path: str) -> list:
+    with open(path, "r", encoding = "utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def _replay(url: str, entries: list, concurrency: int, timeout: float, stop) -> dict:
+    latencies = []
+    statuses = {}
+    next_entry = iter(entries)
+
+    async def worker(client):
+        # Cada trabajador lanza su siguiente petición al recibir la respuesta
+        for entry in next_entry:
+            if stop is not None and stop.is_set():
+                break
+            start = time.perf_counter()
+            try:
+                response = await client.post(url + "/full_search", json = entry)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections = concurrency, max_keepalive_connections = concurrency)
+    async with httpx.AsyncClient(timeout = timeout, limits = limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {"concurrency": concurrency, "statuses": statuses, **summarize(latencies, elapsed)}
+
+def replay_http(url: str, entries: list, concurrency: int = 1, timeout: float = 60, stop = None) -> dict:
+    """
+    Reproduce el registro contra /full_search de url con concurrency
+    peticiones en vuelo (bucle cerrado). Devuelve el rendimiento, los
+    percentiles de latencia y el nº de respuestas por código HTTP (429 si el
+    servidor rechaza peticiones por estar saturado). Con stop (un
+    threading.Event) se deja de lanzar peticiones en cuanto se activa.
+    """
+    return asyncio.run(_replay(url.rstrip("/"), entries, concurrency, timeout, stop))
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    generate = commands.add_parser("generate")
+    generate.add_argument("--queries", type = int, default = 5000)
+    generate.add_argument("--distinct", type = int, default = DISTINCT_QUERIES)
+    generate.add_argument("--seed", type = int, default = 0)
+    generate.add_argument("--output", required = True)
+
+    replay = commands.add_parser("replay")
+    replay.add_argument("log")
+    replay.add_argument("--url", default = "http://127.0.0.1:8000")
+    replay.add_argument("--concurrency", type = int, default = 8)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        entries = generate_query_log(load_docs(), args.queries, args.seed, args.distinct)
+        save_query_log(entries, args.output)
+        print(f"{len(entries)} queries ({len({e['query'] for e in entries})} distintas) en {args.output}")
+        return
+
+    result = replay_http(args.url, load_query_log(args.log), args.concurrency)
+    print(json.dumps(result, indent = 2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Mide el stemming de todos los tokens del corpus con el stemmer directamente
+frente a la caché de raíces (StemCache), y el tiempo de indexación completo.
+
+Uso (desde backend/):
+    python -m benchmarks.stem_benchmark
+"""
+import time
+from crawler.crawler import load_docs
+from corpus.corpus import analyze_text, build_corpus_index
+from processing.processing import stemmer, StemCache
+
+def main():
+    documents = load_docs()
+    tokens = [token for doc in documents for token in analyze_text(doc["text"])]
+    print(f"Tokens: {len(tokens)}  Formas distintas: {len(set(tokens))}")
+
+    start = time.perf_counter()
+    uncached = [stemmer.stem(token) for token in tokens]
+    t_uncached = time.perf_counter() - start
+
+    cache = StemCache()
+    start = time.perf_counter()
+    cached = [cache.stem(token) for token in tokens]
+    t_cached = time.perf_counter() - start
+
+    if cached != uncached:
+        print("AVISO: la caché devuelve raíces distintas al stemmer")
+
+    stats = cache.stats()
+    print(f"Sin caché:  {t_uncached:.3f} s")
+    print(f"Con caché:  {t_cached:.3f} s  ({t_uncached / t_cached:.1f}x)")
+    print(f"Aciertos: {stats['hits']}  Fallos: {stats['misses']}  Tasa: {stats['hit_rate']:.3f}")
+
+    start = time.perf_counter()
+    build_corpus_index(documents, workers = 1)
+    print(f"Indexación completa (1 proceso): {time.perf_counter() - start:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Batería de benchmarks de indexación y búsqueda con salida JSON para comparar
+entre commits.
+
+Genera un corpus sintético de --docs documentos (synthetic_corpus; con
+--docs 0 se usan los de docs/) y un registro de queries (query_log), y mide
+el rendimiento y las latencias p50/p95/p99 de cada fase:
+- procesamiento lingüístico de processing.py paso a paso (sobre --sample
+  documentos) y análisis completo por documento como en build_corpus_index,
+- vocabulario, IDF, vectorización y matriz (todo el corpus, --repeat veces),
+- construcción del índice en disco e initialize_corpus_index,
+- por query: análisis, puntuación (rank_query) y snippets (build_results),
+- con --http, /full_search por HTTP con varios niveles de concurrencia,
+  arrancando uvicorn sobre el mismo corpus.
+
+El corpus y el índice se escriben en --workdir (RI_DOCS_PATH y RI_INDEX_PATH),
+nunca en docs/ ni en index/.
+
+Uso (desde backend/):
+    python -m benchmarks.suite --docs 10000 --http --concurrency 1,8,32 --output bench.json
+    python -m benchmarks.suite --compare antes.json despues.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.latency import summarize, timed
+from benchmarks.synthetic_corpus import write_corpus, MEDIAN_WORDS
+from benchmarks.query_log import generate_query_log, replay_http
+from processing.processing import (
+    lexical_analysis,
+    tokenize,
+    remove_stopwords,
+    meaningful_tokens,
+    stem_tokens,
+    analyze,
+    stem_cache
+)
+from corpus.corpus import count_surface_terms, INDEX_WORKERS, MATRIX_DTYPE
+from indexer.indexer import (
+    build_vocabulary,
+    compute_idf,
+    compute_sparse_tfidf_from_counts,
+    build_document_matrix
+)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HTTP_PORT = 8799
+# Segundos de espera a que el servidor cargue el índice
+SERVER_STARTUP_TIMEOUT = 600
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = BACKEND_DIR,
+                                capture_output = True, text = True, check = True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd = BACKEND_DIR,
+                               capture_output = True, text = True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def processing_stages(documents: list) -> dict:
+    # Cada paso de processing.py por separado, documento a documento
+    stages = {}
+    values = [doc["text"] for doc in documents]
+    for name, fn in [
+        ("lexical_analysis", lexical_analysis),
+        ("tokenize", tokenize),
+        ("remove_stopwords", remove_stopwords),
+        ("meaningful_tokens", meaningful_tokens),
+        ("stem_tokens", stem_tokens)
+    ]:
+        values, latencies = timed(fn, values)
+        stages[name] = summarize(latencies)
+    return stages
+
+def analyze_counts(text: str) -> dict:
+    # Recuentos de términos de un documento como en build_corpus_index
+    counts = {}
+    for form, count in count_surface_terms(text).items():
+        stemmed = stem_cache.stem(form)
+        counts[stemmed] = counts.get(stemmed, 0) + count
+    return counts
+
+def repeated(fn, repeat: int) -> tuple:
+    # fn() repetida: (último resultado, latencias)
+    results, latencies = timed(lambda _: fn(), range(repeat))
+    return results[-1], latencies
+
+def index_stages(documents: list, repeat: int) -> dict:
+    stages = {}
+
+    doc_counts, latencies = timed(analyze_counts, [doc["text"] for doc in documents])
+    stages["analysis"] = summarize(latencies)
+
+    term_lists = [list(counts) for counts in doc_counts]
+    vocabulary, latencies = repeated(lambda: build_vocabulary(term_lists), repeat)
+    stages["vocabulary"] = summarize(latencies)
+
+    idf, latencies = repeated(lambda: compute_idf(term_lists, vocabulary), repeat)
+    stages["idf"] = summarize(latencies)
+
+    sparse, latencies = timed(lambda counts: compute_sparse_tfidf_from_counts(counts, idf), doc_counts)
+    stages["vectorization"] = summarize(latencies)
+
+    sparse_documents = [
+        {"id": i, "tfidf": tfidf, "counts": counts}
+        for i, (tfidf, counts) in enumerate(zip(sparse, doc_counts))
+    ]
+    _, latencies = repeated(lambda: build_document_matrix(sparse_documents, vocabulary, MATRIX_DTYPE), repeat)
+    stages["matrix"] = summarize(latencies)
+
+    return stages, len(vocabulary)
+
+def query_stages(main_module, entries: list, scorer: str) -> dict:
+    # Por query, como /full_search: análisis, puntuación y snippets
+    from query.query import parse_query
+
+    snapshot = main_module.SNAPSHOT
+    analyzed = []
+    latencies = []
+    for entry in entries:
+        start = time.perf_counter()
+        parsed = parse_query(entry["query"])
+        q_clean = lexical_analysis(parsed["text"])
+        analyzed.append((entry, parsed, " ".join(tokenize(q_clean)), analyze(q_clean)))
+        latencies.append(time.perf_counter() - start)
+    stages = {"query_analysis": summarize(latencies)}
+
+    rankings, latencies = timed(
+        lambda item: main_module.rank_query(snapshot, item[1], item[3], item[0]["k"], scorer), analyzed
+    )
+    stages["scoring"] = summarize(latencies)
+
+    _, latencies = timed(
+        lambda pair: main_module.build_results(
+            snapshot, pair[1], main_module.snippet_phrase(pair[0][1], pair[0][2]), pair[0][3]
+        ),
+        list(zip(analyzed, rankings))
+    )
+    stages["snippets"] = summarize(latencies)
+
+    return stages
+
+def wait_for_server(url: str, process) -> dict:
+    deadline = time.time() + SERVER_STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {process.returncode})")
+        try:
+            return httpx.get(url + "/status", timeout = 5).json()
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+def http_benchmark(documents: list, args) -> dict:
+    # uvicorn en un proceso aparte con el mismo corpus e índice (variables RI_*)
+    url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd = BACKEND_DIR, env = dict(os.environ)
+    )
+    levels = []
+    try:
+        wait_for_server(url, process)
+        for i, concurrency in enumerate(args.concurrency):
+            # Cada nivel reproduce un registro con otra semilla para no servirlo
+            # entero desde la caché de resultados del nivel anterior
+            entries = generate_query_log(documents, args.queries, args.seed + i + 1)
+            before = httpx.get(url + "/status").json()["result_cache"]
+            result = replay_http(url, entries, concurrency)
+            after = httpx.get(url + "/status").json()["result_cache"]
+            result["cache_hits"] = after["hits"] - before["hits"]
+            levels.append(result)
+            print(f"  /full_search c={concurrency}: {result['throughput']:.0f} q/s  "
+                  f"p50 {result['p50_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms  {result['statuses']}")
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {"endpoint": "/full_search", "levels": levels}
+
+def run(args) -> dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix = "ri_bench_")
+    os.environ["RI_INDEX_PATH"] = os.path.join(workdir, "index", "corpus.idx")
+    corpus = {"source": "docs"}
+    if args.docs > 0:
+        print(f"Generando corpus sintético de {args.docs} documentos en {workdir}...")
+        corpus = write_corpus(os.path.join(workdir, "docs"), args.docs, args.seed, args.median_words)
+        os.environ["RI_DOCS_PATH"] = corpus["path"]
+
+    # Importados aquí: leen RI_DOCS_PATH y RI_INDEX_PATH
+    from crawler.crawler import load_docs
+    from build_index import build_index_file
+
+    documents = load_docs()
+    corpus["documents"] = len(documents)
+    stages = {}
+
+    print("Fases de procesamiento, vocabulario, IDF y vectorización...")
+    stages.update(processing_stages(documents[:args.sample]))
+    index_results, corpus["vocabulary"] = index_stages(documents, args.repeat)
+    stages.update(index_results)
+
+    print("Construcción y carga del índice...")
+    start = time.perf_counter()
+    build_index_file(os.environ["RI_INDEX_PATH"], args.workers)
+    stages["index_build"] = summarize([time.perf_counter() - start])
+
+    import main as main_module
+    _, latencies = repeated(main_module.initialize_corpus_index, args.repeat)
+    stages["initialize"] = summarize(latencies)
+
+    print("Queries (análisis, puntuación y snippets)...")
+    entries = generate_query_log(documents, args.queries, args.seed)
+    stages.update(query_stages(main_module, entries, args.scorer))
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec = "seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("compare", "output")}
+        },
+        "corpus": corpus,
+        "stages": stages
+    }
+
+    if args.http:
+        print("HTTP...")
+        results["http"] = http_benchmark(documents, args)
+
+    return results
+
+def print_stages(stages: dict):
+    print(f"{'fase':20} {'n':>7} {'ops/s':>10} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}")
+    for name, summary in stages.items():
+        if not summary.get("count"):
+            continue
+        print(f"{name:20} {summary['count']:7d} {summary['throughput']:10.1f} "
+              f"{summary['p50_ms']:9.3f} {summary['p95_ms']:9.3f} {summary['p99_ms']:9.3f}")
+
+def compare(old_path: str, new_path: str):
+    # Cociente nuevo / antiguo de p50, p99 y rendimiento de cada fase común
+    with open(old_path, "r", encoding = "utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding = "utf-8") as f:
+        new = json.load(f)
+
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    print(f"{'fase':20} {'p50':>8} {'p99':>8} {'ops/s':>8}")
+    rows = [(name, old["stages"][name], new["stages"][name]) for name in new["stages"] if name in old["stages"]]
+    old_levels = {level["concurrency"]: level for level in old.get("http", {}).get("levels", [])}
+    for level in new.get("http", {}).get("levels", []):
+        if level["concurrency"] in old_levels:
+            rows.append((f"http c={level['concurrency']}", old_levels[level["concurrency"]], level))
+
+    for name, a, b in rows:
+        if not a.get("count") or not b.get("count"):
+            continue
+        print(f"{name:20} {b['p50_ms'] / a['p50_ms']:7.2f}x {b['p99_ms'] / a['p99_ms']:7.2f}x "
+              f"{b['throughput'] / a['throughput']:7.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type = int, default = 1000, help = "documentos sintéticos (0: los de docs/)")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--median-words", type = int, default = MEDIAN_WORDS)
+    parser.add_argument("--workdir", default = None)
+    parser.add_argument("--sample", type = int, default = 500)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--workers", type = int, default = INDEX_WORKERS)
+    parser.add_argument("--queries", type = int, default = 2000)
+    parser.add_argument("--scorer", default = "tfidf")
+    parser.add_argument("--http", action = "store_true")
+    parser.add_argument("--port", type = int, default = HTTP_PORT)
+    parser.add_argument("--concurrency", type = lambda value: [int(c) for c in value.split(",")], default = [1, 8, 32])
+    parser.add_argument("--output", default = None)
+    parser.add_argument("--compare", nargs = 2, metavar = ("ANTES", "DESPUES"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run(args)
+    print_stages(results["stages"])
+
+    if args.output:
+        with open(args.output, "w", encoding = "utf-8") as f:
+            json.dump(results, f, ensure_ascii = False, indent = 2)
+        print(f"Resultados en {args.output}")
+
+if __name__ == "__main__":
+    main()
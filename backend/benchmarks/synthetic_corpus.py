@@ -0,0 +1,167 @@
+"""
+Generador de un corpus sintético "parecido al español" para los benchmarks:
+de los siete documentos de docs/ hasta 100k o más.
+
+El modelo se aprende de docs/: cada documento real es un "tema" con las
+frecuencias de sus palabras, y cada documento sintético mezcla las de un tema
+con las globales. Una pequeña parte de las palabras son inventadas (sílabas
+españolas con una distribución de Zipf), para que el vocabulario siga
+creciendo con el tamaño del corpus como en un corpus real (ley de Heaps).
+Con la misma semilla se genera siempre el mismo corpus.
+
+Uso (desde backend/):
+    python -m benchmarks.synthetic_corpus --docs 10000 --output /tmp/corpus_sintetico
+"""
+import argparse
+import functools
+import itertools
+import os
+import random
+import re
+import time
+from collections import Counter
+from crawler.crawler import load_docs
+from snippets.snippets import header_end, GUTENBERG_HEADER_PATTERNS
+
+# Palabras tal como aparecen en el texto (con tildes y eñes)
+WORD_RE = re.compile(r"[a-záéíóúüñ]+")
+GUTENBERG_FOOTER_RE = re.compile(r"\*\*\*\s*end of", re.IGNORECASE)
+# Peso del tema del documento frente a las frecuencias globales
+TOPIC_WEIGHT = 0.7
+# Proporción de palabras inventadas
+NEW_WORD_RATE = 0.02
+# Longitud de los documentos (nº de palabras): lognormal con esta mediana
+MEDIAN_WORDS = 400
+LENGTH_SIGMA = 0.8
+MIN_WORDS = 20
+SENTENCE_WORDS = (6, 24)
+PARAGRAPH_SENTENCES = (2, 7)
+
+ONSETS = ["", "b", "c", "d", "f", "g", "l", "m", "n", "p", "r", "s", "t", "v", "ch", "ll", "br", "pr", "tr", "gr", "cl", "pl"]
+VOWELS = ["a", "e", "i", "o", "u", "a", "e", "o", "á", "é", "í", "ó", "ú"]
+CODAS = ["", "", "", "n", "s", "r", "l"]
+SUFFIXES = ["", "", "ción", "mente", "ado", "ada", "idad", "ero", "ismo", "ante", "oso", "ible"]
+
+class LanguageModel:
+    # Distribución global de palabras y una por tema (documento de partida)
+
+    def __init__(self, documents: list):
+        self.topics = []
+        total = Counter()
+        for doc in documents:
+            counts = Counter(WORD_RE.findall(body_text(doc["text"]).lower()))
+            if counts:
+                self.topics.append(_distribution(counts))
+                total.update(counts)
+
+        if not total:
+            raise ValueError("No hay texto para aprender el modelo del corpus sintético")
+
+        self.global_words = _distribution(total)
+        self.vocabulary_size = len(total)
+
+def body_text(text: str) -> str:
+    # Texto sin la cabecera ni la licencia (en inglés) de Project Gutenberg
+    lower = text.lower()
+    if any(pattern.search(lower) for pattern in GUTENBERG_HEADER_PATTERNS):
+        text = text[header_end(text):]
+    footer = GUTENBERG_FOOTER_RE.search(text)
+    if footer:
+        text = text[:footer.start()]
+    return text
+
+def _distribution(counts: Counter) -> tuple:
+    # Palabras y pesos acumulados para random.choices
+    words, weights = zip(*counts.most_common())
+    return list(words), list(itertools.accumulate(weights))
+
+@functools.lru_cache(maxsize = 65536)
+def invented_word(rank: int) -> str:
+    # Palabra inventada determinista para cada rango de la distribución de Zipf
+    rng = random.Random(rank)
+    syllables = 2 + rank % 3
+    word = "".join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS) for _ in range(syllables))
+    return word + SUFFIXES[rank % len(SUFFIXES)]
+
+def _sample(rng: random.Random, distribution: tuple, n: int) -> list:
+    words, cumulative = distribution
+    return rng.choices(words, cum_weights = cumulative, k = n)
+
+def generate_text(model: LanguageModel, rng: random.Random, num_words: int) -> str:
+    topic = rng.choice(model.topics)
+    from_topic = sum(1 for _ in range(num_words) if rng.random() < TOPIC_WEIGHT)
+    words = _sample(rng, topic, from_topic) + _sample(rng, model.global_words, num_words - from_topic)
+    rng.shuffle(words)
+
+    for i in range(len(words)):
+        if rng.random() < NEW_WORD_RATE:
+            words[i] = invented_word(int(rng.paretovariate(1.0)))
+
+    # Frases con mayúscula inicial y punto final, agrupadas en párrafos
+    paragraphs = []
+    sentences = []
+    paragraph_size = rng.randint(*PARAGRAPH_SENTENCES)
+    i = 0
+    while i < len(words):
+        size = rng.randint(*SENTENCE_WORDS)
+        sentence = words[i:i + size]
+        i += size
+        if len(sentence) > 8 and rng.random() < 0.5:
+            comma = rng.randint(3, len(sentence) - 3)
+            sentence[comma] += ","
+        sentences.append(sentence[0].capitalize() + " " + " ".join(sentence[1:]) + ".")
+        if len(sentences) >= paragraph_size:
+            paragraphs.append(" ".join(sentences))
+            sentences = []
+            paragraph_size = rng.randint(*PARAGRAPH_SENTENCES)
+    if sentences:
+        paragraphs.append(" ".join(sentences))
+
+    return "\n\n".join(paragraphs) + "\n"
+
+def generate_documents(num_docs: int, seed: int = 0, model: LanguageModel = None,
+                       median_words: int = MEDIAN_WORDS):
+    """
+    Genera num_docs documentos {"name", "text"} (de forma perezosa). Sin
+    model, el modelo se aprende de los documentos de docs/.
+    """
+    if model is None:
+        model = LanguageModel(load_docs())
+
+    rng = random.Random(seed)
+    width = len(str(max(num_docs - 1, 1)))
+    for i in range(num_docs):
+        num_words = max(MIN_WORDS, int(rng.lognormvariate(0, LENGTH_SIGMA) * median_words))
+        yield {"name": f"sintetico_{i:0{width}d}.txt", "text": generate_text(model, rng, num_words)}
+
+def write_corpus(path: str, num_docs: int, seed: int = 0, median_words: int = MEDIAN_WORDS) -> dict:
+    # Escribe el corpus en path (un .txt por documento) y devuelve su tamaño
+    os.makedirs(path, exist_ok = True)
+
+    num_words = 0
+    num_bytes = 0
+    for doc in generate_documents(num_docs, seed, median_words = median_words):
+        with open(os.path.join(path, doc["name"]), "w", encoding = "utf-8") as f:
+            f.write(doc["text"])
+        num_words += len(doc["text"].split())
+        num_bytes += len(doc["text"].encode("utf-8"))
+
+    return {"path": path, "documents": num_docs, "words": num_words, "bytes": num_bytes, "seed": seed}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type = int, default = 1000)
+    parser.add_argument("--output", required = True)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--median-words", type = int, default = MEDIAN_WORDS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    corpus = write_corpus(args.output, args.docs, args.seed, args.median_words)
+    elapsed = time.perf_counter() - start
+
+    print(f"{corpus['documents']} documentos, {corpus['words']} palabras, "
+          f"{corpus['bytes'] / 1e6:.1f} MB en {corpus['path']} ({elapsed:.1f} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Compara el top-k con WAND frente a la puntuación exhaustiva sobre el índice
+invertido: entradas de las listas evaluadas, documentos puntuados y tiempo
+(el mejor de --repeat) de cada camino y del que elige search_scored
+(use_wand). Con --index se usan además las queries de sample_queries
+sobre un índice guardado (p. ej. el del corpus sintético).
+
+Cada documento de docs/ se trocea en pasajes de --passage-size términos para
+tener un corpus con muchos documentos.
+
+Uso (desde backend/):
+    python -m benchmarks.topk_benchmark --k 10 --passage-size 200
+"""
+import argparse
+import time
+from crawler.crawler import load_docs
+from processing.processing import (
+    lexical_analysis,
+    tokenize,
+    remove_stopwords,
+    meaningful_tokens,
+    stem_tokens
+)
+from indexer.indexer import (
+    build_vocabulary,
+    compute_idf,
+    compute_sparse_tfidf,
+    build_sparse_inverted_index,
+    compute_document_norms,
+    build_wand_index,
+    search_inverted_index,
+    search_scored,
+    TfidfCosineScorer,
+    IndexStatistics,
+    make_scorer
+)
+
+QUERIES = [
+    "inteligencia artificial",
+    "caballero andante",
+    "Sancho Panza escudero",
+    "aprendizaje automático redes neuronales",
+    "recuperación de información",
+    "molinos de viento gigantes",
+    "Melibea Calisto amor",
+    "Lazarillo ciego pan",
+]
+
+def analyze(text: str) -> list:
+    tokens = tokenize(lexical_analysis(text))
+    tokens = remove_stopwords(tokens)
+    tokens = meaningful_tokens(tokens)
+    return stem_tokens(tokens)
+
+def build_passages(passage_size: int) -> list:
+    passages = []
+    for doc in load_docs():
+        tokens = analyze(doc["text"])
+        for start in range(0, len(tokens), passage_size):
+            passages.append(tokens[start:start + passage_size])
+    return passages
+
+def timed(fn, repeat: int) -> tuple:
+    # Resultado y mejor tiempo (ms) de repeat ejecuciones
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def index_benchmark(index_path: str, num_queries: int, k: int, repeat: int):
+    # Tiempo total de cada camino con queries de sample_queries sobre un índice guardado
+    from storage.storage import load_index
+    from pruning.pruning import sample_queries
+
+    index = load_index(index_path)
+    statistics = IndexStatistics(index)
+    queries = sample_queries(index, num_queries)
+    print(f"\nÍndice {index_path}: {len(index['documents'])} documentos, {len(queries)} queries, k: {k}")
+
+    for scorer_name in ("tfidf", "bm25"):
+        totals = {False: 0.0, True: 0.0, None: 0.0}
+        wand_queries = 0
+        for tokens in queries:
+            results = {}
+            for wand in totals:
+                def run():
+                    scorer = make_scorer(scorer_name, statistics)
+                    stats = {}
+                    ranking = search_scored(scorer.prepare(tokens), index["wand_index"], scorer, k, stats, wand)
+                    return ranking, stats
+                (ranking, stats), elapsed = timed(run, repeat)
+                totals[wand] += elapsed
+                results[wand] = list(ranking.items())
+            wand_queries += stats["wand"]
+            if not results[False] == results[True] == results[None]:
+                print(f"  AVISO: los top-k difieren para {tokens}")
+
+        print(
+            f"{scorer_name:6} exhaustivo {totals[False]:9.1f} ms  WAND {totals[True]:9.1f} ms  "
+            f"search_scored {totals[None]:9.1f} ms (WAND en {wand_queries} queries)"
+        )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type = int, default = 10)
+    parser.add_argument("--passage-size", type = int, default = 200)
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--index", default = None)
+    parser.add_argument("--queries", type = int, default = 500)
+    args = parser.parse_args()
+
+    passages = build_passages(args.passage_size)
+    vocabulary = build_vocabulary(passages)
+    idf = compute_idf(passages, vocabulary)
+
+    documents = [
+        {"id": doc_id, "tfidf": compute_sparse_tfidf(tokens, idf)}
+        for doc_id, tokens in enumerate(passages)
+    ]
+    inverted = build_sparse_inverted_index(documents)
+    norms = compute_document_norms(documents)
+    wand_index = build_wand_index(inverted, norms)
+
+    print(f"Documentos: {len(passages)}  Vocabulario: {len(vocabulary)}  k: {args.k}")
+    print(
+        f"{'query':45} {'postings':>9} {'wand':>9} {'docs':>7} "
+        f"{'t_exh(ms)':>10} {'t_wand(ms)':>10} {'t_auto(ms)':>10} {'camino':>10}"
+    )
+
+    totals = {"postings": 0, "scored": 0, "exhaustive": 0.0, "wand": 0.0, "auto": 0.0}
+
+    for query in QUERIES:
+        q_tfidf = compute_sparse_tfidf(analyze(query), idf)
+        query_terms = sorted((term, weight) for term, weight in q_tfidf.items() if weight != 0 and term in wand_index)
+
+        def run(wand: bool = None, stats: dict = None):
+            scorer = TfidfCosineScorer(None, norms)
+            return search_scored(scorer.set_query(list(query_terms)), wand_index, scorer, args.k, stats, wand)
+
+        exhaustive, t_exhaustive = timed(lambda: run(False), args.repeat)
+        stats = {}
+        top_k, t_wand = timed(lambda: run(True, stats), args.repeat)
+        auto, t_auto = timed(lambda: run(), args.repeat)
+
+        expected = dict(list(search_inverted_index(q_tfidf, inverted, norms).items())[:args.k])
+        if not (list(top_k.items()) == list(exhaustive.items()) == list(auto.items()) == list(expected.items())):
+            print(f"  AVISO: los top-k difieren para '{query}'")
+
+        totals["postings"] += stats["postings_total"]
+        totals["scored"] += stats["postings_scored"]
+        totals["exhaustive"] += t_exhaustive
+        totals["wand"] += t_wand
+        totals["auto"] += t_auto
+
+        auto_stats = {}
+        run(stats = auto_stats)
+        path = "wand" if auto_stats["wand"] else "exhaustivo"
+        print(
+            f"{query:45} {stats['postings_total']:>9} {stats['postings_scored']:>9} "
+            f"{stats['documents_scored']:>7} {t_exhaustive:>10.2f} {t_wand:>10.2f} {t_auto:>10.2f} {path:>10}"
+        )
+
+    if totals["postings"]:
+        print(
+            f"Entradas evaluadas por WAND: {totals['scored']}/{totals['postings']} "
+            f"({100 * totals['scored'] / totals['postings']:.1f}%)"
+        )
+    print(
+        f"Tiempo total (ms): exhaustivo {totals['exhaustive']:.2f}  WAND {totals['wand']:.2f}  "
+        f"search_scored {totals['auto']:.2f}"
+    )
+
+    if args.index:
+        index_benchmark(args.index, args.queries, args.k, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Paso de construcción del índice: procesa docs/ y escribe el índice binario
+que main.py carga con mmap al arrancar. Con --shards N escribe además los
+índices de N shards y su manifiesto (shards.py, RI_SHARDS=1 en main.py).
+
+Con --prune-terms, --prune-impact o --prune-postings el índice se poda
+(pruning.py) y se informa de su tamaño y de la pérdida de recall y NDCG
+frente al índice sin podar de --reference (por defecto, el que había en la
+ruta por defecto antes de escribir el nuevo).
+
+Uso (desde backend/):
+    python build_index.py [--workers N] [--shards N] [ruta_del_indice]
+    python build_index.py --prune-terms 200 --prune-postings 5000 /tmp/podado.idx
+"""
+import argparse
+import json
+import time
+from crawler.crawler import iter_docs, extraction_cache
+from corpus.corpus import build_corpus_index, ingest_workers, INDEX_WORKERS
+from storage.storage import save_index, load_index, load_stem_lexicon, default_index_path
+from processing.processing import stem_cache
+from shards.shards import build_shards
+from pruning.pruning import (
+    pruning_options,
+    sample_queries,
+    evaluate_pruning,
+    EVALUATION_QUERIES,
+    EVALUATION_K
+)
+
+def build_index_file(path: str = None, workers: int = INDEX_WORKERS, lexicon_from: str = None,
+                     pruning: dict = None, progress = None) -> int:
+    """
+    Construye el índice de docs/ y lo escribe en path. Devuelve el número de
+    documentos indexados (0 si no hay ninguno; entonces no se escribe nada).
+    El léxico forma -> raíz de partida se lee junto al índice lexicon_from
+    (por defecto, el propio path). pruning son las opciones de poda estática
+    (pruning_options). main.py la ejecuta en un proceso aparte para
+    reconstruir el índice sin frenar las búsquedas.
+    """
+    # Reutilizar el léxico forma -> raíz de la construcción anterior
+    stem_cache.update(load_stem_lexicon(lexicon_from or path))
+
+    # La extracción (iter_docs) y el análisis (build_corpus_index) en procesos
+    workers = ingest_workers(workers)
+    index = build_corpus_index(iter_docs(workers), workers = workers, progress = progress, pruning = pruning)
+    if not index["documents"]:
+        return 0
+
+    save_index(index, path)
+
+    # Los textos extraídos de documentos que ya no están en docs/ no se volverán a usar
+    cache = extraction_cache()
+    if cache is not None:
+        cache.prune()
+    return len(index["documents"])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs = "?", default = None)
+    parser.add_argument("--workers", type = int, default = INDEX_WORKERS)
+    parser.add_argument("--shards", type = int, default = 0)
+    parser.add_argument("--prune-terms", type = int, default = None)
+    parser.add_argument("--prune-impact", type = float, default = None)
+    parser.add_argument("--prune-postings", type = int, default = None)
+    parser.add_argument("--reference", default = None)
+    parser.add_argument("--queries", type = int, default = EVALUATION_QUERIES)
+    parser.add_argument("--k", type = int, default = EVALUATION_K)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pruning = pruning_options(args.prune_terms, args.prune_impact, args.prune_postings)
+
+    if args.shards:
+        manifest = build_shards(args.shards, args.path, args.workers, pruning = pruning)
+        if manifest is None:
+            print("No hay documentos para indexar.")
+            return
+        sizes = ", ".join(str(shard["num_docs"]) for shard in manifest["shards"])
+        elapsed = time.perf_counter() - start
+        print(f"{manifest['num_shards']} shards de {manifest['num_docs']} documentos ({sizes}) "
+              f"escritos junto a {args.path or default_index_path()} ({elapsed:.1f} s)")
+        return
+
+    # El índice de referencia se carga antes de escribir el nuevo, que puede
+    # sustituirlo (el mmap sigue viendo el fichero anterior)
+    reference = None
+    if pruning is not None:
+        try:
+            reference = load_index(args.reference)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Sin índice de referencia para medir la pérdida de la poda ({e}).")
+        if reference is not None and reference.get("pruning"):
+            print(f"Aviso: el índice de referencia también está podado ({reference['pruning']}).")
+
+    num_docs = build_index_file(args.path, args.workers, pruning = pruning)
+    if not num_docs:
+        print("No hay documentos para indexar.")
+        return
+
+    path = args.path or default_index_path()
+    elapsed = time.perf_counter() - start
+    print(f"Índice de {num_docs} documentos escrito en {path} con {ingest_workers(args.workers)} procesos ({elapsed:.1f} s)")
+
+    if reference is not None:
+        queries = sample_queries(reference, args.queries)
+        report = evaluate_pruning(reference, load_index(path), queries, args.k)
+        print(json.dumps({"pruning": pruning, **report}, indent = 2))
+
+if __name__ == "__main__":
+    main()
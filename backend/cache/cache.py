@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Valores por defecto de la caché de resultados de /full_search
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = 300
+RESULT_CACHE_BYTES = 32 * 1024 * 1024
+# Bloques en que se lee un fichero para calcular su hash (caché de extracción)
+EXTRACTION_HASH_BLOCK = 1024 * 1024
+
+def estimate_size(value) -> int:
+    # Tamaño aproximado de un resultado serializable en bytes
+    return len(json.dumps(value, ensure_ascii = False, default = str))
+
+class ResultCache:
+    """
+    Caché LRU con caducidad (TTL) y límite de memoria aproximado. Cada entrada
+    queda asociada a la versión del índice con la que se calculó: cuando la
+    versión cambia (reindexado, compactación o cualquier alta/baja) la caché
+    se vacía entera.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 max_bytes: int = RESULT_CACHE_BYTES):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+            self._version = version
+
+    def get(self, key, version):
+        with self._lock:
+            self._check_version(version)
+
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry["created"] > self.ttl:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry["elapsed"]
+            return entry["value"]
+
+    def put(self, key, version, value, elapsed: float = 0.0):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._check_version(version)
+
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = {
+                "value": value,
+                "size": size,
+                "elapsed": elapsed,
+                "created": time.monotonic()
+            }
+            self.bytes += size
+
+            while len(self._entries) > self.maxsize or self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry["size"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "saved_seconds": self.saved_seconds
+        }
+
+def file_digest(filepath: str) -> str:
+    # SHA-256 del contenido de un fichero, leído por bloques
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(EXTRACTION_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """
+    Texto ya extraído de los documentos (PDF, HTML) en disco, para no volver
+    a analizarlos en cada arranque o reconstrucción si no han cambiado.
+
+    Cada fichero tiene una entrada (entries/<sha1 de la ruta>.json) con su
+    tamaño, su mtime, el SHA-256 de su contenido y el lector que lo extrajo;
+    el texto se guarda por contenido (texts/<sha256>.<lector>.txt), así que
+    dos copias del mismo fichero lo comparten. Si el tamaño y el mtime
+    coinciden, el texto se usa sin leer el fichero; si solo cambia el mtime,
+    se comprueba el hash. Todo se escribe a un temporal y se renombra, de modo
+    que varios procesos pueden usar la misma caché a la vez.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, filepath: str) -> str:
+        key = hashlib.sha1(os.path.abspath(filepath).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, "entries", key + ".json")
+
+    def _text_path(self, digest: str, reader: str) -> str:
+        return os.path.join(self.path, "texts", f"{digest}.{reader}.txt")
+
+    def _write(self, path: str, content: str):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding = "utf-8", newline = "") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _read_entry(self, filepath: str) -> dict:
+        try:
+            with open(self._entry_path(filepath), "r", encoding = "utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, filepath: str, reader: str) -> str:
+        # Ruta del texto de filepath extraído por reader si sigue valiendo (None si no)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+
+        entry = self._read_entry(filepath)
+        if entry is None or entry["reader"] != reader or entry["size"] != stat.st_size:
+            self._count(False)
+            return None
+
+        if entry["mtime_ns"] != stat.st_mtime_ns:
+            # Modificado (o copiado) sin cambiar de tamaño: decide el contenido
+            if file_digest(filepath) != entry["sha256"]:
+                self._count(False)
+                return None
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._write(self._entry_path(filepath), json.dumps(entry))
+
+        text_path = self._text_path(entry["sha256"], reader)
+        hit = os.path.exists(text_path)
+        self._count(hit)
+        return text_path if hit else None
+
+    def store(self, filepath: str, reader: str, text: str, stat: os.stat_result) -> str:
+        """
+        Guarda el texto extraído de filepath y devuelve la ruta donde queda.
+        stat es el de filepath antes de extraerlo: si el fichero ha cambiado
+        mientras tanto, o el texto no se puede guardar, no se guarda nada y
+        devuelve None.
+        """
+        try:
+            digest = file_digest(filepath)
+            current = os.stat(filepath)
+            if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                return None
+
+            text_path = self._text_path(digest, reader)
+            if not os.path.exists(text_path):
+                self._write(text_path, text)
+            entry = {
+                "path": os.path.abspath(filepath),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+                "reader": reader
+            }
+            self._write(self._entry_path(filepath), json.dumps(entry, ensure_ascii = False))
+            return text_path
+        except (OSError, UnicodeEncodeError) as e:
+            print(f"No se ha podido guardar el texto de {filepath} en la caché: {e}")
+            return None
+
+    def prune(self) -> int:
+        # Borra las entradas de ficheros que ya no existen y los textos sin entrada; devuelve cuántos
+        entries_path = os.path.join(self.path, "entries")
+        texts_path = os.path.join(self.path, "texts")
+        if not os.path.isdir(entries_path):
+            return 0
+
+        removed = 0
+        used = set()
+        for name in os.listdir(entries_path):
+            path = os.path.join(entries_path, name)
+            try:
+                with open(path, "r", encoding = "utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not os.path.exists(entry["path"]):
+                os.remove(path)
+                removed += 1
+                continue
+            used.add(f"{entry['sha256']}.{entry['reader']}.txt")
+
+        for name in os.listdir(texts_path) if os.path.isdir(texts_path) else []:
+            if name.endswith(".txt") and name not in used:
+                os.remove(os.path.join(texts_path, name))
+                removed += 1
+
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,57 @@
+import numpy as np
+
+# Codificación varint: 7 bits de datos por byte y el bit alto a 1 mientras
+# quedan bytes del mismo valor. Los enteros pequeños (huecos entre posiciones
+# o doc ids consecutivos) ocupan un solo byte.
+VARINT_MAX_BYTES = 10
+
+def delta_encode(values) -> np.ndarray:
+    # Huecos entre valores crecientes: el primero se guarda tal cual
+    values = np.asarray(values, dtype = np.int64)
+    return np.diff(values, prepend = 0) if len(values) else values
+
+def delta_decode(gaps) -> np.ndarray:
+    return np.cumsum(np.asarray(gaps, dtype = np.int64))
+
+def varint_sizes(values) -> np.ndarray:
+    # Bytes que ocupa cada valor (no negativo) en varint
+    values = np.asarray(values, dtype = np.uint64)
+    sizes = np.ones(len(values), dtype = np.int64)
+    for shift in range(7, 7 * VARINT_MAX_BYTES, 7):
+        sizes += values >= (np.uint64(1) << np.uint64(shift))
+    return sizes
+
+def encode_varint(values) -> np.ndarray:
+    """
+    Codifica una secuencia de enteros no negativos en varint, vectorizado con
+    NumPy: una pasada por cada byte de la longitud máxima, no por cada valor.
+    """
+    values = np.asarray(values, dtype = np.uint64)
+    sizes = varint_sizes(values)
+    out = np.empty(int(sizes.sum()), dtype = np.uint8)
+    starts = np.cumsum(sizes) - sizes
+
+    for b in range(int(sizes.max()) if len(sizes) else 0):
+        mask = sizes > b
+        byte = (values[mask] >> np.uint64(7 * b)) & np.uint64(0x7F)
+        more = (sizes[mask] > b + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + b] = byte | more
+
+    return out
+
+def decode_varint(data) -> np.ndarray:
+    # Inversa de encode_varint
+    data = np.asarray(data, dtype = np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    if not len(ends):
+        return np.zeros(0, dtype = np.int64)
+
+    starts = np.empty(len(ends), dtype = np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    owner = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = ((np.arange(len(data)) - starts[owner]) * 7).astype(np.uint64)
+    parts = (data & 0x7F).astype(np.uint64) << shifts
+
+    return np.add.reduceat(parts, starts).astype(np.int64)
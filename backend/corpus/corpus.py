@@ -0,0 +1,390 @@
+import os
+from collections import Counter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from processing.processing import analyze, stem_cache
+from storage.storage import TextStore, document_text
+from snippets.snippets import build_passages, build_passage_arrays
+from positions.positions import text_positions, build_position_arrays
+from indexer.indexer import (
+    build_vocabulary,
+    compute_idf,
+    compute_idf_from_df,
+    compute_sparse_tfidf_from_counts,
+    build_sparse_inverted_index,
+    compute_document_norms,
+    build_document_matrix
+)
+from postings.postings import build_postings, PostingsIndex
+from pruning.pruning import prune_counts
+from suggest.suggest import build_suggester
+from metrics.metrics import REGISTRY, span
+
+# Tipo de los pesos en la matriz CSR ("float32" reduce la memoria a la mitad)
+MATRIX_DTYPE = "float64"
+# Procesos para la ingesta del corpus (1 = secuencial)
+INDEX_WORKERS = os.cpu_count() or 1
+# Los textos se reparten entre procesos en trozos de este tamaño
+CHUNK_CHARS = 256 * 1024
+
+DOCUMENTS_INDEXED = REGISTRY.counter("ri_documents_indexed_total", "Documentos procesados al construir índices")
+TERMS_INDEXED = REGISTRY.counter("ri_terms_indexed_total", "Términos (tras el análisis) procesados al construir índices")
+
+def analyze_text(text: str) -> list:
+    # Procesamiento lingüístico de un texto hasta antes del stemming
+    return analyze(text, stem = False)
+
+def process_text(text: str) -> list:
+    # Procesamiento lingüístico completo de un texto
+    return analyze(text)
+
+def title_terms(name: str) -> list:
+    # Términos del título de un documento (su nombre sin extensión), el campo
+    # "title" de BM25F
+    return process_text(os.path.splitext(name)[0])
+
+def count_surface_terms(text: str) -> Counter:
+    # Frecuencias de las formas sin stemizar
+    return Counter(analyze_text(text))
+
+def count_chunk_terms(text: str) -> tuple:
+    """
+    Frecuencias de las raíces de un trozo y el par forma -> raíz de cada forma
+    distinta (para el léxico y el df de las formas). Se ejecuta en los
+    procesos de la ingesta: cada forma se stemiza una vez, con la caché de
+    raíces de ese proceso.
+    """
+    stem = stem_cache.stem
+    stems = {}
+    counts = Counter()
+    for form, count in count_surface_terms(text).items():
+        stemmed = stems[form] = stem(form)
+        counts[stemmed] += count
+    return counts, stems
+
+def split_text(text: str, chunk_chars: int = CHUNK_CHARS) -> list:
+    # Trozos de unos chunk_chars caracteres cortados tras un salto de línea,
+    # para que ningún token quede partido entre dos trozos
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = start + chunk_chars
+        if end < len(text):
+            newline = text.find("\n", end)
+            end = len(text) if newline == -1 else newline + 1
+        chunks.append(text[start:end])
+        start = end
+
+    return chunks
+
+def analyze_document(text: str) -> tuple:
+    # Pasajes y posiciones de las formas (sin stemizar) de un documento completo
+    return build_passages(text), text_positions(text, stem = False)
+
+def _map_in_order(fn, tasks, workers: int):
+    """
+    Aplica fn al valor de cada (clave, valor) y devuelve (clave, resultado) en
+    el mismo orden de entrada. Con varios procesos se mantienen como mucho
+    2 * workers tareas en vuelo, así que la memoria no depende del tamaño del corpus.
+    """
+    if workers <= 1:
+        for key, value in tasks:
+            yield key, fn(value)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        for key, value in tasks:
+            pending.append((key, executor.submit(fn, value)))
+            if len(pending) >= 2 * workers:
+                done_key, future = pending.popleft()
+                yield done_key, future.result()
+
+        while pending:
+            done_key, future = pending.popleft()
+            yield done_key, future.result()
+
+def _count_chunks(tasks, workers: int):
+    # Recuentos de raíces y pares forma -> raíz de cada (clave, trozo) en el mismo orden de entrada
+    return _map_in_order(count_chunk_terms, tasks, workers)
+
+def ingest_workers(workers: int) -> int:
+    # Más procesos que CPUs solo añaden serialización y cambios de contexto
+    return max(1, min(workers, os.cpu_count() or 1))
+
+def build_corpus_index(documents, dtype: str = MATRIX_DTYPE, workers: int = INDEX_WORKERS, text_store: TextStore = None,
+                       progress = None, statistics: dict = None, pruning: dict = None) -> dict:
+    """
+    Construye todas las estructuras del índice a partir de los documentos
+    (analyze_corpus y build_analyzed_index).
+
+    Acepta los documentos de load_docs (con "text") o los de iter_docs (con
+    "chunks", un iterador de trozos de texto). En el segundo caso el texto se
+    procesa en streaming y se va escribiendo en text_store, de modo que el
+    documento final solo guarda su posición en el almacén.
+    Los documentos sin texto se descartan, como en load_docs.
+    Si se pasa progress, se llama con (fase, documentos procesados).
+    statistics son las estadísticas de la colección completa (corpus_statistics)
+    cuando los documentos son solo una parte de ella y pruning las opciones
+    de poda estática (pruning_options).
+    """
+    analysis = analyze_corpus(documents, workers, text_store, progress)
+    if progress is not None:
+        progress("building", len(analysis["documents"]))
+    return build_analyzed_index(analysis, dtype = dtype, statistics = statistics, pruning = pruning)
+
+def analyze_corpus(documents, workers: int = INDEX_WORKERS, text_store: TextStore = None, progress = None) -> dict:
+    """
+    Procesamiento de los textos de build_corpus_index, sin construir el
+    índice: documentos indexados (con su id, la posición en la lista),
+    recuentos de raíces, pasajes y posiciones de cada uno, léxico forma ->
+    raíz y df de las formas. build_analyzed_index construye con ello el
+    índice de todos o de una parte de los documentos (un shard).
+    """
+    if text_store is None:
+        text_store = TextStore()
+    workers = ingest_workers(workers)
+
+    indexed = []
+
+    def tasks():
+        for doc in documents:
+            # Un documento vacío solo produce recuentos vacíos, así que puede
+            # compartir posición con el siguiente sin alterarlo
+            position = len(indexed)
+            offset = text_store.size
+            has_text = False
+
+            if "text" in doc:
+                chunks = split_text(doc["text"])
+            else:
+                chunks = doc["chunks"]
+
+            for chunk in chunks:
+                if "text" not in doc:
+                    text_store.append(chunk)
+                has_text = has_text or bool(chunk.strip())
+                yield position, chunk
+
+            if not has_text:
+                if "text" not in doc:
+                    text_store.truncate(offset)
+                continue
+
+            if "text" in doc:
+                indexed_doc = dict(doc)
+            else:
+                indexed_doc = {
+                    "name": doc["name"],
+                    "text_store": text_store,
+                    "text_offset": offset,
+                    "text_length": text_store.size - offset
+                }
+            indexed_doc["id"] = doc["id"] if "id" in doc else len(indexed)
+            indexed.append(indexed_doc)
+            if progress is not None:
+                progress("analyzing", len(indexed))
+
+    # Procesamiento lingüístico y stemming (en paralelo si workers > 1): aquí
+    # solo se suman los recuentos de raíces de cada trozo y se juntan los
+    # pares forma -> raíz en el léxico. También se cuenta en cuántos
+    # documentos aparece cada forma (los trozos de un documento llegan
+    # seguidos) para las sugerencias
+    doc_counts = []
+    lexicon = {}
+    form_df = Counter()
+    doc_forms = set()
+    with span("index.analysis"):
+        for position, (stem_counts, stems) in _count_chunks(tasks(), workers):
+            if position >= len(doc_counts):
+                form_df.update(doc_forms)
+                doc_forms = set()
+            doc_forms.update(stems)
+            while len(doc_counts) <= position:
+                doc_counts.append(Counter())
+
+            doc_counts[position].update(stem_counts)
+            lexicon.update(stems)
+
+    form_df.update(doc_forms)
+    # Los recuentos de un documento final sin texto se descartan
+    doc_counts = doc_counts[:len(indexed)]
+
+    # Pasajes para los snippets y posiciones de los términos, leyendo cada
+    # texto del almacén de uno en uno
+    doc_passages = []
+    doc_positions = []
+    texts = ((position, document_text(doc)) for position, doc in enumerate(indexed))
+    with span("index.passages"):
+        for position, (passages, surface_positions) in _map_in_order(analyze_document, texts, workers):
+            doc_passages.append(passages)
+            if progress is not None:
+                progress("passages", position + 1)
+
+            positions = {}
+            for form, form_positions in surface_positions.items():
+                stemmed = lexicon.get(form) or stem_cache.stem(form)
+                positions.setdefault(stemmed, []).extend(form_positions)
+            for term_positions in positions.values():
+                term_positions.sort()
+            doc_positions.append(positions)
+
+    return {
+        "documents": indexed,
+        "doc_counts": doc_counts,
+        "passages": doc_passages,
+        "positions": doc_positions,
+        "lexicon": lexicon,
+        "form_df": form_df
+    }
+
+def build_analyzed_index(analysis: dict, positions: list = None, dtype: str = MATRIX_DTYPE, statistics: dict = None,
+                         pruning: dict = None) -> dict:
+    """
+    Índice de los documentos de analyze_corpus, o solo de los que están en
+    positions (posiciones en analysis["documents"], conservando sus ids).
+    El léxico y el df de las formas para las sugerencias son los de todo el
+    análisis.
+    """
+    if positions is None:
+        positions = range(len(analysis["documents"]))
+    documents = [analysis["documents"][i] for i in positions]
+    doc_counts = [analysis["doc_counts"][i] for i in positions]
+
+    index = build_index_from_counts(
+        documents,
+        doc_counts,
+        dtype,
+        [analysis["passages"][i] for i in positions],
+        [analysis["positions"][i] for i in positions],
+        statistics,
+        pruning
+    )
+    index["lexicon"] = analysis["lexicon"]
+    with span("index.suggest"):
+        index["suggester"] = build_suggester(index["vocabulary"], index["df"], analysis["lexicon"], analysis["form_df"])
+    DOCUMENTS_INDEXED.inc(len(documents))
+    TERMS_INDEXED.inc(sum(sum(counts.values()) for counts in doc_counts))
+
+    return index
+
+def build_index_from_counts(documents: list, doc_counts: list, dtype: str = MATRIX_DTYPE,
+                            doc_passages: list = None, doc_positions: list = None, statistics: dict = None,
+                            pruning: dict = None, doc_lengths: list = None) -> dict:
+    """
+    Construye el índice a partir de las frecuencias de términos ya calculadas
+    de cada documento (sin volver a procesar los textos). Es lo que usa la
+    compactación del índice incremental. doc_passages son los pasajes de cada
+    documento (build_passages) y doc_positions las posiciones de sus términos
+    (text_positions); si faltan, el documento no tendrá snippets precalculados
+    ni entrará en las búsquedas de frases y proximidad.
+    Se guardan también las longitudes de los documentos (lengths, alineadas
+    con las filas de la matriz) y los términos de sus títulos (title_terms en
+    cada documento) para los scorers de indexer.
+    Con statistics (corpus_statistics), el IDF y el df se calculan con el N y
+    el df de toda la colección y no con los de documents: los pesos, normas y
+    cotas del índice de un shard son entonces los mismos que en un índice único.
+    Con pruning (pruning_options) los documentos solo conservan los términos
+    que sobreviven a la poda estática (prune_counts); el IDF, el df y las
+    longitudes siguen siendo los de los documentos completos. doc_lengths
+    da esas longitudes cuando doc_counts ya viene podado (compactación de
+    una base podada); si falta, son las sumas de doc_counts.
+    """
+    if not isinstance(documents, list) or not isinstance(doc_counts, list):
+        return {}
+
+    if doc_lengths is None:
+        doc_lengths = [sum(counts.values()) for counts in doc_counts]
+    length_of = {doc["id"]: length for doc, length in zip(documents, doc_lengths)}
+
+    # Vocabulario e IDF globales (basta con los términos distintos de cada documento)
+    term_lists = [list(counts) for counts in doc_counts]
+
+    if pruning:
+        if statistics is None:
+            df = Counter()
+            for terms in term_lists:
+                df.update(terms)
+            statistics = {"num_docs": len(doc_counts), "df": dict(df)}
+        with span("index.pruning"):
+            idf = compute_idf_from_df(statistics["df"], statistics["num_docs"])
+            doc_counts = prune_counts(doc_counts, idf, **pruning)
+        term_lists = [list(counts) for counts in doc_counts]
+    with span("index.vocabulary"):
+        vocabulary = build_vocabulary(term_lists)
+    with span("index.idf"):
+        if statistics is None:
+            idf = compute_idf(term_lists, vocabulary)
+        else:
+            idf = compute_idf_from_df(statistics["df"], statistics["num_docs"], vocabulary)
+
+    # Vectorizar documentos (solo pesos no nulos)
+    with span("index.vectorization"):
+        sparse_documents = [
+            {"id": doc["id"], "tfidf": compute_sparse_tfidf_from_counts(counts, idf, length), "counts": counts}
+            for doc, counts, length in zip(documents, doc_counts, doc_lengths)
+        ]
+    with span("index.matrix"):
+        matrix = build_document_matrix(sparse_documents, vocabulary, dtype)
+
+    # Índice invertido, normas y listas comprimidas con cotas para el top-k con WAND
+    with span("index.postings"):
+        inverted = build_sparse_inverted_index(sparse_documents)
+        norms = compute_document_norms(sparse_documents)
+        lengths = np.array([length_of[doc_id] for doc_id in matrix["doc_ids"]], dtype = np.int64)
+        wand_index = PostingsIndex(
+            vocabulary,
+            idf,
+            build_postings(matrix, vocabulary, idf, norms, lengths),
+            matrix["doc_ids"],
+            lengths,
+            [norms.get(doc_id, 0.0) for doc_id in matrix["doc_ids"]]
+        )
+
+    for doc in documents:
+        if "title_terms" not in doc:
+            doc["title_terms"] = title_terms(doc["name"])
+
+    with span("index.passage_arrays"):
+        passages = build_passage_arrays(doc_passages or [None] * len(documents), matrix, vocabulary)
+        positions = build_position_arrays(doc_positions or [None] * len(documents), matrix, vocabulary)
+
+    return {
+        "documents": documents,
+        "vocabulary": vocabulary,
+        "idf": idf,
+        "df": [
+            statistics["df"][term] if statistics is not None else len(inverted.get(term, {}))
+            for term in vocabulary
+        ],
+        "matrix": matrix,
+        "norms": norms,
+        "lengths": lengths,
+        "wand_index": wand_index,
+        "passages": passages,
+        "positions": positions,
+        "pruning": pruning or None
+    }
+
+def corpus_statistics(analysis: dict) -> dict:
+    """
+    Estadísticas de la colección completa a partir de su análisis
+    (analyze_corpus): nº de documentos, df de cada término, suma de las
+    longitudes de los documentos y de sus títulos, y el id de cada documento
+    (por nombre). Es lo que comparten los shards (shards.py) para puntuar
+    exactamente igual que un índice único de todos los documentos.
+    """
+    df = Counter()
+    for counts in analysis["doc_counts"]:
+        df.update(counts.keys())
+
+    documents = analysis["documents"]
+    return {
+        "num_docs": len(documents),
+        "df": dict(df),
+        "total_length": sum(sum(counts.values()) for counts in analysis["doc_counts"]),
+        "total_title_length": sum(len(title_terms(doc["name"])) for doc in documents),
+        "ids": {doc["name"]: doc["id"] for doc in documents}
+    }
@@ -1,7 +1,19 @@
 import os
-import PyPDF2
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlsplit, unquote
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from bs4 import BeautifulSoup
-import requests
+import httpx
+from metrics.metrics import REGISTRY, span
+from readers.readers import reader_for, document_extensions, PDF_WORKERS
+from cache.cache import ExtractionCache
+from storage.storage import extraction_cache_path
 
 GUTENBERG_BOOKS = {
     "quijote.txt": "https://www.gutenberg.org/cache/epub/2000/pg2000.txt",
@@ -16,178 +28,538 @@ WIKIPEDIA_PAGES = {
     "aprendizaje_automatico.txt": "https://es.wikipedia.org/wiki/Aprendizaje_autom%C3%A1tico"
 }
 
-
-def download_gutenberg_docs():
-    base_dir = os.path.dirname(__file__)
-    docs_path = os.path.abspath(os.path.join(base_dir, "..", "..", "docs"))
-
-    os.makedirs(docs_path, exist_ok = True)
-
-    for filename, url in GUTENBERG_BOOKS.items():
-        file_path = os.path.join(docs_path, filename)
-
-        if os.path.exists(file_path):
-            print(f"El archivo {filename} ya existe.")
-            continue
-
-        print(f"Descargando {filename}...")
+WIKIPEDIA_API_URL = "https://es.wikipedia.org/w/api.php"
+# Las cabeceras HTTP van en ASCII
+USER_AGENT = "RI-Practica/1.0"
+
+# Descargas simultáneas (y conexiones abiertas en el pool)
+FETCH_CONCURRENCY = 8
+FETCH_TIMEOUT = 30
+# Segundos mínimos entre dos peticiones al mismo host
+HOST_INTERVAL = 0.5
+# Reintentos ante errores de red, 429 y 5xx, con espera FETCH_BACKOFF * 2^intento
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 1.0
+# Espera máxima entre reintentos aunque Retry-After pida más
+MAX_RETRY_DELAY = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# ETag y Last-Modified de cada fichero descargado (en la carpeta docs/)
+FETCH_STATE_FILE = ".fetch_state.json"
+# Tipos de documento que se indexan (los de los lectores registrados en
+# readers.py; document_files consulta el registro en cada llamada)
+DOCUMENT_EXTENSIONS = document_extensions()
+
+CRAWL_DOCUMENTS = REGISTRY.counter("ri_crawl_documents_total", "Documentos por resultado de la descarga", ("status",))
+CRAWL_BYTES = REGISTRY.counter("ri_crawl_bytes_total", "Bytes descargados")
+EXTRACTED_DOCUMENTS = REGISTRY.counter("ri_extracted_documents_total", "Documentos leídos por lector y uso de la caché de extracción",
+                                       ("reader", "cache"))
+
+# Cachés de extracción por carpeta (extraction_cache)
+_EXTRACTION_CACHES = {}
+
+
+# Fuentes de descarga: fichero de destino, URL, parámetros y cómo sacar el
+# texto de la respuesta (None si no tiene contenido)
+
+def response_text(response) -> str:
+    return response.text
+
+def wikipedia_extract(response) -> str:
+    pages = response.json().get("query", {}).get("pages", {})
+    page = next(iter(pages.values()), {})
+    return page.get("extract", "")
+
+def wikipedia_html_text(response) -> str:
+    soup = BeautifulSoup(response.text, "html.parser")
+
+    content = soup.find("div", class_="mw-parser-output")
+    if content is None:
+        return None
+
+    paragraphs = content.find_all("p")
+    return "\n".join(p.get_text() for p in paragraphs)
+
+def wikipedia_title(url: str) -> str:
+    # Título del artículo a partir de su URL (.../wiki/Título)
+    return unquote(urlsplit(url).path.rsplit("/", 1)[-1])
+
+def gutenberg_sources() -> list:
+    return [
+        {"filename": filename, "url": url, "params": None, "parse": response_text}
+        for filename, url in GUTENBERG_BOOKS.items()
+    ]
+
+def wikipedia_sources() -> list:
+    return [
+        {
+            "filename": filename,
+            "url": WIKIPEDIA_API_URL,
+            "params": {
+                "action": "query",
+                "format": "json",
+                "titles": wikipedia_title(url),
+                "prop": "extracts",
+                "explaintext": True,
+                "exsectionformat": "plain"
+            },
+            "parse": wikipedia_extract
+        }
+        for filename, url in WIKIPEDIA_PAGES.items()
+    ]
+
+def wikipedia_html_sources() -> list:
+    return [
+        {"filename": filename, "url": url, "params": None, "parse": wikipedia_html_text}
+        for filename, url in WIKIPEDIA_PAGES.items()
+    ]
+
+class HostRateLimiter:
+    """
+    Espaciado mínimo entre peticiones a un mismo host: cada petición reserva
+    el siguiente hueco libre del host y espera hasta él.
+    """
+
+    def __init__(self, interval: float = HOST_INTERVAL):
+        self.interval = interval
+        self._next = {}
+
+    async def wait(self, url: str):
+        host = urlsplit(url).netloc
+        now = time.monotonic()
+        slot = max(now, self._next.get(host, now))
+        self._next[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+def load_fetch_state(docs_path: str) -> dict:
+    path = os.path.join(docs_path, FETCH_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding = "utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_fetch_state(docs_path: str, state: dict):
+    path = os.path.join(docs_path, FETCH_STATE_FILE)
+    with open(path + ".tmp", "w", encoding = "utf-8") as f:
+        json.dump(state, f, ensure_ascii = False, indent = 2)
+    os.replace(path + ".tmp", path)
+
+def _retry_delay(response, attempt: int, backoff: float) -> float:
+    # Retry-After (segundos o fecha) si el servidor lo indica; si no,
+    # exponencial. Nunca más de MAX_RETRY_DELAY
+    delay = backoff * 2 ** attempt
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
         try:
-            response = requests.get(url, timeout = 30)
-            if response.status_code == 200:
-                with open(file_path, "w", encoding = "utf-8", errors = "ignore") as f:
-                    f.write(response.text)
-                print(f"{filename} descargado correctamente.")
-            else:
-                print(f"Error al descargar {filename}: código {response.status_code}")
-            
+            delay = max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                delay = max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return min(delay, MAX_RETRY_DELAY)
+
+class CrawlJob:
+    """
+    Descarga de un conjunto de fuentes con asyncio, pensada para ejecutarse en
+    segundo plano (start) mientras se consulta su progreso (progress):
+
+    - como mucho concurrency peticiones a la vez, sobre un pool de conexiones
+      keep-alive de httpx,
+    - un mínimo de host_interval segundos entre peticiones al mismo host,
+    - reintentos con espera exponencial ante errores de red, 429 y 5xx,
+    - peticiones condicionales con el ETag y Last-Modified de la descarga
+      anterior (o la fecha del fichero): si el servidor responde 304 el
+      fichero se deja como está.
+
+    Los ficheros se escriben en docs_path (por defecto docs/) a un temporal
+    que se renombra al final. transport permite sustituir la red (p. ej. con
+    httpx.MockTransport).
+    """
+
+    def __init__(self, sources: list, docs_path: str = None, concurrency: int = FETCH_CONCURRENCY,
+                 host_interval: float = HOST_INTERVAL, retries: int = FETCH_RETRIES,
+                 backoff: float = FETCH_BACKOFF, timeout: float = FETCH_TIMEOUT, transport = None):
+        self.sources = sources
+        self.docs_path = docs_path or get_docs_path()
+        self.concurrency = concurrency
+        self.host_interval = host_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.transport = transport
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = "pending"
+        self.results = {source["filename"]: {"status": "pending"} for source in sources}
+        self.started = None
+        self.finished = None
+
+    def progress(self) -> dict:
+        with self._lock:
+            counts = {}
+            for result in self.results.values():
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+            elapsed = None
+            if self.started is not None:
+                elapsed = (self.finished or time.time()) - self.started
+            return {
+                "state": self.state,
+                "total": len(self.sources),
+                "completed": len(self.sources) - counts.get("pending", 0) - counts.get("running", 0),
+                "downloaded": counts.get("downloaded", 0),
+                "not_modified": counts.get("not_modified", 0),
+                "failed": counts.get("failed", 0),
+                "elapsed_seconds": elapsed,
+                "files": {filename: dict(result) for filename, result in self.results.items()}
+            }
+
+    def _set_result(self, filename: str, **result):
+        with self._lock:
+            self.results[filename] = result
+        if result["status"] != "running":
+            CRAWL_DOCUMENTS.inc(status = result["status"])
+            CRAWL_BYTES.inc(result.get("bytes", 0))
+
+    def start(self):
+        # Hilo propio con su bucle de eventos: no bloquea a quien lo lanza
+        self._thread = threading.Thread(target = self.run_sync, daemon = True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_sync(self) -> dict:
+        asyncio.run(self.run())
+        return self.progress()
+
+    async def run(self):
+        with self._lock:
+            self.state = "running"
+            self.started = time.time()
+
+        fetch_state = {}
+        try:
+            os.makedirs(self.docs_path, exist_ok = True)
+            fetch_state = load_fetch_state(self.docs_path)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            limiter = HostRateLimiter(self.host_interval)
+            limits = httpx.Limits(max_connections = self.concurrency, max_keepalive_connections = self.concurrency)
+
+            async with httpx.AsyncClient(
+                headers = {"User-Agent": USER_AGENT},
+                timeout = self.timeout,
+                limits = limits,
+                follow_redirects = True,
+                transport = self.transport
+            ) as client:
+                outcomes = await asyncio.gather(*(
+                    self._fetch(client, source, semaphore, limiter, fetch_state)
+                    for source in self.sources
+                ), return_exceptions = True)
+            # Un error inesperado en una fuente solo hace fallar esa fuente
+            for source, outcome in zip(self.sources, outcomes):
+                if isinstance(outcome, Exception):
+                    print(f"Error al descargar {source['filename']}: {outcome}")
+                    self._set_result(source["filename"], status = "failed", error = f"{type(outcome).__name__}: {outcome}")
+            state = "done"
         except Exception as e:
-            print(f"Error al descargar{filename}: {e}")
-
-def download_wikipedia_docs():
-    base_dir = os.path.dirname(__file__)
-    docs_path = os.path.abspath(os.path.join(base_dir, "..", "..", "docs"))
-    os.makedirs(docs_path, exist_ok = True)
-
-    API_URL = "https://es.wikipedia.org/w/api.php"
-
-    for filename, page_title in WIKIPEDIA_PAGES.items():
-        file_path = os.path.join(docs_path, filename)
-
-        if os.path.exists(file_path):
-            print(f"El archivo {filename} ya existe.")
-            continue
-
-        print(f"Descargando artículo de wikipedia: {page_title}...")
-
-        params = {
-            "action": "query",
-            "format": "json",
-            "titles": page_title,
-            "prop": "extracts",
-            "explaintext": True,
-            "exsectionformat": "plain"
-        }
-
+            print(f"Error en la descarga: {e}")
+            self._fail_unfinished(f"{type(e).__name__}: {e}")
+            state = "failed"
+        finally:
+            # Los ETag y Last-Modified de lo ya descargado se guardan aunque algo falle
+            try:
+                save_fetch_state(self.docs_path, fetch_state)
+            except OSError as e:
+                print(f"No se ha podido guardar el estado de la descarga: {e}")
+
+        with self._lock:
+            self.state = state
+            self.finished = time.time()
+
+    def _fail_unfinished(self, error: str):
+        # Las fuentes que no llegaron a terminar no se quedan en "running"
+        with self._lock:
+            unfinished = [filename for filename, result in self.results.items()
+                          if result["status"] in ("pending", "running")]
+        for filename in unfinished:
+            self._set_result(filename, status = "failed", error = error)
+
+    def _conditional_headers(self, filename: str, fetch_state: dict) -> dict:
+        file_path = os.path.join(self.docs_path, filename)
+        if not os.path.exists(file_path):
+            return {}
+
+        validators = fetch_state.get(filename, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        # Sin Last-Modified guardado, la fecha del fichero ya descargado
+        headers["If-Modified-Since"] = validators.get("last_modified") or formatdate(
+            os.path.getmtime(file_path), usegmt = True
+        )
+        return headers
+
+    async def _fetch(self, client, source: dict, semaphore, limiter, fetch_state: dict):
+        filename = source["filename"]
+        url = source["url"]
+        headers = self._conditional_headers(filename, fetch_state)
+        self._set_result(filename, status = "running", attempts = 0)
+
+        error = None
+        for attempt in range(self.retries + 1):
+            response = None
+            # El hueco del host se espera sin ocupar una de las concurrency plazas
+            await limiter.wait(url)
+            async with semaphore:
+                try:
+                    with span("crawl.fetch"):
+                        response = await client.get(url, params = source.get("params"), headers = headers)
+                except httpx.HTTPError as e:
+                    error = f"{type(e).__name__}: {e}"
+
+            if response is not None:
+                if response.status_code == 304:
+                    print(f"{filename} sin cambios.")
+                    self._set_result(filename, status = "not_modified", attempts = attempt + 1)
+                    return
+
+                if response.is_success:
+                    await self._store(source, response, fetch_state, attempt + 1)
+                    return
+
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+
+            if attempt < self.retries:
+                await asyncio.sleep(_retry_delay(response, attempt, self.backoff))
+
+        print(f"Error al descargar {filename}: {error}")
+        self._set_result(filename, status = "failed", attempts = attempt + 1, error = error)
+
+    async def _store(self, source: dict, response, fetch_state: dict, attempts: int):
+        filename = source["filename"]
+
+        # El análisis del HTML se hace fuera del bucle de eventos
         try:
-            response = requests.get(API_URL, params = params, timeout = 30)
-            data = response.json()
-
-            pages = data.get("query", {}).get("pages", {})
-            page = next(iter(pages.values()))
-            text = page.get("extract", "")
-
-            if text.strip():
-                with open(file_path, "w", encoding = "utf-8", errors = "ignore") as f:
-                    f.write(text)
-                print(f"{filename} descargado correctamente.")
-            else:
-                print(f"No se ha encontrado contenido para {page_title}.")
-        
+            text = await asyncio.to_thread(source["parse"], response)
         except Exception as e:
-            print(f"Error al descargar {filename}: {e}")
+            self._set_result(filename, status = "failed", attempts = attempts, error = f"{type(e).__name__}: {e}")
+            return
 
-def download_wikipedia_docs_html():
-    base_dir = os.path.dirname(__file__)
-    docs_path = os.path.abspath(os.path.join(base_dir, "..", "..", "docs"))
-    os.makedirs(docs_path, exist_ok = True)
+        if not text or not text.strip():
+            print(f"No se ha encontrado contenido para {filename}.")
+            self._set_result(filename, status = "failed", attempts = attempts, error = "Sin contenido")
+            return
 
-    headers = {
-        "User-agent": "RI-Práctica/1.0"
-    }
+        file_path = os.path.join(self.docs_path, filename)
+        try:
+            with open(file_path + ".tmp", "w", encoding = "utf-8", errors = "ignore") as f:
+                f.write(text)
+            os.replace(file_path + ".tmp", file_path)
+        except OSError as e:
+            # Disco lleno, permisos...: falla este fichero, no la descarga entera
+            print(f"Error al guardar {filename}: {e}")
+            if os.path.isfile(file_path + ".tmp"):
+                os.remove(file_path + ".tmp")
+            self._set_result(filename, status = "failed", attempts = attempts, error = f"{type(e).__name__}: {e}")
+            return
+
+        fetch_state[filename] = {
+            "url": str(response.url),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+        print(f"{filename} descargado correctamente.")
+        self._set_result(filename, status = "downloaded", attempts = attempts, bytes = len(response.content))
 
-    for filename, url in WIKIPEDIA_PAGES.items():
-        file_path = os.path.join(docs_path, filename)
+def download_gutenberg_docs() -> dict:
+    return CrawlJob(gutenberg_sources()).run_sync()
 
-        if os.path.exists(file_path):
-            print(f"El archivo {filename} ya fue descargado.")
-            continue
+def download_wikipedia_docs() -> dict:
+    return CrawlJob(wikipedia_sources()).run_sync()
 
-        print(f"Descargado wikipedia (html): {url}")
+def download_wikipedia_docs_html() -> dict:
+    return CrawlJob(wikipedia_html_sources()).run_sync()
 
+def get_docs_path() -> str:
+    # RI_DOCS_PATH permite usar otra carpeta (p. ej. el corpus sintético de benchmarks/suite.py)
+    if os.environ.get("RI_DOCS_PATH"):
+        return os.path.abspath(os.environ["RI_DOCS_PATH"])
+    base_dir = os.path.dirname(__file__)
+    return os.path.abspath(os.path.join(base_dir, "..", "..", "docs"))
+
+def extraction_cache() -> ExtractionCache:
+    # Caché de textos extraídos de la carpeta configurada (None si está desactivada)
+    path = extraction_cache_path()
+    if path is None:
+        return None
+    cache = _EXTRACTION_CACHES.get(path)
+    if cache is None:
+        cache = _EXTRACTION_CACHES.setdefault(path, ExtractionCache(path))
+    return cache
+
+def iter_cached_text(text_path: str, chunk_chars: int = 256 * 1024):
+    # Como iter_txt, sin traducir los saltos de línea: el texto sale tal cual se extrajo
+    with open(text_path, "r", encoding = "utf-8", newline = "") as f:
+        while True:
+            chunk = f.read(chunk_chars)
+            if not chunk:
+                break
+            yield chunk + f.readline()
+
+def extract_document(filepath, reader: dict, workers: int = PDF_WORKERS) -> tuple:
+    """
+    Extrae el texto de un fichero con su lector pasando por la caché de
+    extracción: (ruta del texto en la caché, None) si ya estaba o
+    (None, texto) si se ha tenido que extraer (y se ha guardado para la
+    próxima vez, si se puede).
+    """
+    cache = extraction_cache() if reader["cacheable"] else None
+    stat = None
+    if cache is not None:
+        text_path = cache.lookup(filepath, reader["cache_key"])
+        if text_path is not None:
+            EXTRACTED_DOCUMENTS.inc(reader = reader["name"], cache = "hit")
+            return text_path, None
         try:
-            response = requests.get(url, headers = headers, timeout = 30)
+            stat = os.stat(filepath)
+        except OSError:
+            pass
+
+    with span("extract." + reader["name"]):
+        text = reader["read"](filepath, workers) if reader["parallel"] else reader["read"](filepath)
+    EXTRACTED_DOCUMENTS.inc(reader = reader["name"], cache = "miss" if cache is not None else "off")
+
+    if stat is not None and text:
+        cache.store(filepath, reader["cache_key"], text, stat)
+    return None, text
+
+def read_document(filepath, workers: int = PDF_WORKERS) -> str:
+    # Texto de un fichero según su extensión (None si no es un tipo soportado)
+    reader = reader_for(filepath)
+    if reader is None:
+        return None
+
+    text_path, text = extract_document(filepath, reader, workers)
+    if text_path is not None:
+        with open(text_path, "r", encoding = "utf-8", newline = "") as f:
+            return f.read()
+    return text
 
-            if response.status_code != 200:
-                print(f"Error HTTP {response.status_code} para {url}")
-                continue
+def iter_document(filepath, workers: int = PDF_WORKERS):
+    # Trozos de texto de un fichero según su extensión (None si no es un tipo soportado)
+    reader = reader_for(filepath)
+    if reader is None:
+        return None
+
+    if not reader["cacheable"] or extraction_cache() is None:
+        if reader["iter_chunks"] is not None:
+            return reader["iter_chunks"](filepath)
+        return iter([reader["read"](filepath)])
+
+    text_path, text = extract_document(filepath, reader, workers)
+    if text_path is not None:
+        return iter_cached_text(text_path)
+    return iter([text])
+
+def document_files() -> list:
+    # Ficheros de docs/ de un tipo soportado, por nombre: los doc ids (y el
+    # shard de cada documento) no dependen del orden del sistema de ficheros
+    docs_path = get_docs_path()
+    if not os.path.exists(docs_path):
+        return []
+    extensions = document_extensions()
+    return [filename for filename in sorted(os.listdir(docs_path)) if filename.lower().endswith(extensions)]
+
+def extract_text(filepath: str) -> tuple:
+    # Extracción en un proceso de iter_docs (sin repartir también las páginas de un PDF)
+    return extract_document(filepath, reader_for(filepath), workers = 1)
+
+def iter_docs(workers: int = 1):
+    """
+    Igual que load_docs pero sin cargar los textos: genera un documento por
+    fichero con "chunks", un iterador perezoso sobre trozos de su texto.
+    Con workers > 1 los documentos que hay que extraer (PDF, HTML: los de
+    lectores con caché) se leen y se analizan en un pool de procesos, con
+    como mucho 2 * workers en vuelo, y se generan en el mismo orden; los de
+    texto plano se siguen leyendo por trozos aquí.
+    """
+    docs_path = get_docs_path()
 
-            soup = BeautifulSoup(response.text, "html.parser")
+    if not os.path.exists(docs_path):
+        print(f"Carpeta no encontrada: {docs_path}")
+        return
 
-            content = soup.find("div", class_="mw-parser-output")
-            if content is None:
-                print(f"No se ha encontrado el contenido principal en {url}")
+    if workers <= 1:
+        for filename in document_files():
+            chunks = iter_document(os.path.join(docs_path, filename))
+            if chunks is None:
                 continue
 
-            paragraphs = content.find_all("p")
-            text = "\n".join(p.get_text() for p in paragraphs)
+            yield {
+                "name": filename,
+                "chunks": chunks
+            }
+        return
 
-            if not text.strip():
-                print(f"Texto vacío en {url}")
+    def ready(filename, future):
+        if future is None:
+            chunks = iter_document(os.path.join(docs_path, filename))
+        else:
+            text_path, text = future.result()
+            chunks = iter_cached_text(text_path) if text_path is not None else iter([text])
+        return {"name": filename, "chunks": chunks}
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        for filename in document_files():
+            filepath = os.path.join(docs_path, filename)
+            reader = reader_for(filepath)
+            if reader is None:
                 continue
 
-            with open(file_path, "w", encoding = "utf-8", errors = "ignore") as f:
-                f.write(text)
-            
-            print(f"{filename} descargado correctamente.")
-        
-        except Exception as e:
-            print(f"Error al descargar {url}: {e}")
-
-def read_txt(filepath):
-    with open(filepath, "r", encoding = "utf-8", errors = "ignore") as f:
-        return f.read()
+            pending.append((filename, executor.submit(extract_text, filepath) if reader["cacheable"] else None))
+            # Los de texto plano al principio de la cola salen sin esperar
+            while pending and (len(pending) >= 2 * workers or pending[0][1] is None):
+                yield ready(*pending.popleft())
 
-def read_pdf(filepath):
-    text = ""
-    try:
-        with open(filepath, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n"
-    except Exception as e:
-        print(f"Error leyendo PDF {filepath}: {e}")
-    
-    return text
+        while pending:
+            yield ready(*pending.popleft())
 
-def read_html(filepath):
-    try:
-        with open(filepath, "r", encoding = "utf-8", errors = "ignore") as f:
-            html = f.read()
-        
-        soup = BeautifulSoup(html, "html.parser")
-        return soup.get_text(separator = " ")
-    except Exception as e:
-        print(f"Error leyendo HTML {filepath}: {e}")
-        return ""
-
-def load_docs() -> list:
-    base_dir = os.path.dirname(__file__)
-    docs_path = os.path.abspath(os.path.join(base_dir, "..", "..", "docs"))
+def load_docs(workers: int = 1) -> list:
+    docs_path = get_docs_path()
 
     documents = []
 
     if not os.path.exists(docs_path):
         print(f"Carpeta no encontrada: {docs_path}")
         return documents
+
+    # Por nombre, como document_files
+    filenames = sorted(os.listdir(docs_path))
+    filepaths = [os.path.join(docs_path, filename) for filename in filenames]
+
+    # La lectura (sobre todo de PDF y HTML) se reparte entre procesos; cada
+    # proceso lee entero su PDF (sin repartir también sus páginas)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            texts = list(executor.map(partial(read_document, workers = 1), filepaths))
+    else:
+        texts = [read_document(filepath) for filepath in filepaths]
     
     doc_id = 0
 
-    for filename in os.listdir(docs_path):
-        filepath = os.path.join(docs_path, filename)
-        text = ""
-
-        if filename.lower().endswith(".txt"):
-            text = read_txt(filepath)
-        
-        elif filename.lower().endswith(".pdf"):
-            text = read_pdf(filepath)
-        
-        elif filename.lower().endswith(".html") or filename.lower().endswith(".htm"):
-            text = read_html(filepath)
-        
-        else:
+    for filename, text in zip(filenames, texts):
+        if text is None:
             continue
 
         if text.strip():
@@ -199,5 +571,3 @@ def load_docs() -> list:
             doc_id += 1
     
     return documents
-
-
@@ -1,5 +1,9 @@
 import math
+import heapq
+from bisect import bisect_left
 from collections import Counter
+from collections.abc import Mapping
+import numpy as np
 
 def build_vocabulary(list_of_tokens_lists: list) -> list:
     if not isinstance(list_of_tokens_lists, list):
@@ -51,11 +55,21 @@ def compute_idf(list_of_tokens_lists: list, vocabulary: list) -> dict:
             if token in df:
                 df[token] += 1
 
-    # Calcular IDF
+    return compute_idf_from_df(df, N, vocabulary)
+
+def compute_idf_from_df(df: dict, num_docs: int, vocabulary: list = None) -> dict:
+    """
+    IDF de cada término del vocabulario (por defecto, los de df) a partir de
+    su df y del nº de documentos, con la misma fórmula que compute_idf. Los
+    shards lo usan con el df y el N de toda la colección.
+    """
+    if vocabulary is None:
+        vocabulary = list(df)
+
     idf = {}
     for term in vocabulary:
         term_df = df.get(term, 0)
-        idf_val = math.log(N / (1 + term_df)) + 1
+        idf_val = math.log(num_docs / (1 + term_df)) + 1
         idf[term] = idf_val
 
     return idf
@@ -84,6 +98,37 @@ def compute_tfidf(tokens: list, vocabulary: list, idf: dict) -> dict:
 
     return tfidf
 
+def compute_sparse_tfidf(tokens: list, idf: dict) -> dict:
+    """
+    Igual que compute_tfidf pero solo con los términos presentes en el documento
+    (sin las entradas a cero del vocabulario).
+    """
+    if not isinstance(tokens, list) or not isinstance(idf, dict):
+        return {}
+
+    return compute_sparse_tfidf_from_counts(Counter(tokens), idf)
+
+def compute_sparse_tfidf_from_counts(counts: dict, idf: dict, total_tokens: int = None) -> dict:
+    # TF-IDF disperso a partir de las frecuencias absolutas de cada término;
+    # total_tokens es la longitud del documento si counts no lo tiene entero
+    if not isinstance(counts, dict) or not isinstance(idf, dict):
+        return {}
+
+    if total_tokens is None:
+        total_tokens = sum(counts.values())
+    if total_tokens == 0:
+        return {}
+
+    tfidf = {}
+
+    for term, count in counts.items():
+        idf_val = idf.get(term, 0)
+        if idf_val == 0:
+            continue
+        tfidf[term] = (count / total_tokens) * idf_val
+
+    return tfidf
+
 def select_relevant_terms(tfidf: dict, k: int = 5) -> list:
     if not isinstance(tfidf, dict):
         return []
@@ -117,6 +162,103 @@ def build_inverted_index(documents: list) -> dict:
     
     return inverted
 
+def build_sparse_inverted_index(documents: list) -> dict:
+    """
+    Índice invertido {término: {doc_id: peso}} de los documentos del corpus
+    (ids enteros o cadenas), que es el que usan las búsquedas: a diferencia
+    de build_inverted_index (la del endpoint /inverted_index, que conserva su
+    salida), un documento solo aparece en la lista de un término si lo
+    contiene, es decir, si su peso no es nulo.
+    """
+    if not isinstance(documents, list):
+        return {}
+
+    inverted = {}
+
+    for doc in documents:
+        if not isinstance(doc, dict):
+            continue
+
+        doc_id = doc.get("id")
+        tfidf_dict = doc.get("tfidf")
+
+        if not isinstance(doc_id, (str, int)) or not isinstance(tfidf_dict, dict):
+            continue
+
+        for term, weight in tfidf_dict.items():
+            if weight == 0:
+                continue
+            if term not in inverted:
+                inverted[term] = {}
+            inverted[term][doc_id] = weight
+
+    return inverted
+
+def compute_document_norms(documents: list) -> dict:
+    """
+    Norma euclídea del vector TF-IDF de cada documento, calculada una sola vez
+    al indexar. Los términos se recorren en orden de vocabulario para obtener
+    exactamente el mismo valor que cosine_similarity sobre el vector denso.
+    """
+    if not isinstance(documents, list):
+        return {}
+
+    norms = {}
+
+    for doc in documents:
+        if not isinstance(doc, dict):
+            continue
+
+        doc_id = doc.get("id")
+        tfidf_dict = doc.get("tfidf")
+
+        if not isinstance(doc_id, (str, int)) or not isinstance(tfidf_dict, dict):
+            continue
+
+        norms[doc_id] = math.sqrt(sum(w * w for _, w in sorted(tfidf_dict.items())))
+
+    return norms
+
+def search_inverted_index(query_tfidf: dict, inverted: dict, norms: dict) -> dict:
+    """
+    Similitud coseno recorriendo solo las listas de los términos de la query
+    (term-at-a-time). Devuelve el mismo ranking que search_query sobre los
+    vectores densos, pero sin los documentos con similitud 0.
+    """
+    if not isinstance(query_tfidf, dict) or not isinstance(inverted, dict) or not isinstance(norms, dict):
+        return {}
+
+    # Solo cuentan los términos de la query que existen en el índice
+    query_terms = sorted(
+        (term, weight)
+        for term, weight in query_tfidf.items()
+        if weight != 0 and term in inverted
+    )
+
+    query_norm = math.sqrt(sum(w * w for _, w in query_terms))
+    if query_norm == 0:
+        return {}
+
+    # Acumuladores de producto escalar por documento
+    scores = {}
+    for term, q_weight in query_terms:
+        for doc_id, d_weight in inverted[term].items():
+            scores[doc_id] = scores.get(doc_id, 0.0) + q_weight * d_weight
+
+    results = {}
+    for doc_id, dot in scores.items():
+        doc_norm = norms.get(doc_id, 0)
+        if doc_norm == 0:
+            continue
+        sim = dot / (query_norm * doc_norm)
+        if sim > 0:
+            results[doc_id] = sim
+
+    # Empates resueltos por id de documento, como en el recorrido denso
+    sorted_results = dict(sorted(results.items(), key = lambda x: (-x[1], x[0])))
+
+    return sorted_results
+
 def vectorize_document(tfidf: dict, vocabulary: list) -> list:
     if not isinstance(tfidf, dict) or not isinstance(vocabulary, list):
         return []
@@ -129,6 +271,73 @@ def vectorize_document(tfidf: dict, vocabulary: list) -> list:
     
     return vector
 
+def build_document_matrix(documents: list, vocabulary: list, dtype: str = "float64") -> dict:
+    """
+    Matriz documento-término dispersa en formato CSR (arrays indptr/indices/data
+    de NumPy). La fila i corresponde a doc_ids[i] y solo guarda los pesos no nulos.
+    Si los documentos traen "counts" ({término: frecuencia}), se guardan también
+    las frecuencias absolutas en el array "counts", alineado con indices.
+    """
+    if not isinstance(documents, list) or not isinstance(vocabulary, list):
+        return {}
+
+    term_index = {term: i for i, term in enumerate(vocabulary)}
+
+    doc_ids = []
+    indptr = [0]
+    indices = []
+    data = []
+    counts = []
+
+    for doc in documents:
+        if not isinstance(doc, dict):
+            continue
+
+        doc_id = doc.get("id")
+        tfidf_dict = doc.get("tfidf")
+
+        if not isinstance(doc_id, (str, int)) or not isinstance(tfidf_dict, dict):
+            continue
+
+        term_counts = doc.get("counts") or {}
+
+        row = sorted(
+            (term_index[term], weight, term_counts.get(term, 0))
+            for term, weight in tfidf_dict.items()
+            if weight != 0 and term in term_index
+        )
+        for column, weight, count in row:
+            indices.append(column)
+            data.append(weight)
+            counts.append(count)
+
+        doc_ids.append(doc_id)
+        indptr.append(len(indices))
+
+    data = np.array(data, dtype = dtype)
+    indptr = np.array(indptr, dtype = np.int64)
+
+    # Normas por fila calculadas de forma vectorizada
+    row_lengths = np.diff(indptr)
+    rows = np.repeat(np.arange(len(doc_ids)), row_lengths)
+    norms = np.sqrt(np.bincount(rows, weights = data.astype(np.float64) ** 2, minlength = len(doc_ids)))
+
+    return {
+        "doc_ids": doc_ids,
+        "indptr": indptr,
+        "indices": np.array(indices, dtype = np.int32),
+        "data": data,
+        "counts": np.array(counts, dtype = np.int32),
+        "norms": norms,
+        "shape": (len(doc_ids), len(vocabulary))
+    }
+
+def document_matrix_nbytes(matrix: dict) -> int:
+    if not isinstance(matrix, dict) or not matrix:
+        return 0
+
+    return int(sum(matrix[key].nbytes for key in ("indptr", "indices", "data", "counts", "norms")))
+
 def cosine_similarity(vec1: list, vec2: list) -> float:
     if not isinstance(vec1, list) or not isinstance(vec2, list):
         return 0.0
@@ -145,7 +354,7 @@ def cosine_similarity(vec1: list, vec2: list) -> float:
     
     return dot / (norm1 * norm2)
 
-def search_query(query_vector: list, document_vectors: dict) -> dict:
+def search_query(query_vector: list, document_vectors: dict, k: int = None) -> dict:
     if not isinstance(query_vector, list) or not isinstance(document_vectors, dict):
         return {}
     
@@ -155,7 +364,611 @@ def search_query(query_vector: list, document_vectors: dict) -> dict:
         sim = cosine_similarity(query_vector, doc_vector)
         results[doc_id] = sim
 
+    if k is not None:
+        # Solo los k mejores, sin ordenar todo el corpus
+        top = heapq.nlargest(max(k, 0), results.items(), key = lambda x: x[1])
+        return dict(top)
+
     sorted_results = dict(sorted(results.items(), key = lambda x: x[1], reverse = True))
 
     return sorted_results
 
+def build_wand_index(inverted: dict, norms: dict) -> dict:
+    """
+    Listas de cada término ordenadas por documento junto con la cota superior
+    de su contribución al coseno: max(peso / norma del documento).
+    """
+    if not isinstance(inverted, dict) or not isinstance(norms, dict):
+        return {}
+
+    wand_index = {}
+
+    for term, postings in inverted.items():
+        doc_ids = []
+        weights = []
+        max_score = 0.0
+
+        for doc_id, weight in sorted(postings.items()):
+            doc_ids.append(doc_id)
+            weights.append(weight)
+
+            doc_norm = norms.get(doc_id, 0)
+            if doc_norm > 0:
+                max_score = max(max_score, weight / doc_norm)
+
+        wand_index[term] = {
+            "doc_ids": doc_ids,
+            "weights": weights,
+            "max_score": max_score
+        }
+
+    return wand_index
+
+class ListCursor:
+    """
+    Cursor con la misma interfaz que PostingsIterator sobre una entrada de
+    build_wand_index (listas de Python): un único bloque con la cota del término.
+    """
+
+    def __init__(self, entry: dict):
+        self._docs = entry["doc_ids"]
+        self._weights = entry["weights"]
+        self._i = 0
+        self.max_score = entry["max_score"]
+        self.doc = self._docs[0] if self._docs else None
+
+    def next(self):
+        self._i += 1
+        self.doc = self._docs[self._i] if self._i < len(self._docs) else None
+        return self.doc
+
+    def advance(self, target):
+        if self.doc is not None and self.doc < target:
+            self._i = bisect_left(self._docs, target, self._i)
+            self.doc = self._docs[self._i] if self._i < len(self._docs) else None
+        return self.doc
+
+    def weight(self) -> float:
+        return self._weights[self._i]
+
+    def block_bound(self, target) -> float:
+        return self.max_score
+
+    def block_last(self, target):
+        return self._docs[-1]
+
+def postings_cursor(entry):
+    # Cursor de una lista: entradas de build_wand_index o PostingList comprimidas
+    if isinstance(entry, dict):
+        return ListCursor(entry)
+    return entry.iterator()
+
+# Parámetros de BM25 y del campo título de BM25F
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25F_TITLE_WEIGHT = 3.0
+BM25F_TITLE_B = 0.5
+# Celdas (consultas x documentos) de la matriz de scores de cada tanda de batch_search_scored
+BATCH_MAX_CELLS = 1 << 22
+# search_scored solo usa WAND con listas largas (al menos WAND_MIN_POSTINGS
+# entradas en total) cuando las cotas pueden descartar casi todo: las listas
+# cuyas cotas suman menos de WAND_SKIP_BOUND veces la mayor cota de la query
+# (términos frecuentes junto a uno raro) tienen al menos WAND_SKIP_SHARE de
+# las entradas. Si no, mantener los cursores ordenados cuesta más de lo que
+# se salta y es más rápido recorrer las listas enteras
+# (benchmarks/topk_benchmark.py)
+WAND_MIN_POSTINGS = 4000
+WAND_SKIP_BOUND = 0.4
+WAND_SKIP_SHARE = 0.9
+
+class IndexStatistics:
+    """
+    Estadísticas del índice base que usan los scorers, calculadas una vez al
+    cargarlo: N, df e IDF por término, longitud (nº de tokens) y norma TF-IDF
+    de cada documento, longitud media y términos de los títulos.
+    SegmentedIndex ofrece la misma interfaz con los cambios pendientes.
+    """
+
+    def __init__(self, index: dict):
+        documents = index["documents"]
+        self.num_docs = len(documents)
+        self._idf = index["idf"]
+        self._df = dict(zip(index["vocabulary"], np.asarray(index["df"]).tolist()))
+        self._norms = index["norms"]
+        self._lengths = dict(zip(index["matrix"]["doc_ids"], np.asarray(index["lengths"]).tolist()))
+        self._titles = {doc["id"]: Counter(doc.get("title_terms", ())) for doc in documents}
+
+        self._avg_length = sum(self._lengths.values()) / self.num_docs if self.num_docs else 0.0
+        title_total = sum(sum(counts.values()) for counts in self._titles.values())
+        self._avg_title_length = title_total / self.num_docs if self.num_docs else 0.0
+
+    def df(self, term: str) -> int:
+        return self._df.get(term, 0)
+
+    def idf(self, term: str) -> float:
+        return self._idf.get(term, 0)
+
+    def doc_length(self, doc_id) -> int:
+        return self._lengths.get(doc_id, 0)
+
+    def avg_length(self) -> float:
+        return self._avg_length
+
+    def doc_norm(self, doc_id) -> float:
+        return self._norms.get(doc_id, 0)
+
+    def title_counts(self, doc_id) -> Counter:
+        return self._titles.get(doc_id, Counter())
+
+    def avg_title_length(self) -> float:
+        return self._avg_title_length
+
+class TfidfCosineScorer:
+    """
+    Similitud coseno TF-IDF (el ranking de search_inverted_index): la query se
+    pondera con compute_sparse_tfidf y cada entrada aporta q * (tf / longitud) * idf;
+    al final se divide entre las normas de la query y del documento.
+
+    Interfaz común de los scorers (se crea uno por búsqueda):
+    - prepare(tokens): [(término, peso en la query)] en orden de vocabulario,
+    - score(doc_id, término, peso, tf, longitud): aportación de un término,
+    - posting_score(cursor, término, peso): lo mismo leyendo la entrada actual,
+    - term_bound y block_bound: cotas de esas aportaciones para WAND,
+    - finalize(doc_id, suma): score final del documento (0 lo descarta),
+    - para batch_search_scored, la aportación como pair_weight(término, peso)
+      * entry_weights(entradas de PostingsIndex.gather)[entrada] y
+      finalize_rows sobre las sumas de todas las filas (entry_weights None si
+      no se puede por lotes).
+    """
+    name = "tfidf"
+
+    def __init__(self, statistics, norms: dict = None):
+        self.statistics = statistics
+        self.norms = norms
+        self.query_norm = 0.0
+
+    def prepare(self, tokens: list) -> list:
+        total = len(tokens)
+        query_terms = []
+        for term, count in sorted(Counter(tokens).items()):
+            idf_val = self.statistics.idf(term)
+            if idf_val != 0:
+                query_terms.append((term, (count / total) * idf_val))
+        return self.set_query(query_terms)
+
+    def set_query(self, query_terms: list) -> list:
+        self.query_norm = math.sqrt(sum(w * w for _, w in query_terms))
+        return query_terms if self.query_norm > 0 else []
+
+    def score(self, doc_id, term: str, q_weight: float, tf: int, length: int) -> float:
+        return q_weight * ((tf / length) * self.statistics.idf(term))
+
+    def posting_score(self, cursor, term: str, q_weight: float) -> float:
+        return q_weight * cursor.weight()
+
+    def term_bound(self, cursor, term: str, q_weight: float) -> float:
+        return q_weight * cursor.max_score / self.query_norm
+
+    def block_bound(self, cursor, term: str, q_weight: float, target) -> float:
+        return q_weight * cursor.block_bound(target) / self.query_norm
+
+    def pair_weight(self, term: str, q_weight: float) -> float:
+        return q_weight
+
+    def entry_weights(self, entries: dict) -> np.ndarray:
+        return (entries["tfs"] / entries["lengths"]) * entries["idf"]
+
+    def finalize_rows(self, totals: np.ndarray, postings) -> np.ndarray:
+        row_norms = postings.row_norms
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return np.where(row_norms > 0, totals / (self.query_norm * row_norms), 0.0)
+
+    def finalize(self, doc_id, total: float) -> float:
+        if self.norms is not None:
+            doc_norm = self.norms.get(doc_id, 0)
+        else:
+            doc_norm = self.statistics.doc_norm(doc_id)
+        if doc_norm == 0:
+            return 0.0
+        return total / (self.query_norm * doc_norm)
+
+class BM25Scorer:
+    """
+    BM25 (Okapi): idf = log(1 + (N - df + 0.5) / (df + 0.5)) y saturación de
+    la frecuencia normalizada por la longitud del documento respecto a la
+    media. El peso de cada término en la query es su frecuencia. Las cotas de
+    WAND salen de la frecuencia máxima y la longitud mínima de cada lista y
+    de cada bloque (build_postings).
+    """
+    name = "bm25"
+
+    def __init__(self, statistics, k1: float = BM25_K1, b: float = BM25_B):
+        self.statistics = statistics
+        self.k1 = k1
+        self.b = b
+        self.idf = {}
+        self.avg_length = 0.0
+
+    def term_idf(self, term: str) -> float:
+        term_df = self.statistics.df(term)
+        if term_df <= 0:
+            return 0.0
+        num_docs = self.statistics.num_docs
+        return math.log(1 + (num_docs - term_df + 0.5) / (term_df + 0.5))
+
+    def prepare(self, tokens: list) -> list:
+        self.avg_length = self.statistics.avg_length()
+        query_terms = []
+        for term, count in sorted(Counter(tokens).items()):
+            idf_val = self.term_idf(term)
+            if idf_val > 0:
+                self.idf[term] = idf_val
+                query_terms.append((term, count))
+        return query_terms if self.avg_length > 0 else []
+
+    def _saturation(self, tf: int, length: int) -> float:
+        norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+        return tf * (self.k1 + 1) / (tf + norm)
+
+    def score(self, doc_id, term: str, q_weight: float, tf: int, length: int) -> float:
+        return q_weight * self.idf[term] * self._saturation(tf, length)
+
+    def posting_score(self, cursor, term: str, q_weight: float) -> float:
+        return self.score(cursor.doc, term, q_weight, cursor.tf(), self.statistics.doc_length(cursor.doc))
+
+    def term_bound(self, cursor, term: str, q_weight: float) -> float:
+        # La saturación crece con tf y decrece con la longitud
+        return q_weight * self.idf[term] * self._saturation(cursor.max_tf, cursor.min_length)
+
+    def block_bound(self, cursor, term: str, q_weight: float, target) -> float:
+        block = cursor.block_stats(target)
+        if block is None:
+            return 0.0
+        max_tf, min_length = block
+        return q_weight * self.idf[term] * self._saturation(max_tf, min_length)
+
+    def pair_weight(self, term: str, q_weight: float) -> float:
+        return q_weight * self.idf[term]
+
+    def entry_weights(self, entries: dict) -> np.ndarray:
+        tfs = entries["tfs"]
+        lengths = entries["lengths"]
+        norm = self.k1 * (1 - self.b + self.b * lengths / self.avg_length)
+        return tfs * (self.k1 + 1) / (tfs + norm)
+
+    def finalize_rows(self, totals: np.ndarray, postings) -> np.ndarray:
+        return totals
+
+    def finalize(self, doc_id, total: float) -> float:
+        return total
+
+class BM25FScorer(BM25Scorer):
+    """
+    BM25F con dos campos, el cuerpo y el título (nombre del documento): las
+    frecuencias de cada campo se normalizan por su longitud, se suman con su
+    peso y la suma se satura una sola vez. Solo se puntúan los documentos con
+    el término en el cuerpo (los de las listas); como el título no está en
+    las listas, la cota de cada término es su límite de saturación.
+    """
+    name = "bm25f"
+
+    def __init__(self, statistics, k1: float = BM25_K1, b: float = BM25_B,
+                 title_weight: float = BM25F_TITLE_WEIGHT, title_b: float = BM25F_TITLE_B):
+        super().__init__(statistics, k1, b)
+        self.title_weight = title_weight
+        self.title_b = title_b
+        self.avg_title_length = 0.0
+
+    def prepare(self, tokens: list) -> list:
+        self.avg_title_length = self.statistics.avg_title_length()
+        return super().prepare(tokens)
+
+    def score(self, doc_id, term: str, q_weight: float, tf: int, length: int) -> float:
+        weighted = tf / (1 - self.b + self.b * length / self.avg_length)
+
+        title = self.statistics.title_counts(doc_id)
+        title_tf = title.get(term, 0)
+        if title_tf and self.avg_title_length > 0:
+            title_length = sum(title.values())
+            weighted += self.title_weight * title_tf / (1 - self.title_b + self.title_b * title_length / self.avg_title_length)
+
+        return q_weight * self.idf[term] * weighted * (self.k1 + 1) / (weighted + self.k1)
+
+    def term_bound(self, cursor, term: str, q_weight: float) -> float:
+        return q_weight * self.idf[term] * (self.k1 + 1)
+
+    def block_bound(self, cursor, term: str, q_weight: float, target) -> float:
+        if cursor.block_stats(target) is None:
+            return 0.0
+        return self.term_bound(cursor, term, q_weight)
+
+    def entry_weights(self, entries: dict) -> np.ndarray:
+        # El título no se separa en factores por entrada: sin versión por lotes
+        return None
+
+SCORERS = {
+    TfidfCosineScorer.name: TfidfCosineScorer,
+    BM25Scorer.name: BM25Scorer,
+    BM25FScorer.name: BM25FScorer
+}
+
+def make_scorer(name: str, statistics):
+    # Scorer nuevo (guarda el estado de una búsqueda) a partir de su nombre
+    if name not in SCORERS:
+        raise ValueError(f"Scorer desconocido: {name} (disponibles: {', '.join(sorted(SCORERS))})")
+    return SCORERS[name](statistics)
+
+def search_top_k(query_tfidf: dict, wand_index: dict, norms: dict, k: int, stats: dict = None) -> dict:
+    """
+    Los k documentos más similares (coseno) a un vector TF-IDF de query con
+    search_scored. Devuelve lo mismo que search_inverted_index cortado a k.
+    """
+    if not isinstance(query_tfidf, dict) or not isinstance(wand_index, Mapping) or not isinstance(norms, dict):
+        return {}
+
+    query_terms = sorted(
+        (term, weight)
+        for term, weight in query_tfidf.items()
+        if weight != 0 and term in wand_index
+    )
+
+    scorer = TfidfCosineScorer(None, norms)
+
+    return search_scored(scorer.set_query(query_terms), wand_index, scorer, k, stats)
+
+def use_wand(term_bounds: list) -> bool:
+    """
+    Si compensa WAND para una query con estas (cota, nº de entradas) por
+    término: listas largas y la mayor parte de sus entradas en listas que,
+    juntas, no pueden acercarse a la mayor cota (WAND_SKIP_BOUND, WAND_SKIP_SHARE).
+    """
+    postings_total = sum(length for _, length in term_bounds)
+    if postings_total < WAND_MIN_POSTINGS:
+        return False
+
+    max_bound = max(bound for bound, _ in term_bounds)
+    accumulated = 0.0
+    skippable = 0
+    for bound, length in sorted(term_bounds):
+        accumulated += bound
+        if accumulated >= WAND_SKIP_BOUND * max_bound:
+            break
+        skippable += length
+
+    return skippable >= WAND_SKIP_SHARE * postings_total
+
+def exhaustive_scored(query_terms: list, wand_index: dict, scorer, k: int, stats: dict = None) -> dict:
+    """
+    Lo mismo que search_scored sin cotas: se recorren enteras las listas de
+    la query término a término (en orden de vocabulario, así que cada
+    documento suma sus aportaciones en el mismo orden que con WAND y obtiene
+    exactamente el mismo score) y se ordena por score y, a igual score, por
+    doc id.
+    """
+    totals = {}
+    postings_scored = 0
+    for term, q_weight in query_terms:
+        cursor = postings_cursor(wand_index[term])
+        while cursor.doc is not None:
+            doc_id = cursor.doc
+            totals[doc_id] = totals.get(doc_id, 0.0) + scorer.posting_score(cursor, term, q_weight)
+            postings_scored += 1
+            cursor.next()
+
+    if stats is not None:
+        stats["postings_scored"] = postings_scored
+        stats["documents_scored"] = len(totals)
+
+    results = []
+    for doc_id, total in totals.items():
+        score = scorer.finalize(doc_id, total)
+        if score > 0:
+            results.append((-score, doc_id))
+
+    return {doc_id: -score for score, doc_id in heapq.nsmallest(k, results)}
+
+def search_scored(query_terms: list, wand_index: dict, scorer, k: int, stats: dict = None,
+                  wand: bool = None) -> dict:
+    """
+    Los k documentos con mayor score según scorer usando WAND: un documento
+    solo se puntúa si la suma de las cotas de sus términos puede superar al
+    k-ésimo del heap. Con listas por bloques (PostingList) se comprueban además
+    las cotas de los bloques del pivote y, si no alcanzan, se salta al
+    siguiente bloque sin decodificar los intermedios.
+    Cuando las cotas no pueden descartar casi nada (use_wand) se puntúa todo
+    con exhaustive_scored, que da el mismo resultado; wand fuerza uno u otro
+    camino.
+    query_terms es lo que devuelve scorer.prepare; la puntuación solo lee las
+    listas y las estadísticas del scorer.
+    Si se pasa stats, se rellena con las entradas de las listas evaluadas y
+    con wand (1 si se ha usado WAND, 0 si se ha puntuado todo).
+    """
+    if not isinstance(query_terms, list) or not isinstance(wand_index, Mapping):
+        return {}
+
+    query_terms = [(term, weight) for term, weight in query_terms if term in wand_index]
+    lengths = [_postings_length(wand_index[t]) for t, _ in query_terms]
+
+    if stats is not None:
+        stats["postings_total"] = sum(lengths)
+        stats["postings_scored"] = 0
+        stats["documents_scored"] = 0
+        stats["wand"] = 0
+
+    if not query_terms or k <= 0:
+        return {}
+
+    # Cursor por término: [cursor, orden del término, término, peso en la query, cota]
+    cursors = []
+    for order, (term, q_weight) in enumerate(query_terms):
+        cursor = postings_cursor(wand_index[term])
+        if cursor.doc is not None:
+            cursors.append([cursor, order, term, q_weight, scorer.term_bound(cursor, term, q_weight)])
+
+    if wand is None:
+        wand = bool(cursors) and use_wand([(c[4], lengths[c[1]]) for c in cursors])
+    if not wand:
+        return exhaustive_scored(query_terms, wand_index, scorer, k, stats)
+    if stats is not None:
+        stats["wand"] = 1
+
+    # Heap mínimo de (score, -secuencia, doc_id): a igual score pierde el último visto
+    heap = []
+    sequence = 0
+
+    while cursors:
+        cursors.sort(key = lambda c: c[0].doc)
+        threshold = heap[0][0] if len(heap) >= k else 0.0
+
+        # Pivote: primer cursor cuya cota acumulada puede entrar en el top-k
+        pivot = None
+        upper_bound = 0.0
+        for i, cursor in enumerate(cursors):
+            upper_bound += cursor[4]
+            # Margen relativo por errores de redondeo en las cotas
+            if len(heap) < k or upper_bound * (1 + 1e-9) > threshold:
+                pivot = i
+                break
+
+        if pivot is None:
+            break
+
+        pivot_doc = cursors[pivot][0].doc
+
+        if len(heap) >= k:
+            # Cotas de los bloques donde caería pivot_doc en las listas que llegan a él
+            last = pivot
+            while last + 1 < len(cursors) and cursors[last + 1][0].doc == pivot_doc:
+                last += 1
+
+            block_bound = sum(scorer.block_bound(c[0], c[2], c[3], pivot_doc) for c in cursors[:last + 1])
+            if block_bound * (1 + 1e-9) <= threshold:
+                # Ningún documento hasta el final del bloque más corto puede entrar
+                next_doc = min(c[0].block_last(pivot_doc) for c in cursors[:last + 1]) + 1
+                if last + 1 < len(cursors):
+                    next_doc = min(next_doc, cursors[last + 1][0].doc)
+                for cursor in cursors[:last + 1]:
+                    cursor[0].advance(next_doc)
+                cursors = [c for c in cursors if c[0].doc is not None]
+                continue
+
+        if cursors[0][0].doc == pivot_doc:
+            # Evaluar el documento completo, sumando en orden de vocabulario
+            matching = sorted(
+                (c for c in cursors if c[0].doc == pivot_doc),
+                key = lambda c: c[1]
+            )
+            total = 0.0
+            for cursor in matching:
+                total += scorer.posting_score(cursor[0], cursor[2], cursor[3])
+                cursor[0].next()
+
+            if stats is not None:
+                stats["postings_scored"] += len(matching)
+                stats["documents_scored"] += 1
+
+            score = scorer.finalize(pivot_doc, total)
+            if score > 0:
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, -sequence, pivot_doc))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, -sequence, pivot_doc))
+            sequence += 1
+        else:
+            # Saltar los cursores anteriores al pivote hasta pivot_doc
+            for cursor in cursors[:pivot]:
+                cursor[0].advance(pivot_doc)
+
+        cursors = [c for c in cursors if c[0].doc is not None]
+
+    ranked = sorted(heap, key = lambda x: (-x[0], -x[1]))
+
+    return {doc_id: score for score, _, doc_id in ranked}
+
+def _postings_length(entry) -> int:
+    if isinstance(entry, dict):
+        return len(entry["doc_ids"])
+    return len(entry)
+
+def batch_search_scored(queries: list, scorers: list, postings, k: int,
+                        max_cells: int = BATCH_MAX_CELLS) -> list:
+    """
+    Top-k de muchas queries en una sola pasada: la matriz dispersa de pesos
+    de las queries (una fila por query) por las listas de postings
+    (PostingsIndex), es decir, por cada par (query, término) se suman
+    pair_weight * entry_weights sobre la lista del término con un único
+    bincount. Cada lista se decodifica una vez por tanda aunque la usen
+    varias queries. Cada query lleva su scorer (ya creado, uno por query,
+    todos de la misma clase) y se devuelve, por query, lo mismo que
+    search_scored. Las queries se procesan en tandas de max_cells celdas de
+    la matriz de scores.
+    """
+    if not isinstance(queries, list) or not isinstance(scorers, list) or len(queries) != len(scorers):
+        return []
+    if not queries or k <= 0:
+        return [{} for _ in queries]
+
+    prepared = [scorer.prepare(tokens) for scorer, tokens in zip(scorers, queries)]
+    if scorers[0].entry_weights(postings.gather([])) is None:
+        raise ValueError(f"El scorer {scorers[0].name} no admite búsqueda por lotes")
+
+    term_index = postings.term_index
+    doc_ids = postings.doc_ids
+    n_docs = len(doc_ids)
+    chunk = max(1, max_cells // max(n_docs, 1))
+
+    results = []
+    for first in range(0, len(queries), chunk):
+        last = min(first + chunk, len(queries))
+
+        # Pares (query, término) en orden de vocabulario dentro de cada query
+        pair_queries = []
+        pair_weights = []
+        pair_columns = []
+        for i in range(first, last):
+            for term, q_weight in prepared[i]:
+                column = term_index.get(term)
+                if column is not None:
+                    pair_queries.append(i - first)
+                    pair_weights.append(scorers[i].pair_weight(term, q_weight))
+                    pair_columns.append(column)
+
+        # Listas de los términos de la tanda, cada una decodificada una vez
+        terms, pair_terms = np.unique(np.array(pair_columns, dtype = np.int64), return_inverse = True)
+        gathered = postings.gather(terms.tolist())
+        entry_weights = scorers[first].entry_weights(gathered)
+        sizes = gathered["sizes"]
+        starts = (np.cumsum(sizes) - sizes)[pair_terms]
+        lengths = sizes[pair_terms]
+        pair_of = np.repeat(np.arange(len(pair_terms)), lengths)
+        entries = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+
+        # bincount suma en el orden de entrada: cada celda en orden de vocabulario
+        cells = np.array(pair_queries, dtype = np.int64)[pair_of] * n_docs + gathered["rows"][entries]
+        values = np.array(pair_weights, dtype = np.float64)[pair_of] * entry_weights[entries]
+        size = (last - first) * n_docs
+        totals = np.bincount(cells, weights = values, minlength = size).reshape(last - first, n_docs)
+        matched = (np.bincount(cells, minlength = size) > 0).reshape(last - first, n_docs)
+
+        for i in range(first, last):
+            if not prepared[i]:
+                results.append({})
+                continue
+
+            scores = scorers[i].finalize_rows(totals[i - first], postings)
+            candidates = np.flatnonzero(matched[i - first] & (scores > 0))
+            candidate_scores = scores[candidates]
+
+            if len(candidates) > k:
+                # Todos los empatados con el k-ésimo, para desempatar por doc id
+                kth = np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]
+                keep = candidate_scores >= kth
+                candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+
+            order = np.lexsort((doc_ids[candidates], -candidate_scores))[:k]
+            results.append({
+                int(doc_ids[candidates[j]]): float(candidate_scores[j])
+                for j in order
+            })
+
+    return results
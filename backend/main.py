@@ -1,10 +1,12 @@
 from fastapi import FastAPI, Body
-import re
+from fastapi.responses import JSONResponse, PlainTextResponse
+import os
 from processing.processing import lexical_analysis as lexical_fn
 from processing.processing import tokenize as tokenize_fn
 from processing.processing import remove_stopwords as remove_stopwords_fn
 from processing.processing import meaningful_tokens as meaningful_tokens_fn
 from processing.processing import stem_tokens as stem_tokens_fn
+from processing.processing import analyze as analyze_fn
 from indexer.indexer import build_vocabulary as build_vocabulary_fn
 from indexer.indexer import compute_tf as compute_tf_fn
 from indexer.indexer import compute_idf as compute_idf_fn, compute_tfidf as compute_tfidf_fn
@@ -13,77 +15,262 @@ from indexer.indexer import build_inverted_index as build_inverted_index_fn
 from indexer.indexer import vectorize_document as vectorize_document_fn
 from indexer.indexer import cosine_similarity as cosine_similarity_fn
 from indexer.indexer import search_query as search_query_fn
+from indexer.indexer import search_scored, batch_search_scored, make_scorer, SCORERS
 from crawler.crawler import load_docs as load_docs_fn
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from crawler.crawler import load_docs
+from crawler.crawler import get_docs_path, read_document, document_files
 from crawler.crawler import (
-    download_gutenberg_docs,
-    download_wikipedia_docs,
-    download_wikipedia_docs_html
+    CrawlJob,
+    FETCH_CONCURRENCY,
+    gutenberg_sources,
+    wikipedia_sources,
+    wikipedia_html_sources
 )
-from processing.processing import (
-    lexical_analysis,
-    tokenize,
-    remove_stopwords,
-    meaningful_tokens,
-    stem_tokens
+from corpus.corpus import MATRIX_DTYPE, INDEX_WORKERS
+from processing.processing import stem_cache
+from storage.storage import save_index, load_index, document_text, document_text_range
+from storage.storage import staging_index_path, replace_index, load_stem_lexicon, default_index_path
+from snippets.snippets import (
+    extract_snippet_phrase,
+    extract_snippet_tokens,
+    rank_passages,
+    passage_span,
+    PHRASE_CANDIDATES
 )
-from indexer.indexer import (
-    build_vocabulary,
-    compute_idf,
-    compute_tfidf,
-    vectorize_document,
-    cosine_similarity
+from indexer.indexer import document_matrix_nbytes
+from segments.segments import SegmentedIndex
+from cache.cache import ResultCache
+from query.query import (
+    parse_query,
+    has_constraints,
+    constraint_key,
+    match_documents,
+    proximity_boost,
+    PROXIMITY_CANDIDATES
 )
+from snapshot.snapshot import IndexSnapshot, ReindexJob, replay_changes
+from workers.workers import (
+    BoundedExecutor,
+    ExecutorSaturated,
+    run_in_process,
+    env_int,
+    SEARCH_WORKERS,
+    SEARCH_QUEUE_PER_WORKER,
+    IO_WORKERS,
+    IO_QUEUE_PER_WORKER,
+    BACKGROUND_NICE
+)
+from build_index import build_index_file
+from shards.shards import ShardedIndex
+from suggest.suggest import suggest, SUGGEST_K, MAX_SUGGEST_K
+from metrics.metrics import REGISTRY, span, tracing, profiled
+import time
+import uuid
+import threading
+from functools import partial
 
 
 app = FastAPI()
-CORPUS_DOCUMENTS = []
-CORPUS_TOKENS = []
-VOCABULARY = []
-IDF = {}
-DOCUMENT_VECTORS = {}
+# Índice publicado (IndexSnapshot): se sustituye entero con una sola asignación
+SNAPSHOT = None
+# Serializa las altas, modificaciones y bajas con la publicación de una reconstrucción
+DOCUMENTS_LOCK = threading.Lock()
+# Serializa las publicaciones (reconstrucción y compactación) y la escritura en disco
+PUBLISH_LOCK = threading.Lock()
+# True mientras se publica una reconstrucción: las compactaciones del índice
+# anterior se descartan
+PUBLISHING_REINDEX = False
+# Última reconstrucción lanzada con /reindex
+REINDEX_JOB = None
+# Resultados de /full_search por (query normalizada, k)
+RESULT_CACHE = ResultCache()
+# Descargas en segundo plano por id (progreso en /crawl_jobs/{job_id}). De
+# las terminadas se conservan las CRAWL_JOBS_KEPT más recientes, y solo
+# durante CRAWL_JOB_TTL segundos
+CRAWL_JOBS = {}
+CRAWL_JOBS_KEPT = 20
+CRAWL_JOB_TTL = 3600
+# Shards del índice en procesos locales (build_index.py --shards N), con RI_SHARDS=1
+SHARDS = None
+
+# Límites de concurrencia (configurables por variables de entorno). Las
+# búsquedas se puntúan en su propio pool de hilos y las lecturas y escrituras
+# de documentos en otro, fuera del bucle de eventos; si un pool está lleno se
+# responde 429. La reconstrucción del índice va en un proceso con menos prioridad.
+_search_workers = env_int("RI_SEARCH_WORKERS", SEARCH_WORKERS)
+SEARCH_EXECUTOR = BoundedExecutor(
+    _search_workers, env_int("RI_SEARCH_QUEUE", SEARCH_QUEUE_PER_WORKER * _search_workers), "search"
+)
+_io_workers = env_int("RI_IO_WORKERS", IO_WORKERS)
+IO_EXECUTOR = BoundedExecutor(_io_workers, env_int("RI_IO_QUEUE", IO_QUEUE_PER_WORKER * _io_workers), "io")
+CRAWL_CONCURRENCY = env_int("RI_CRAWL_CONCURRENCY", FETCH_CONCURRENCY)
+REINDEX_WORKERS = env_int("RI_REINDEX_WORKERS", INDEX_WORKERS)
+REINDEX_NICE = env_int("RI_REINDEX_NICE", BACKGROUND_NICE)
+
+# Métricas de las búsquedas y de HTTP (las fases se miden con span en cada módulo)
+SEARCH_QUERIES = REGISTRY.counter("ri_search_queries_total", "Queries puntuadas por scorer y camino", ("scorer", "path"))
+POSTINGS_TOUCHED = REGISTRY.counter("ri_postings_touched_total", "Entradas de listas invertidas evaluadas al puntuar")
+DOCUMENTS_SCANNED = REGISTRY.counter("ri_documents_scanned_total", "Documentos puntuados en las búsquedas")
+HTTP_SECONDS = REGISTRY.histogram("ri_http_request_seconds", "Duración de las peticiones HTTP", ("method", "route", "status"))
+
+def register_gauges():
+    # Estado del índice, de las cachés y de los pools, leído al exportar /metrics
+    def snapshot_value(fn):
+        return lambda: fn(SNAPSHOT) if SNAPSHOT is not None else None
+
+    REGISTRY.gauge("ri_index_version", "Versión del índice base publicado", snapshot_value(lambda s: s.version))
+    REGISTRY.gauge("ri_index_documents", "Documentos vivos en el índice", snapshot_value(lambda s: s.segmented.num_docs))
+    REGISTRY.gauge("ri_index_vocabulary", "Términos del vocabulario del índice base", snapshot_value(lambda s: len(s.vocabulary)))
+    REGISTRY.gauge("ri_index_pending_changes", "Cambios incrementales sin compactar",
+                   snapshot_value(lambda s: s.segmented.pending_changes()))
+    REGISTRY.gauge("ri_index_segments", "Segmentos del índice incremental", snapshot_value(lambda s: len(s.segmented.segments)))
+    REGISTRY.gauge("ri_reindex_running", "1 mientras hay una reconstrucción en curso",
+                   lambda: int(REINDEX_JOB is not None and REINDEX_JOB.running()))
+
+    for name, cache in [("result", RESULT_CACHE), ("stem", stem_cache)]:
+        REGISTRY.gauge(f"ri_{name}_cache_hits_total", f"Aciertos de la caché ({name})", partial(lambda c: c.stats()["hits"], cache),
+                       kind = "counter")
+        REGISTRY.gauge(f"ri_{name}_cache_misses_total", f"Fallos de la caché ({name})", partial(lambda c: c.stats()["misses"], cache),
+                       kind = "counter")
+
+    executors = {"search": SEARCH_EXECUTOR, "io": IO_EXECUTOR}
+    REGISTRY.gauge("ri_executor_tasks", "Tareas en ejecución y en cola por pool", lambda: {
+        (name, state): executor.stats()[state] for name, executor in executors.items() for state in ("running", "queued")
+    }, ("executor", "state"))
+    REGISTRY.gauge("ri_executor_rejected_total", "Tareas rechazadas (429) por pool", lambda: {
+        (name,): executor.stats()["rejected"] for name, executor in executors.items()
+    }, ("executor",), kind = "counter")
+
+register_gauges()
+
+def current_index_version() -> tuple:
+    # Cambia con cada índice base nuevo y con cada alta, modificación o baja
+    snapshot = SNAPSHOT
+    if snapshot is None:
+        return (0, 0)
+    return (snapshot.version, snapshot.segmented.version)
+
+def make_snapshot(index: dict, segmented) -> IndexSnapshot:
+    # Léxico forma -> raíz del índice para no volver a stemizar las formas conocidas
+    stem_cache.update(index.get("lexicon", {}))
+    version = SNAPSHOT.version + 1 if SNAPSHOT is not None else 1
+    with span("index.snapshot"):
+        return IndexSnapshot(index, version, segmented)
+
+def publish_compacted_index(segmented, index: dict) -> dict:
+    # Llamado por el SegmentedIndex publicado al compactar sus cambios en una base nueva
+    global SNAPSHOT
+
+    with PUBLISH_LOCK:
+        if PUBLISHING_REINDEX or SNAPSHOT is None or SNAPSHOT.segmented is not segmented:
+            # El índice ya se ha sustituido por una reconstrucción
+            return None
+        with span("index.save"):
+            path = save_index(index)
+        with span("index.load"):
+            index = load_index(path)
+        SNAPSHOT = make_snapshot(index, segmented)
+
+    return index
+
+def start_corpus_index(index: dict, changes: list = ()):
+    segmented = SegmentedIndex(index)
+    segmented.on_compact = partial(publish_compacted_index, segmented)
+    replay_changes(segmented, changes)
+
+    def publish(base: dict):
+        global SNAPSHOT, PUBLISHING_REINDEX
+        with PUBLISH_LOCK:
+            SNAPSHOT = make_snapshot(base, segmented)
+            PUBLISHING_REINDEX = False
+
+    # Si al aplicar los cambios se ha compactado, se publica la base nueva
+    segmented.with_base(publish)
+
+def build_reindexed_index(job: ReindexJob) -> str:
+    print("Reconstruyendo índice global del corpus...")
+    job.update("analyzing", 0, len(document_files()))
+
+    # Los documentos se leen y procesan en streaming en un proceso aparte,
+    # que escribe el índice nuevo junto al publicado
+    # (las fases de la construcción se miden en ese proceso; aquí, el total)
+    staging_path = staging_index_path()
+    # La reconstrucción poda el índice igual que el publicado
+    pruning = SNAPSHOT.index.get("pruning") if SNAPSHOT is not None else None
+    with span("reindex.build"):
+        num_docs = run_in_process(
+            build_index_file,
+            (staging_path, REINDEX_WORKERS, default_index_path(), pruning),
+            progress = job.update,
+            nice = REINDEX_NICE
+        )
+
+    if not num_docs:
+        print("No hay documentos para indexar.")
+        return None
+
+    return staging_path
+
+def publish_reindexed_index(staging_path: str, job: ReindexJob):
+    global PUBLISHING_REINDEX
+
+    # Se trabaja siempre sobre el índice mapeado desde disco
+    with DOCUMENTS_LOCK:
+        with PUBLISH_LOCK:
+            PUBLISHING_REINDEX = True
+            try:
+                path = replace_index(staging_path)
+                with span("index.load"):
+                    index = load_index(path)
+                stem_cache.update(load_stem_lexicon(path))
+            except Exception:
+                PUBLISHING_REINDEX = False
+                raise
+        start_corpus_index(index, job.stop_recording())
+
+    print(f"Índice global del corpus guardado en {path}.")
+
+def rebuild_corpus_index() -> ReindexJob:
+    job = ReindexJob(build_reindexed_index, publish_reindexed_index)
+    job.run()
+    return job
+
+def record_document_change(operation: str, name: str, text: str = None):
+    # Con DOCUMENTS_LOCK: la reconstrucción en curso la aplicará al índice nuevo
+    job = REINDEX_JOB
+    if job is not None:
+        job.record_change(operation, name, text)
 
 def initialize_corpus_index():
-    global CORPUS_DOCUMENTS, CORPUS_TOKENS, VOCABULARY, IDF, DOCUMENT_VECTORS
-
     print("Inicializando índice global del corpus...")
 
-    # Cargar documentos
-    CORPUS_DOCUMENTS = load_docs()
+    # Cargar el índice persistido (python build_index.py) si existe
+    try:
+        with span("index.load"):
+            index = load_index()
+        start_corpus_index(index)
+        print("Índice global del corpus cargado desde disco.")
+        return
+    except FileNotFoundError:
+        print("No hay índice en disco, se construye desde docs/.")
+    except ValueError as e:
+        print(f"Índice en disco no válido ({e}), se reconstruye.")
 
-    if not CORPUS_DOCUMENTS:
-        print("No hay documentos para indexar.")
+    rebuild_corpus_index()
+
+def initialize_shards():
+    # Los shards no siguen las altas, bajas ni reconstrucciones: se vuelven a
+    # construir con build_index.py --shards N y se reinicia el servidor
+    global SHARDS
+
+    if not env_int("RI_SHARDS", 0):
         return
-    
-    # Procesarmiento lingüístico
-    CORPUS_TOKENS = []
-    for doc in CORPUS_DOCUMENTS:
-        text = doc["text"]
-
-        text = lexical_analysis(text)
-        tokens = tokenize(text)
-        tokens = remove_stopwords(tokens)
-        tokens = meaningful_tokens(tokens)
-        tokens = stem_tokens(tokens)
-
-        CORPUS_TOKENS.append(tokens)
-
-    # Vocabulario global
-    VOCABULARY = build_vocabulary(CORPUS_TOKENS)
-
-    # IDF global
-    IDF = compute_idf(CORPUS_TOKENS, VOCABULARY)
-
-    # Vectorizar documentos
-    DOCUMENT_VECTORS = {}
-    for doc, tokens in zip(CORPUS_DOCUMENTS, CORPUS_TOKENS):
-        tfidf = compute_tfidf(tokens, VOCABULARY, IDF)
-        vector = vectorize_document(tfidf, VOCABULARY)
-        DOCUMENT_VECTORS[doc["id"]] = vector
-    
-    print("Índice global del corpus inicializado.")
+    try:
+        SHARDS = ShardedIndex().start()
+        print(f"{len(SHARDS.workers)} shards del índice arrancados.")
+    except FileNotFoundError:
+        print("No hay shards en disco (python build_index.py --shards N).")
 
 
 app.add_middleware(
@@ -94,7 +281,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class MetricsMiddleware:
+    # Duración de cada petición HTTP. Middleware ASGI puro: BaseHTTPMiddleware
+    # (@app.middleware) añade una tarea y una cola por petición
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Plantilla de la ruta (/documents/{name}), no la URL, para acotar las series
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - start,
+                method = scope["method"],
+                route = route.path if route is not None else "desconocida",
+                status = str(status)
+            )
+
+app.add_middleware(MetricsMiddleware)
+
 initialize_corpus_index()
+initialize_shards()
 
 @app.get("/")
 def hello():
@@ -173,99 +396,96 @@ def search_endpoint(query_vector: list = Body(...), document_vectors: dict = Bod
     results = search_query_fn(query_vector, document_vectors)
     return {"search_results": results}
 
-def remove_gutenberg_header(text: str) -> str:
-    lower = text.lower()
-
-    patterns = [
-        r"\*\*\*\s*start of.*?\*\*\*",
-        r"start of the project gutenberg ebook",
-        r"start of this project gutenberg",
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, lower, re.DOTALL)
-        if match:
-            return text[match.end():]
-    
-    return text[5000:]
-
 class SearchRequest(BaseModel):
     query: str
     k: int = 5
+    # Reordenar el top-k premiando los documentos con los términos más juntos
+    proximity: bool = False
+    # Función de ranking: "tfidf" (coseno), "bm25" o "bm25f" (cuerpo y título)
+    scorer: str = "tfidf"
+    # Devolver los spans de la petición (trace) o un perfil por muestreo de
+    # la puntuación (profile; no usa la caché de resultados)
+    trace: bool = False
+    profile: bool = False
+
+class BatchSearchRequest(BaseModel):
+    queries: list[str]
+    k: int = 5
+    scorer: str = "tfidf"
+    snippets: bool = False
 
-def split_into_paragraphs(text: str) -> list:
-    paragraphs = [
-        p.strip()
-        for p in text.split("\n")
-        if len(p.strip()) > 50
-    ]
-    return paragraphs
-
+def document_snippet(snapshot: IndexSnapshot, doc: dict, query_phrase: str, q_tokens: list) -> str:
+    row = snapshot.document_rows.get(doc["id"])
+    passages = snapshot.passages
 
-def extract_snippet_phrase(text: str, query_phrase: str) -> str:
-    if not text or not query_phrase:
+    if row is None or not passages:
+        # Documento aún sin compactar: se busca en su texto
+        text = document_text(doc)
+        snippet = extract_snippet_phrase(text, query_phrase)
+        if not snippet:
+            snippet = extract_snippet_tokens(text, q_tokens)
+        return snippet
+
+    # Pasajes con más términos de la query; entre ellos, el primero con la frase exacta
+    term_index = snapshot.term_index
+    columns = sorted({term_index[t] for t in q_tokens if t in term_index})
+    candidates = rank_passages(passages, snapshot.matrix, row, columns)
+    if not candidates:
         return ""
-    
-    clean_text = remove_gutenberg_header(text)
-    paragraphs = split_into_paragraphs(clean_text)
 
     phrase_lower = query_phrase.lower()
-
-    for paragraph in paragraphs:
-        if phrase_lower in paragraph.lower():
+    for passage in candidates[:PHRASE_CANDIDATES]:
+        start, end = passage_span(passages, row, passage)
+        paragraph = document_text_range(doc, start, end)
+        if phrase_lower and phrase_lower in paragraph.lower():
             return paragraph.replace("\n", " ").strip()
-        
-    return ""
-
-def extract_snippet_tokens(text: str, tokens: list) -> str:
-    if not text or not tokens:
-        return ""
-    
-    clean_text = remove_gutenberg_header(text)
-    paragraphs = split_into_paragraphs(clean_text)
-
-    for paragraph in paragraphs:
-        p_lower = paragraph.lower()
-        for token in tokens:
-            if token in p_lower:
-                return paragraph.replace("\n", " ").strip()
-            
-    return ""
-
-@app.post("/full_search")
-def full_search_endpoint(request: SearchRequest):
-    query = request.query
-    k = request.k
-    if not VOCABULARY or not DOCUMENT_VECTORS:
-        return {"error": "El índice del corpus no está inicializado."}
-    
-    # Procesar query
-    q_clean = lexical_fn(query)
-    q_tokens = tokenize_fn(q_clean)
-    query_phrase = " ".join(q_tokens)
-    q_tokens = remove_stopwords_fn(q_tokens)
-    q_tokens = meaningful_tokens_fn(q_tokens)
-    q_tokens = stem_tokens_fn(q_tokens)
-
-    # TF-IDF de la query usando vocabulario e IDF GLOBAL
-    q_tfidf = compute_tfidf_fn(q_tokens, VOCABULARY, IDF)
-    q_vector = vectorize_document_fn(q_tfidf, VOCABULARY)
-
-    # Comparar con documentos del corpus
-    ranking = {}
-    for doc_id, doc_vector in DOCUMENT_VECTORS.items():
-        sim = cosine_similarity_fn(q_vector, doc_vector)
-        
-        if sim > 0:
-            ranking[doc_id] = sim
-    
-    # Ordenar resultados
-    ranking = dict(
-        sorted(ranking.items(), key = lambda x: x[1], reverse = True)
-    )
-
-    ranking = dict(list(ranking.items())[:k])
 
+    start, end = passage_span(passages, row, candidates[0])
+    return document_text_range(doc, start, end).replace("\n", " ").strip()
+
+def record_search(scorer_name: str, path: str, stats: dict, queries: int = 1):
+    SEARCH_QUERIES.inc(queries, scorer = scorer_name, path = path)
+    POSTINGS_TOUCHED.inc(stats.get("postings_scored", 0))
+    DOCUMENTS_SCANNED.inc(stats.get("documents_scored", 0))
+
+def rank_query(snapshot: IndexSnapshot, parsed: dict, q_tokens: list, top_k: int, scorer_name: str) -> dict:
+    # Ranking de una query analizada (filtros, cambios pendientes o listas de la base)
+    segmented = snapshot.segmented
+    stats = {}
+
+    if has_constraints(parsed):
+        # Solo los documentos que cumplen el filtro (listas y posiciones)
+        with span("query.filter"):
+            matches = match_documents(segmented, parsed)
+        scorer = make_scorer(scorer_name, segmented)
+        with span("query.scoring"):
+            ranking = segmented.search(q_tokens, top_k, doc_ids = matches, scorer = scorer, stats = stats)
+        if not ranking and matches and not q_tokens:
+            # Filtro sin términos que puntuar (p. ej. solo NOT): por doc id
+            ranking = {doc_id: 1.0 for doc_id in sorted(matches)[:top_k]}
+        record_search(scorer_name, "filtered", stats)
+        return ranking
+
+    if segmented.has_pending():
+        # Hay cambios incrementales sin compactar: IDF y normas al día
+        scorer = make_scorer(scorer_name, segmented)
+        with span("query.scoring"):
+            ranking = segmented.search(q_tokens, top_k, scorer = scorer, stats = stats)
+        record_search(scorer_name, "segmented", stats)
+        return ranking
+
+    # Pesos de la query con las estadísticas GLOBALES del índice base y
+    # top-k con poda WAND sobre las listas de sus términos
+    scorer = make_scorer(scorer_name, snapshot.statistics)
+    with span("query.vectorization"):
+        query_terms = scorer.prepare(q_tokens)
+    with span("query.scoring"):
+        ranking = search_scored(query_terms, snapshot.wand_index, scorer, top_k, stats)
+    record_search(scorer_name, "wand" if stats.get("wand") else "exhaustive", stats)
+    return ranking
+
+def build_results(snapshot: IndexSnapshot, ranking: dict, query_phrase: str, q_tokens: list, snippets: bool = True) -> list:
+    # Scores normalizados respecto al mejor y, si se piden, snippets
     if ranking:
         max_score = max(ranking.values())
         if max_score > 0:
@@ -278,66 +498,498 @@ def full_search_endpoint(request: SearchRequest):
         if score <= 0:
             continue
 
-        doc = next(d for d in CORPUS_DOCUMENTS if d["id"] == doc_id)
-        snippet = extract_snippet_phrase(doc["text"], query_phrase)
-
-        if not snippet:
-            snippet = extract_snippet_tokens(doc["text"], q_tokens)
+        doc = snapshot.find_document(doc_id)
+        if doc is None:
+            continue
 
-        results.append({
+        result = {
             "doc_id": doc_id,
             "doc_name": doc["name"],
-            "score": score,
-            "snippet": snippet
-        })
+            "score": score
+        }
+        if snippets:
+            result["snippet"] = document_snippet(snapshot, doc, query_phrase, q_tokens)
+        results.append(result)
 
-    return {
+    return results
+
+def snippet_phrase(parsed: dict, query_phrase: str) -> str:
+    # El snippet prefiere el pasaje con la primera frase entre comillas
+    if parsed["quoted"]:
+        return " ".join(tokenize_fn(lexical_fn(parsed["quoted"][0])))
+    return query_phrase
+
+def saturated_response(error: ExecutorSaturated) -> JSONResponse:
+    return JSONResponse(status_code = 429, content = {"error": str(error)}, headers = {"Retry-After": "1"})
+
+def search_results(snapshot: IndexSnapshot, parsed: dict, q_clean: str, query_phrase: str, k: int,
+                   proximity: bool, scorer_name: str) -> list:
+    # Parte de /full_search que gasta CPU: se ejecuta en SEARCH_EXECUTOR
+    with span("query.analysis"):
+        q_tokens = analyze_fn(q_clean)
+
+    # Con proximidad se puntúan más candidatos y se reordenan después
+    top_k = max(k, PROXIMITY_CANDIDATES) if proximity else k
+
+    ranking = rank_query(snapshot, parsed, q_tokens, top_k, scorer_name)
+
+    if proximity:
+        with span("query.proximity"):
+            ranking = proximity_boost(snapshot.segmented, ranking, q_tokens, k)
+
+    with span("query.snippets"):
+        return build_results(snapshot, ranking, snippet_phrase(parsed, query_phrase), q_tokens)
+
+def profiled_call(profile: bool, fn, *args) -> tuple:
+    # fn(*args) con el perfilador por muestreo activado si profile: (resultado, perfil o None)
+    with profiled(profile) as profiler:
+        result = fn(*args)
+    return result, profiler.result() if profiler is not None else None
+
+@app.post("/full_search")
+async def full_search_endpoint(request: SearchRequest):
+    # Toda la búsqueda usa el mismo índice aunque se publique otro entretanto
+    snapshot = SNAPSHOT
+    if snapshot is None or not snapshot.vocabulary:
+        return {"error": "El índice del corpus no está inicializado."}
+    if request.scorer not in SCORERS:
+        return {"error": f"Scorer desconocido: {request.scorer} (disponibles: {', '.join(sorted(SCORERS))})"}
+
+    with tracing(request.trace) as trace:
+        response = await full_search(snapshot, request)
+
+    if isinstance(response, dict) and trace is not None:
+        response["trace"] = trace.as_list()
+    return response
+
+async def full_search(snapshot: IndexSnapshot, request: SearchRequest):
+    query = request.query
+    k = request.k
+
+    # Procesar query: frases, NEAR/k y AND/OR/NOT aparte del texto a puntuar
+    with span("query.parse"):
+        parsed = parse_query(query)
+        q_clean = lexical_fn(parsed["text"])
+        query_phrase = " ".join(tokenize_fn(q_clean))
+
+    # Resultados ya calculados para la misma query normalizada, k e índice
+    # (con profile se puntúa siempre, para que haya algo que perfilar)
+    start = time.perf_counter()
+    version = (snapshot.version, snapshot.segmented.version)
+    cache_key = (query_phrase, k, constraint_key(parsed), request.proximity, request.scorer)
+    results = None if request.profile else RESULT_CACHE.get(cache_key, version)
+    if results is not None:
+        return {
+            "query": query,
+            "results": results
+        }
+
+    # Los aciertos de caché se sirven desde el bucle; el resto se puntúa en el pool
+    try:
+        results, profile = await SEARCH_EXECUTOR.run(
+            profiled_call, request.profile,
+            search_results, snapshot, parsed, q_clean, query_phrase, k, request.proximity, request.scorer
+        )
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+
+    RESULT_CACHE.put(cache_key, version, results, time.perf_counter() - start)
+
+    response = {
         "query": query,
-        "results": results 
+        "results": results
+    }
+    if profile is not None:
+        response["profile"] = profile
+    return response
+
+def batch_search(queries: list, k: int = 5, scorer: str = "tfidf", snippets: bool = False) -> list:
+    """
+    Búsqueda de muchas queries a la vez: las que solo tienen texto se
+    puntúan juntas como un producto de la matriz dispersa de las queries por
+    la de documentos (batch_search_scored); las que llevan frases, NEAR o
+    operadores booleanos, o si hay cambios incrementales pendientes o el
+    scorer no tiene versión por lotes, una a una como en /full_search.
+    Devuelve, por query, lo mismo que /full_search (snippets opcionales).
+    """
+    snapshot = SNAPSHOT
+    if snapshot is None or not snapshot.vocabulary:
+        raise RuntimeError("El índice del corpus no está inicializado.")
+    if scorer not in SCORERS:
+        raise ValueError(f"Scorer desconocido: {scorer} (disponibles: {', '.join(sorted(SCORERS))})")
+
+    with span("batch.analysis"):
+        parsed_queries = [parse_query(query) for query in queries]
+        cleaned = [lexical_fn(parsed["text"]) for parsed in parsed_queries]
+        tokens = [analyze_fn(q_clean) for q_clean in cleaned]
+
+    rankings = [None] * len(queries)
+    batched = []
+    if not snapshot.segmented.has_pending():
+        batched = [i for i, parsed in enumerate(parsed_queries) if not has_constraints(parsed)]
+    scorers = [make_scorer(scorer, snapshot.statistics) for _ in batched]
+    if scorers and scorers[0].entry_weights(snapshot.wand_index.gather([])) is None:
+        # Scorer sin versión por lotes (bm25f): todas una a una
+        batched = []
+
+    batch_rankings = []
+    if batched:
+        with span("batch.scoring"):
+            batch_rankings = batch_search_scored(
+                [tokens[i] for i in batched], scorers, snapshot.wand_index, k
+            )
+        record_search(scorer, "batch", {}, len(batch_rankings))
+    for i, ranking in zip(batched, batch_rankings):
+        rankings[i] = ranking
+
+    results = []
+    for i, query in enumerate(queries):
+        if rankings[i] is None:
+            rankings[i] = rank_query(snapshot, parsed_queries[i], tokens[i], k, scorer)
+        query_phrase = snippet_phrase(parsed_queries[i], " ".join(tokenize_fn(cleaned[i])))
+        with span("batch.results"):
+            results.append({
+                "query": query,
+                "results": build_results(snapshot, rankings[i], query_phrase, tokens[i], snippets)
+            })
+
+    return results
+
+def shard_search_results(sharded: ShardedIndex, q_clean: str, k: int, scorer_name: str) -> list:
+    # Como search_results, pero el top-k sale de los shards (scatter-gather)
+    with span("query.analysis"):
+        q_tokens = analyze_fn(q_clean)
+
+    stats = {}
+    with span("query.scoring"):
+        ranking = sharded.search(q_tokens, k, scorer_name, stats)
+    record_search(scorer_name, "sharded", stats)
+
+    max_score = max(ranking.values()) if ranking else 0
+    return [
+        {"doc_id": doc_id, "doc_name": sharded.names.get(doc_id), "score": score / max_score}
+        for doc_id, score in ranking.items()
+        if score > 0
+    ]
+
+@app.post("/shard_search")
+async def shard_search_endpoint(request: SearchRequest):
+    """
+    /full_search repartida entre los shards. Los scores son los mismos que
+    con el índice único construido a la vez; no hay snippets, filtros
+    (frases, NEAR, AND/OR/NOT) ni proximidad.
+    """
+    sharded = SHARDS
+    if sharded is None:
+        return {"error": "No hay shards arrancados (RI_SHARDS=1 y build_index.py --shards N)."}
+    if request.scorer not in SCORERS:
+        return {"error": f"Scorer desconocido: {request.scorer} (disponibles: {', '.join(sorted(SCORERS))})"}
+
+    with tracing(request.trace) as trace:
+        with span("query.parse"):
+            parsed = parse_query(request.query)
+            q_clean = lexical_fn(parsed["text"])
+        if has_constraints(parsed) or request.proximity:
+            return {"error": "Las búsquedas en shards no admiten filtros ni proximidad."}
+
+        try:
+            results = await SEARCH_EXECUTOR.run(shard_search_results, sharded, q_clean, request.k, request.scorer)
+        except ExecutorSaturated as e:
+            return saturated_response(e)
+        except RuntimeError as e:
+            return {"error": str(e)}
+
+    response = {
+        "query": request.query,
+        "results": results
+    }
+    if trace is not None:
+        response["trace"] = trace.as_list()
+    return response
+
+@app.post("/batch_search")
+async def batch_search_endpoint(request: BatchSearchRequest):
+    try:
+        results = await SEARCH_EXECUTOR.run(batch_search, request.queries, request.k, request.scorer, request.snippets)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+    except (RuntimeError, ValueError) as e:
+        return {"error": str(e)}
+    return {"results": results}
+
+@app.get("/suggest")
+def suggest_endpoint(q: str, k: int = SUGGEST_K):
+    """
+    Terminaciones de la última palabra de lo que se lleva escrito (formas y
+    raíces del índice base, por df). Recorre el trie del índice publicado sin
+    pasar por el pool de búsquedas: tarda menos de un milisegundo. Las altas
+    pendientes de compactar no se sugieren hasta que entran en el índice base.
+    """
+    snapshot = SNAPSHOT
+    if snapshot is None or not snapshot.vocabulary:
+        return {"error": "El índice del corpus no está inicializado."}
+
+    with span("suggest.complete"):
+        suggestions = suggest(snapshot.suggester, q, max(0, min(k, MAX_SUGGEST_K)))
+    return {
+        "query": q,
+        "suggestions": suggestions
     }
 
+@app.get("/metrics")
+def metrics_endpoint():
+    # Formato de texto de Prometheus
+    return PlainTextResponse(REGISTRY.render(), media_type = "text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/status")
 def status_endpoint():
+    snapshot = SNAPSHOT
+    matrix = snapshot.matrix if snapshot else {}
     return {
-        "indexed": bool(DOCUMENT_VECTORS),
-        "num_documents": len(CORPUS_DOCUMENTS),
-        "vocabulary_size": len(VOCABULARY),
-        "vector_dimension": len(VOCABULARY)
+        "indexed": bool(matrix),
+        "index_version": snapshot.version if snapshot else 0,
+        "num_documents": snapshot.segmented.num_docs if snapshot else 0,
+        "vocabulary_size": len(snapshot.vocabulary) if snapshot else 0,
+        "vector_dimension": len(snapshot.vocabulary) if snapshot else 0,
+        "matrix_nonzeros": int(len(matrix["data"])) if matrix else 0,
+        "matrix_dtype": str(matrix["data"].dtype) if matrix else MATRIX_DTYPE,
+        "matrix_bytes": document_matrix_nbytes(matrix),
+        "postings_bytes": snapshot.wand_index.nbytes() if snapshot else 0,
+        "suggest_entries": len(snapshot.suggester) if snapshot else 0,
+        "pending_changes": snapshot.segmented.pending_changes() if snapshot else 0,
+        "segments": len(snapshot.segmented.segments) if snapshot else 0,
+        "pruning": snapshot.index.get("pruning") if snapshot else None,
+        "reindex": REINDEX_JOB.progress() if REINDEX_JOB else None,
+        "stem_cache": stem_cache.stats(),
+        "result_cache": RESULT_CACHE.stats(),
+        "executors": {"search": SEARCH_EXECUTOR.stats(), "io": IO_EXECUTOR.stats()},
+        "shards": SHARDS.status() if SHARDS is not None else None
     }
 
 @app.get("/load_docs")
-def load_docs_endpoint():
-    docs = load_docs_fn()
+async def load_docs_endpoint():
+    try:
+        docs = await IO_EXECUTOR.run(load_docs_fn)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
     return {"documents": docs}
 
+def prune_crawl_jobs(now: float = None):
+    # Olvida las descargas terminadas hace más de CRAWL_JOB_TTL segundos y las que pasan de CRAWL_JOBS_KEPT
+    now = time.time() if now is None else now
+    finished = sorted(
+        ((job.finished, job_id) for job_id, job in CRAWL_JOBS.items() if job.finished is not None),
+        reverse = True
+    )
+    for position, (finished_at, job_id) in enumerate(finished):
+        if position >= CRAWL_JOBS_KEPT or now - finished_at > CRAWL_JOB_TTL:
+            del CRAWL_JOBS[job_id]
+
+def start_crawl_job(sources: list) -> str:
+    # La descarga corre en su propio hilo con un bucle asyncio: no ocupa ningún pool
+    prune_crawl_jobs()
+    job_id = uuid.uuid4().hex[:12]
+    CRAWL_JOBS[job_id] = CrawlJob(sources, concurrency = CRAWL_CONCURRENCY).start()
+    return job_id
+
 @app.get("/download_gutenberg")
-def download_gutenberg_endpoint():
-    download_gutenberg_docs()
+async def download_gutenberg_endpoint():
     return {
         "status": "ok",
-        "message": "Descarga de Project Gutenberg completada."
+        "job_id": start_crawl_job(gutenberg_sources()),
+        "message": "Descarga de Project Gutenberg iniciada en segundo plano."
     }
 
 @app.get("/download_wikipedia")
-def download_wikipedia_endpoint():
-    download_wikipedia_docs()
+async def download_wikipedia_endpoint():
     return {
         "status": "ok",
-        "message": "Artículos de wikipedia descargados."
+        "job_id": start_crawl_job(wikipedia_sources()),
+        "message": "Descarga de artículos de wikipedia iniciada en segundo plano."
     }
 
 @app.get("/download_wikipedia_html")
-def download_wikipedia_html_endpoint():
-    download_wikipedia_docs_html()
+async def download_wikipedia_html_endpoint():
+    return {
+        "status": "ok",
+        "job_id": start_crawl_job(wikipedia_html_sources()),
+        "message": "Descarga de artículos de wikipedia (html) iniciada en segundo plano."
+    }
+
+@app.get("/crawl_jobs")
+async def crawl_jobs_endpoint():
+    prune_crawl_jobs()
+    return {
+        "jobs": {job_id: job.progress()["state"] for job_id, job in CRAWL_JOBS.items()}
+    }
+
+@app.get("/crawl_jobs/{job_id}")
+async def crawl_job_endpoint(job_id: str):
+    job = CRAWL_JOBS.get(job_id)
+    if job is None:
+        return {"error": f"No existe la descarga {job_id}."}
+    return {"job_id": job_id, **job.progress()}
+
+def start_reindex() -> dict:
+    global REINDEX_JOB
+
+    # Se construye en segundo plano; las búsquedas siguen con el índice actual
+    with DOCUMENTS_LOCK:
+        if REINDEX_JOB is not None and REINDEX_JOB.running():
+            return {
+                "status": "running",
+                "message": "Ya hay una reconstrucción del índice en curso.",
+                **REINDEX_JOB.progress()
+            }
+        REINDEX_JOB = ReindexJob(build_reindexed_index, publish_reindexed_index).start()
+
     return {
         "status": "ok",
-        "message": "Artículo de wikipedia descargados vía html"
+        "message": "Reconstrucción del índice global del corpus iniciada en segundo plano."
     }
 
 @app.get("/reindex")
-def reindex_endpoint():
-    initialize_corpus_index()
+async def reindex_endpoint():
+    # DOCUMENTS_LOCK puede estar tomado mientras se publica un índice: se espera en el pool
+    try:
+        return await IO_EXECUTOR.run(start_reindex)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+
+@app.get("/reindex/status")
+async def reindex_status_endpoint():
+    if REINDEX_JOB is None:
+        return {"error": "No se ha lanzado ninguna reconstrucción del índice."}
+    return REINDEX_JOB.progress()
+
+class DocumentRequest(BaseModel):
+    name: str
+    text: str = None
+
+def write_document_file(name: str, text: str):
+    # Si llega el texto se guarda en docs/ para que /reindex lo conserve
+    if text is None:
+        return None
+    if not name.lower().endswith(".txt"):
+        return "Solo se pueden escribir documentos .txt"
+
+    with open(os.path.join(get_docs_path(), name), "w", encoding = "utf-8") as f:
+        f.write(text)
+    return None
+
+def read_document_file(name: str) -> str:
+    filepath = os.path.join(get_docs_path(), name)
+    if not os.path.exists(filepath):
+        return None
+    return read_document(filepath)
+
+def valid_document_name(name: str) -> bool:
+    return bool(name) and os.path.basename(name) == name
+
+def add_document(name: str, text: str) -> dict:
+    if SNAPSHOT is None:
+        return {"error": "El índice del corpus no está inicializado."}
+    if not valid_document_name(name):
+        return {"error": "Nombre de documento no válido"}
+
+    with DOCUMENTS_LOCK:
+        segmented = SNAPSHOT.segmented
+        if name in segmented.names:
+            return {"error": f"El documento {name} ya está indexado"}
+
+        error = write_document_file(name, text)
+        if error:
+            return {"error": error}
+
+        text = read_document_file(name)
+        if not text or not text.strip():
+            return {"error": f"No hay texto para el documento {name}"}
+
+        try:
+            doc_id = segmented.add_document(name, text)
+        except ValueError as e:
+            return {"error": str(e)}
+        record_document_change("add", name, text)
+
     return {
         "status": "ok",
-        "message": "Índice global del corpus reconstruido."
+        "doc_id": doc_id,
+        "message": f"Documento {name} añadido al índice."
     }
+
+def update_document(name: str, text: str) -> dict:
+    if SNAPSHOT is None:
+        return {"error": "El índice del corpus no está inicializado."}
+    if not valid_document_name(name):
+        return {"error": "Nombre de documento no válido"}
+
+    with DOCUMENTS_LOCK:
+        segmented = SNAPSHOT.segmented
+        if name not in segmented.names:
+            return {"error": f"El documento {name} no está indexado"}
+
+        error = write_document_file(name, text)
+        if error:
+            return {"error": error}
+
+        text = read_document_file(name)
+        if not text or not text.strip():
+            return {"error": f"No hay texto para el documento {name}"}
+
+        try:
+            doc_id = segmented.update_document(name, text)
+        except KeyError:
+            return {"error": f"El documento {name} no está indexado"}
+        record_document_change("update", name, text)
+
+    return {
+        "status": "ok",
+        "doc_id": doc_id,
+        "message": f"Documento {name} actualizado en el índice."
+    }
+
+def delete_document(name: str) -> dict:
+    if SNAPSHOT is None:
+        return {"error": "El índice del corpus no está inicializado."}
+    if not valid_document_name(name):
+        return {"error": "Nombre de documento no válido"}
+
+    with DOCUMENTS_LOCK:
+        try:
+            SNAPSHOT.segmented.delete_document(name)
+        except KeyError:
+            return {"error": f"El documento {name} no está indexado"}
+        record_document_change("delete", name)
+
+        filepath = os.path.join(get_docs_path(), name)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+    return {
+        "status": "ok",
+        "message": f"Documento {name} eliminado del índice."
+    }
+
+# Las altas, modificaciones y bajas leen y escriben en docs/ y esperan a
+# DOCUMENTS_LOCK: van al pool de E/S
+
+@app.post("/documents")
+async def add_document_endpoint(request: DocumentRequest):
+    try:
+        return await IO_EXECUTOR.run(add_document, request.name, request.text)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+
+@app.put("/documents/{name}")
+async def update_document_endpoint(name: str, text: str = Body(None, embed = True)):
+    try:
+        return await IO_EXECUTOR.run(update_document, name, text)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+
+@app.delete("/documents/{name}")
+async def delete_document_endpoint(name: str):
+    try:
+        return await IO_EXECUTOR.run(delete_document, name)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
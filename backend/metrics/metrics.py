@@ -0,0 +1,315 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import contextvars
+from collections import Counter as _Counter
+from contextlib import contextmanager
+
+# Límites (en segundos) de los buckets de los histogramas de latencia
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+# Periodo de muestreo del perfilador y pilas/funciones que se devuelven
+PROFILE_INTERVAL = 0.005
+PROFILE_TOP = 20
+
+def _label_key(names: tuple, labels: dict) -> tuple:
+    if set(labels) != set(names):
+        raise ValueError(f"Se esperaban las etiquetas {names}, no {tuple(labels)}")
+    return tuple(str(labels[name]) for name in names)
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = []
+    for name, value in zip(names, values):
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    # Contador monótono, opcionalmente con etiquetas
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labels, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(self.labels, labels), 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in values]
+
+class Histogram:
+    # Histograma acumulativo (buckets "le", _sum y _count) como los de Prometheus
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labels, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(_label_key(self.labels, labels))
+            return entry[2] if entry else 0
+
+    def samples(self) -> list:
+        with self._lock:
+            values = sorted((key, ([*entry[0]], entry[1], entry[2])) for key, entry in self._values.items())
+
+        samples = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                samples.append((self.name + "_bucket", _format_labels(self.labels, key, le), cumulative))
+            samples.append((self.name + "_sum", _format_labels(self.labels, key), total))
+            samples.append((self.name + "_count", _format_labels(self.labels, key), count))
+        return samples
+
+class Gauge:
+    """
+    Valor que se lee al exportar: fn devuelve un número o, con etiquetas, un
+    dict {tupla de valores de las etiquetas: número}. Con kind = "counter"
+    sirve para exportar contadores que ya lleva otro objeto (p. ej. los
+    aciertos de ResultCache).
+    """
+
+    def __init__(self, name: str, documentation: str, fn, labels: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.kind = kind
+        self._fn = fn
+
+    def samples(self) -> list:
+        value = self._fn()
+        if value is None:
+            return []
+        if not self.labels:
+            return [(self.name, "", value)]
+        return [
+            (self.name, _format_labels(self.labels, tuple(str(v) for v in key)), item)
+            for key, item in sorted(value.items())
+        ]
+
+class Registry:
+    # Métricas del proceso, exportadas en el formato de texto de Prometheus
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"La métrica {metric.name} ya existe")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, fn, labels: tuple = (), kind: str = "gauge") -> Gauge:
+        return self._register(Gauge(name, documentation, fn, labels, kind))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # Un gauge que falla no impide exportar el resto
+                lines.append(f"# {metric.name}: {type(e).__name__}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Duración de cada fase de la indexación y de las búsquedas (span)
+STAGE_SECONDS = REGISTRY.histogram("ri_stage_seconds", "Duración de cada fase de indexación y búsqueda", ("stage",))
+
+# Trazas por petición
+
+_current_trace = contextvars.ContextVar("ri_trace", default = None)
+
+class Trace:
+    # Spans de una petición: nombre, inicio relativo, duración y profundidad
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self._depth = 0
+
+    def as_list(self) -> list:
+        return [
+            {"stage": stage, "start_ms": start * 1000, "duration_ms": duration * 1000, "depth": depth}
+            for stage, start, duration, depth in sorted(self.spans, key = lambda s: s[1])
+        ]
+
+@contextmanager
+def tracing(enabled: bool = True):
+    """
+    Recoge los spans de lo que se ejecute dentro (en este contexto) en una
+    Trace. Sin enabled no hace nada y devuelve None.
+    """
+    if not enabled:
+        yield None
+        return
+
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+@contextmanager
+def span(stage: str):
+    """
+    Mide lo que se ejecute dentro y lo acumula en ri_stage_seconds{stage}.
+    Si hay una traza activa (tracing), se añade también a ella.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace._depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage = stage)
+        if trace is not None:
+            trace._depth -= 1
+            trace.spans.append((stage, start - trace.start, elapsed, trace._depth))
+
+# Perfilador por muestreo
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo de un hilo: otro hilo lee su pila cada interval
+    segundos (sys._current_frames) y cuenta las pilas y las funciones vistas.
+    No instrumenta el código, así que mientras no se arranca no cuesta nada.
+    """
+
+    def __init__(self, thread_id: int = None, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = 0
+        self.stacks = _Counter()
+        self.self_counts = _Counter()
+        self.total_counts = _Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._elapsed = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+
+        names = []
+        lines = []
+        while frame is not None:
+            names.append(_frame_name(frame))
+            lines.append(f"{_frame_name(frame)}:{frame.f_lineno}")
+            frame = frame.f_back
+        names.reverse()
+
+        self.samples += 1
+        self.stacks[";".join(names)] += 1
+        self.self_counts[lines[0]] += 1
+        for name in set(names):
+            self.total_counts[name] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._elapsed = time.perf_counter() - self._started
+
+    def result(self, top: int = PROFILE_TOP) -> dict:
+        return {
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "elapsed_ms": (self._elapsed or 0.0) * 1000,
+            "stacks": [{"stack": stack, "samples": n} for stack, n in self.stacks.most_common(top)],
+            "self": [{"line": line, "samples": n} for line, n in self.self_counts.most_common(top)],
+            "total": [{"function": name, "samples": n} for name, n in self.total_counts.most_common(top)]
+        }
+
+@contextmanager
+def profiled(enabled: bool = True, interval: float = PROFILE_INTERVAL):
+    # Perfila el hilo actual mientras dura el bloque (None si no está activado)
+    if not enabled:
+        yield None
+        return
+
+    profiler = SamplingProfiler(threading.get_ident(), interval).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
@@ -0,0 +1,129 @@
+import heapq
+import numpy as np
+from processing.processing import analyze_positions
+from codec.codec import delta_encode, delta_decode, encode_varint, decode_varint, varint_sizes
+
+def group_positions(pairs: list) -> dict:
+    # [(término, posición)] de analyze_positions -> {término: [posiciones]}
+    positions = {}
+    for term, position in pairs:
+        positions.setdefault(term, []).append(position)
+    return positions
+
+def text_positions(text: str, stem: bool = True) -> dict:
+    return group_positions(analyze_positions(text, stem))
+
+def build_position_arrays(doc_positions: list, matrix: dict, vocabulary: list) -> dict:
+    """
+    Índice posicional comprimido, alineado con las entradas no nulas de la
+    matriz CSR: las posiciones del término de la entrada j en su documento son
+    data[ptr[j]:ptr[j + 1]], codificadas como huecos en varint (la mayoría de
+    huecos ocupa uno o dos bytes).
+    """
+    indptr = matrix["indptr"].tolist()
+    indices = matrix["indices"].tolist()
+
+    ptr = [np.zeros(1, dtype = np.int64)]
+    blocks = []
+    offset = 0
+
+    for row, positions in enumerate(doc_positions):
+        positions = positions or {}
+        entries = [positions.get(vocabulary[column], ()) for column in indices[indptr[row]:indptr[row + 1]]]
+        if not entries:
+            continue
+
+        lengths = np.array([len(entry) for entry in entries], dtype = np.int64)
+        values = np.fromiter(
+            (position for entry in entries for position in entry),
+            dtype = np.int64,
+            count = int(lengths.sum())
+        )
+
+        # Huecos dentro de cada entrada: la primera posición de cada una va tal cual
+        gaps = delta_encode(values)
+        firsts = (np.cumsum(lengths) - lengths)[lengths > 0]
+        gaps[firsts] = values[firsts]
+
+        byte_ends = np.concatenate(([0], np.cumsum(varint_sizes(gaps))))
+        value_ends = np.cumsum(lengths)
+        ptr.append(offset + byte_ends[value_ends])
+
+        block = encode_varint(gaps)
+        blocks.append(block)
+        offset += len(block)
+
+    return {
+        "ptr": np.concatenate(ptr),
+        "data": np.concatenate(blocks) if blocks else np.zeros(0, dtype = np.uint8)
+    }
+
+def entry_positions(positions: dict, entry: int) -> np.ndarray:
+    # Posiciones (ordenadas) de la entrada CSR entry
+    start, end = positions["ptr"][entry], positions["ptr"][entry + 1]
+    return delta_decode(decode_varint(positions["data"][start:end]))
+
+def document_positions(positions: dict, matrix: dict, vocabulary: list, row: int) -> dict:
+    # Posiciones de una fila en el mismo formato que text_positions (para compactar)
+    start, end = matrix["indptr"][row], matrix["indptr"][row + 1]
+    return {
+        vocabulary[column]: entry_positions(positions, j).tolist()
+        for j, column in zip(range(start, end), matrix["indices"][start:end].tolist())
+    }
+
+def phrase_starts(lists: list, offsets: list) -> np.ndarray:
+    """
+    Posiciones de inicio de una frase: p tal que el término i aparece en
+    p + offsets[i] para todos los términos. Se intersecan las listas de menor
+    a mayor longitud.
+    """
+    if not lists:
+        return np.zeros(0, dtype = np.int64)
+
+    order = sorted(range(len(lists)), key = lambda i: len(lists[i]))
+    starts = np.asarray(lists[order[0]], dtype = np.int64) - offsets[order[0]]
+
+    for i in order[1:]:
+        if not len(starts):
+            break
+        starts = np.intersect1d(starts, np.asarray(lists[i], dtype = np.int64) - offsets[i], assume_unique = True)
+
+    return starts
+
+def within_distance(a, b, distance: int) -> bool:
+    # True si alguna posición de a está a distance tokens o menos de alguna de b
+    a = np.asarray(a, dtype = np.int64)
+    b = np.asarray(b, dtype = np.int64)
+    if not len(a) or not len(b):
+        return False
+
+    # Para cada posición de a, la más cercana de b por la derecha y por la izquierda
+    i = np.searchsorted(b, a)
+    right = b[np.minimum(i, len(b) - 1)] - a
+    left = a - b[np.maximum(i - 1, 0)]
+
+    return bool(((right >= 0) & (right <= distance)).any() or ((left >= 0) & (left <= distance)).any())
+
+def min_window(lists: list) -> int:
+    """
+    Menor distancia (última - primera posición) de una ventana del texto que
+    contiene al menos una posición de cada lista.
+    """
+    lists = [list(positions) for positions in lists if len(positions)]
+    if len(lists) < 2:
+        return 0
+
+    heap = [(positions[0], i, 0) for i, positions in enumerate(lists)]
+    heapq.heapify(heap)
+    current_max = max(positions[0] for positions in lists)
+    best = current_max - heap[0][0]
+
+    while True:
+        position, i, j = heapq.heappop(heap)
+        best = min(best, current_max - position)
+        if j + 1 == len(lists[i]) or best == len(lists) - 1:
+            return best
+
+        following = lists[i][j + 1]
+        current_max = max(current_max, following)
+        heapq.heappush(heap, (following, i, j + 1))
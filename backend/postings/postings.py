@@ -0,0 +1,415 @@
+import math
+from bisect import bisect_left
+from collections.abc import Mapping
+import numpy as np
+from codec.codec import encode_varint, decode_varint, varint_sizes
+
+# Entradas por bloque: cada bloque se decodifica entero. Las listas de más de
+# un bloque tienen lista de saltos (último doc id, desplazamiento y cotas de
+# cada bloque); las de uno solo no guardan nada más que sus entradas
+POSTINGS_BLOCK = 128
+# Niveles de la cota de impacto cuantizada de cada bloque (uint8)
+IMPACT_LEVELS = 255
+
+def row_lengths(matrix: dict) -> np.ndarray:
+    # Nº de tokens de cada documento (suma de las frecuencias de su fila)
+    cumulative = np.concatenate(([0], np.cumsum(matrix["counts"], dtype = np.int64)))
+    return np.diff(cumulative[matrix["indptr"]])
+
+def narrow_uint(max_value: int, minimum = np.uint8) -> np.dtype:
+    # El entero sin signo más estrecho (a partir de minimum) que admite max_value
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if np.dtype(dtype).itemsize >= np.dtype(minimum).itemsize and max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"{max_value} no cabe en 64 bits")
+
+def round_up_float32(values: np.ndarray) -> np.ndarray:
+    # float32 nunca menor que el float64 original (las cotas siguen siendo cotas)
+    narrow = values.astype(np.float32)
+    below = narrow.astype(np.float64) < values
+    narrow[below] = np.nextafter(narrow[below], np.float32(np.inf))
+    return narrow
+
+def segment_reduce(ufunc, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # ufunc.reduceat sobre tramos [starts, ends) no vacíos y no necesariamente contiguos
+    padded = np.append(values, values[:1])
+    return ufunc.reduceat(padded, np.ravel(np.column_stack((starts, ends))))[::2]
+
+def build_postings(matrix: dict, vocabulary: list, idf: dict, norms: dict, lengths = None) -> dict:
+    """
+    Listas invertidas comprimidas a partir de la matriz CSR (traspuesta por
+    columnas): doc ids como huecos en varint y frecuencias en el entero sin
+    signo más estrecho que las admite, con los desplazamientos de cada
+    término (term_ptr en entradas, doc_ptr en bytes de doc_data).
+
+    Solo las listas de más de POSTINGS_BLOCK entradas (skip_terms) tienen
+    lista de saltos: por bloque, el último doc id y dónde empiezan sus bytes
+    (saltos sin decodificar), su contribución máxima al coseno cuantizada en
+    IMPACT_LEVELS niveles respecto a la del término (para saltar bloques
+    enteros en el top-k) y, para las cotas de otros scorers (BM25), la
+    frecuencia máxima y la longitud mínima de documento; y por término las
+    mismas cotas (la del coseno en float32 redondeada hacia arriba). Las
+    cotas de las listas de un solo bloque se calculan al abrirlas, que es
+    cuando se decodifican.
+
+    Los pesos no se guardan: se recalculan como (tf / longitud) * idf, la
+    misma operación que compute_sparse_tfidf_from_counts. lengths es la
+    longitud de cada fila si no es la suma de sus frecuencias (índice podado).
+    """
+    doc_ids = np.asarray(matrix["doc_ids"], dtype = np.int64)
+    indptr = matrix["indptr"]
+    lengths = row_lengths(matrix) if lengths is None else np.asarray(lengths, dtype = np.int64)
+    row_norms = np.array([norms.get(doc_id, 0.0) for doc_id in matrix["doc_ids"]], dtype = np.float64)
+    term_idf = np.array([idf.get(term, 0.0) for term in vocabulary], dtype = np.float64)
+
+    # Entradas ordenadas por término y, dentro de cada término, por fila (doc id)
+    rows = np.repeat(np.arange(len(doc_ids)), np.diff(indptr))
+    order = np.argsort(matrix["indices"], kind = "stable")
+    columns = matrix["indices"][order].astype(np.int64)
+    rows = rows[order]
+    post_docs = doc_ids[rows]
+    post_tfs = matrix["counts"][order].astype(np.int64)
+    post_lengths = lengths[rows]
+
+    df = np.bincount(columns, minlength = len(vocabulary))
+    term_ptr = np.concatenate(([0], np.cumsum(df)))
+
+    # Huecos entre doc ids dentro de cada término (el primero va tal cual)
+    gaps = np.diff(post_docs, prepend = 0)
+    firsts = term_ptr[:-1][df > 0]
+    gaps[firsts] = post_docs[firsts]
+    doc_bytes = np.concatenate(([0], np.cumsum(varint_sizes(gaps))))
+
+    # Tipos: desplazamientos y doc ids de al menos 32 bits, el resto lo justo
+    offset_type = narrow_uint(max(int(term_ptr[-1]), int(doc_bytes[-1])), np.uint32)
+    doc_type = narrow_uint(int(doc_ids.max()) if len(doc_ids) else 0, np.uint32)
+    tf_type = narrow_uint(int(post_tfs.max()) if len(post_tfs) else 0)
+    length_type = narrow_uint(int(lengths.max()) if len(lengths) else 0)
+
+    # Listas largas: bloques de POSTINGS_BLOCK entradas desde el principio de cada una
+    skip_terms = np.flatnonzero(df > POSTINGS_BLOCK)
+    term_blocks = (df[skip_terms] + POSTINGS_BLOCK - 1) // POSTINGS_BLOCK
+    skip_ptr = np.concatenate(([0], np.cumsum(term_blocks)))
+    block_starts = np.concatenate([
+        np.arange(term_ptr[i], term_ptr[i + 1], POSTINGS_BLOCK)
+        for i in skip_terms
+    ]) if len(skip_terms) else np.zeros(0, dtype = np.int64)
+    block_ends = np.minimum(block_starts + POSTINGS_BLOCK, np.repeat(term_ptr[skip_terms + 1], term_blocks))
+
+    max_scores = np.zeros(len(skip_terms), dtype = np.float32)
+    max_tfs = np.zeros(len(skip_terms), dtype = tf_type)
+    min_lengths = np.zeros(len(skip_terms), dtype = length_type)
+    block_impacts = np.zeros(len(block_starts), dtype = np.uint8)
+    block_max_tfs = np.zeros(len(block_starts), dtype = tf_type)
+    block_min_lengths = np.zeros(len(block_starts), dtype = length_type)
+    if len(block_starts):
+        # Contribución máxima al coseno de cada entrada: peso / norma del documento
+        long_entries = np.concatenate([np.arange(term_ptr[i], term_ptr[i + 1]) for i in skip_terms])
+        long_rows = rows[long_entries]
+        weights = (post_tfs[long_entries] / lengths[long_rows]) * term_idf[columns[long_entries]]
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            long_scores = np.where(row_norms[long_rows] > 0, weights / row_norms[long_rows], 0.0)
+        scores = np.zeros(len(post_docs), dtype = np.float64)
+        scores[long_entries] = long_scores
+
+        block_max = segment_reduce(np.maximum, scores, block_starts, block_ends)
+        block_max_tfs = segment_reduce(np.maximum, post_tfs, block_starts, block_ends).astype(tf_type)
+        block_min_lengths = segment_reduce(np.minimum, post_lengths, block_starts, block_ends).astype(length_type)
+        max_scores = round_up_float32(np.maximum.reduceat(block_max, skip_ptr[:-1]))
+        max_tfs = np.maximum.reduceat(block_max_tfs, skip_ptr[:-1])
+        min_lengths = np.minimum.reduceat(block_min_lengths, skip_ptr[:-1])
+        block_terms = np.repeat(np.arange(len(skip_terms)), term_blocks)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            levels = np.ceil(block_max / max_scores[block_terms].astype(np.float64) * IMPACT_LEVELS)
+        block_impacts = np.clip(np.nan_to_num(levels), 0, IMPACT_LEVELS).astype(np.uint8)
+
+    return {
+        "term_ptr": term_ptr.astype(offset_type),
+        "doc_ptr": doc_bytes[term_ptr].astype(offset_type),
+        "doc_data": encode_varint(gaps),
+        "tf_data": post_tfs.astype(tf_type),
+        "skip_terms": skip_terms.astype(narrow_uint(len(vocabulary), np.uint32)),
+        "skip_ptr": skip_ptr.astype(offset_type),
+        "max_scores": max_scores,
+        "max_tfs": max_tfs,
+        "min_lengths": min_lengths,
+        "block_last": post_docs[block_ends - 1].astype(doc_type),
+        "block_doc_ptr": doc_bytes[block_starts].astype(offset_type),
+        "block_impacts": block_impacts,
+        "block_max_tfs": block_max_tfs,
+        "block_min_lengths": block_min_lengths
+    }
+
+def postings_nbytes(arrays: dict) -> int:
+    return int(sum(array.nbytes for array in arrays.values()))
+
+class PostingsIndex(Mapping):
+    """
+    Vista {término: PostingList} sobre los arrays de build_postings (en
+    memoria o mapeados desde el fichero del índice). No se decodifica nada
+    hasta que se recorre una lista, y solo los bloques que se visitan.
+    doc_ids, lengths y norms son el doc id, la longitud y la norma de cada
+    fila de la matriz (doc ids crecientes, como los ordena build_postings).
+    """
+
+    def __init__(self, vocabulary: list, idf: dict, arrays: dict, doc_ids, lengths, norms):
+        self.vocabulary = vocabulary
+        self.term_index = {term: i for i, term in enumerate(vocabulary)}
+        self._idf = idf
+        self.arrays = arrays
+        self.doc_ids = np.asarray(doc_ids, dtype = np.int64)
+        self.row_lengths = np.asarray(lengths, dtype = np.int64)
+        self.row_norms = np.asarray(norms, dtype = np.float64)
+        self.lengths = dict(zip(self.doc_ids.tolist(), self.row_lengths.tolist()))
+        self.norms = dict(zip(self.doc_ids.tolist(), self.row_norms.tolist()))
+
+    def __getitem__(self, term):
+        return PostingList(self, self.term_index[term], self._idf[term])
+
+    def __contains__(self, term):
+        return term in self.term_index
+
+    def __iter__(self):
+        return iter(self.term_index)
+
+    def __len__(self):
+        return len(self.term_index)
+
+    def nbytes(self) -> int:
+        return postings_nbytes(self.arrays)
+
+    def gather(self, term_ids) -> dict:
+        """
+        Entradas de las listas de term_ids, una lista tras otra y cada una en
+        orden de doc id, para puntuar por lotes: fila de la matriz (rows),
+        frecuencia (tfs), longitud del documento (lengths) e idf del término
+        (idf) de cada entrada, y cuántas entradas tiene cada lista (sizes).
+        """
+        arrays = self.arrays
+        term_ptr, doc_ptr = arrays["term_ptr"], arrays["doc_ptr"]
+        bounds = [(int(term_ptr[t]), int(term_ptr[t + 1]), int(doc_ptr[t]), int(doc_ptr[t + 1])) for t in term_ids]
+        sizes = np.array([end - start for start, end, _, _ in bounds], dtype = np.int64)
+        if not sizes.sum():
+            empty = np.zeros(0, dtype = np.int64)
+            return {"rows": empty, "tfs": empty, "lengths": empty, "idf": np.zeros(0, dtype = np.float64), "sizes": sizes}
+
+        gaps = decode_varint(np.concatenate([arrays["doc_data"][lo:hi] for _, _, lo, hi in bounds]))
+        tfs = np.concatenate([arrays["tf_data"][start:end] for start, end, _, _ in bounds]).astype(np.int64)
+
+        # Los huecos se acumulan por separado en cada lista
+        totals = np.concatenate(([0], np.cumsum(gaps)))
+        docs = totals[1:] - np.repeat(totals[np.cumsum(sizes) - sizes], sizes)
+        rows = np.searchsorted(self.doc_ids, docs)
+        term_idf = [self._idf[self.vocabulary[t]] for t in term_ids]
+        return {
+            "rows": rows,
+            "tfs": tfs,
+            "lengths": self.row_lengths[rows],
+            "idf": np.repeat(np.array(term_idf, dtype = np.float64), sizes),
+            "sizes": sizes
+        }
+
+class PostingList:
+    def __init__(self, postings: PostingsIndex, term_id: int, idf: float):
+        arrays = postings.arrays
+        self.postings = postings
+        self.idf = idf
+        self.start = int(arrays["term_ptr"][term_id])
+        self.end = int(arrays["term_ptr"][term_id + 1])
+        self.doc_start = int(arrays["doc_ptr"][term_id])
+        self.doc_end = int(arrays["doc_ptr"][term_id + 1])
+        self.df = self.end - self.start
+
+        # Posición en la lista de saltos (solo las listas de más de un bloque)
+        self.skip = None
+        if self.df > POSTINGS_BLOCK:
+            skip_terms = arrays["skip_terms"]
+            self.skip = int(np.searchsorted(skip_terms, term_id))
+
+    def __len__(self):
+        return self.df
+
+    def iterator(self):
+        return PostingsIterator(self)
+
+    def doc_ids(self) -> list:
+        # Lista completa decodificada (para conjuntos de candidatos)
+        doc_data = self.postings.arrays["doc_data"]
+        return np.cumsum(decode_varint(doc_data[self.doc_start:self.doc_end])).tolist()
+
+class PostingsIterator:
+    """
+    Cursor sobre una PostingList en orden de doc id:
+    - doc: doc id actual (None al terminar),
+    - next(): siguiente entrada,
+    - advance(target): primera entrada con doc id >= target, saltando por la
+      lista de últimos doc ids de los bloques sin decodificar los intermedios,
+    - tf() y weight(): frecuencia y peso TF-IDF de la entrada actual,
+    - block_bound(target) y block_last(target): cota de contribución y último
+      doc id del bloque que contendría a target (sin decodificarlo),
+    - block_stats(target): frecuencia máxima y longitud mínima de ese bloque.
+    Una lista de un solo bloque se decodifica al abrirla y sus cotas
+    (max_score, max_tf, min_length) se calculan entonces.
+    """
+
+    def __init__(self, posting_list: PostingList):
+        postings = posting_list.postings
+        arrays = postings.arrays
+
+        self._arrays = arrays
+        self._list = posting_list
+        self._lengths = postings.lengths
+        self.idf = posting_list.idf
+        self._block = -1
+        self._docs = []
+        self._tfs = []
+        self._i = 0
+        self.doc = None
+
+        skip = posting_list.skip
+        if skip is not None:
+            first, end = int(arrays["skip_ptr"][skip]), int(arrays["skip_ptr"][skip + 1])
+            self._first = first
+            self.max_score = float(arrays["max_scores"][skip])
+            self.max_tf = int(arrays["max_tfs"][skip])
+            self.min_length = int(arrays["min_lengths"][skip])
+            self._lasts = arrays["block_last"][first:end].tolist()
+            self._impacts = arrays["block_impacts"][first:end].tolist()
+            self._doc_ptrs = arrays["block_doc_ptr"][first:end].tolist() + [posting_list.doc_end]
+            self._load(0)
+        elif posting_list.df:
+            self._first = None
+            self._doc_ptrs = [posting_list.doc_start, posting_list.doc_end]
+            self._lasts = [None]
+            self._load(0)
+            self._lasts = [self._docs[-1]]
+            self._impacts = [IMPACT_LEVELS]
+            self._list_bounds(postings.norms)
+        else:
+            self._first = None
+            self._lasts = []
+            self._impacts = []
+            self.max_score = 0.0
+            self.max_tf = 0
+            self.min_length = 0
+
+    def _list_bounds(self, norms: dict):
+        # Cotas de una lista de un solo bloque, con las mismas operaciones que build_postings
+        lengths = self._lengths
+        max_score = 0.0
+        min_length = None
+        for doc, tf in zip(self._docs, self._tfs):
+            length = lengths[doc]
+            norm = norms.get(doc, 0.0)
+            if norm > 0:
+                max_score = max(max_score, ((tf / length) * self.idf) / norm)
+            if min_length is None or length < min_length:
+                min_length = length
+        self.max_score = max_score
+        self.max_tf = max(self._tfs)
+        self.min_length = min_length
+
+    def _load(self, block: int):
+        arrays = self._arrays
+        start = self._list.start + block * POSTINGS_BLOCK
+        end = min(start + POSTINGS_BLOCK, self._list.end)
+
+        # El primer hueco del bloque es relativo al último doc id del anterior
+        base = self._lasts[block - 1] if block > 0 else 0
+        gaps = decode_varint(arrays["doc_data"][self._doc_ptrs[block]:self._doc_ptrs[block + 1]])
+        self._docs = (np.cumsum(gaps) + base).tolist()
+        self._tfs = arrays["tf_data"][start:end].tolist()
+        self._block = block
+        self._i = 0
+        self.doc = self._docs[0]
+
+    def next(self):
+        self._i += 1
+        if self._i < len(self._docs):
+            self.doc = self._docs[self._i]
+        elif self._block + 1 < len(self._lasts):
+            self._load(self._block + 1)
+        else:
+            self.doc = None
+        return self.doc
+
+    def advance(self, target: int):
+        if self.doc is None or self.doc >= target:
+            return self.doc
+
+        if target > self._lasts[self._block]:
+            block = bisect_left(self._lasts, target, self._block + 1)
+            if block == len(self._lasts):
+                self.doc = None
+                return None
+            self._load(block)
+
+        self._i = bisect_left(self._docs, target, self._i)
+        self.doc = self._docs[self._i]
+        return self.doc
+
+    def tf(self) -> int:
+        return self._tfs[self._i]
+
+    def weight(self) -> float:
+        return (self._tfs[self._i] / self._lengths[self.doc]) * self.idf
+
+    def _block_of(self, target: int) -> int:
+        return bisect_left(self._lasts, target, max(self._block, 0))
+
+    def block_bound(self, target: int) -> float:
+        block = self._block_of(target)
+        if block == len(self._lasts):
+            return 0.0
+        return self._impacts[block] / IMPACT_LEVELS * self.max_score
+
+    def block_last(self, target: int):
+        block = self._block_of(target)
+        if block == len(self._lasts):
+            return math.inf
+        return self._lasts[block]
+
+    def block_stats(self, target: int) -> tuple:
+        block = self._block_of(target)
+        if block == len(self._lasts):
+            return None
+        if self._first is None:
+            return self.max_tf, self.min_length
+        b = self._first + block
+        return int(self._arrays["block_max_tfs"][b]), int(self._arrays["block_min_lengths"][b])
+
+class SortedCursor:
+    """
+    Cursor con la interfaz de PostingsIterator (doc, next, advance) sobre una
+    lista ordenada de doc ids ya calculada. advance usa búsqueda galopante:
+    pasos de 1, 2, 4... desde la posición actual y bisección en el último
+    tramo, así que saltar d posiciones cuesta O(log d).
+    """
+
+    def __init__(self, doc_ids: list):
+        self._docs = doc_ids
+        self._i = 0
+        self.doc = doc_ids[0] if doc_ids else None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def next(self):
+        self._i += 1
+        self.doc = self._docs[self._i] if self._i < len(self._docs) else None
+        return self.doc
+
+    def advance(self, target: int):
+        if self.doc is None or self.doc >= target:
+            return self.doc
+
+        docs = self._docs
+        low = self._i
+        step = 1
+        while low + step < len(docs) and docs[low + step] < target:
+            low += step
+            step *= 2
+
+        self._i = bisect_left(docs, target, low + 1, min(low + step + 1, len(docs)))
+        self.doc = docs[self._i] if self._i < len(docs) else None
+        return self.doc
@@ -1,5 +1,6 @@
 import re
 import unicodedata
+from collections import OrderedDict
 from nltk.corpus import stopwords
 from nltk.stem.snowball import SnowballStemmer
 import nltk
@@ -9,6 +10,13 @@ try:
 except LookupError:
     nltk.download("stopwords")
 
+# Se calculan una sola vez al importar el módulo
+STOP_WORDS = frozenset(stopwords.words("spanish"))
+NON_WORD_RE = re.compile(r"[^a-záéíóúüñ0-9\s]")
+SPACES_RE = re.compile(r"\s+")
+# Un token es una secuencia de los caracteres que conserva lexical_analysis
+TOKEN_RE = re.compile(r"[a-záéíóúüñ0-9]+")
+
 def lexical_analysis(text: str) -> str:
     # Análisis léxico
     if not isinstance(text, str):
@@ -21,10 +29,10 @@ def lexical_analysis(text: str) -> str:
     text = text.lower()
 
     # Mantener solo letras (incluyendo tildes), números y espacios
-    text = re.sub(r"[^a-záéíóúüñ0-9\s]", " ", text)
+    text = NON_WORD_RE.sub(" ", text)
 
     # Quitar espacios múltiples
-    text = re.sub(r"\s+", " ", text).strip()
+    text = SPACES_RE.sub(" ", text).strip()
 
     return text
 
@@ -42,8 +50,7 @@ def remove_stopwords(tokens: list) -> list:
     if not isinstance(tokens, list):
         return[]
     
-    stop_words = set(stopwords.words("spanish"))
-    clean_tokens = [t for t in tokens if t not in stop_words]
+    clean_tokens = [t for t in tokens if t not in STOP_WORDS]
 
     return clean_tokens
 
@@ -62,10 +69,145 @@ def meaningful_tokens(tokens: list) -> list:
     return clean
 
 stemmer = SnowballStemmer("spanish")
+
+# Formas distintas que guarda como máximo la caché de raíces
+STEM_CACHE_SIZE = 100000
+
+class StemCache:
+    """
+    Caché LRU acotada forma -> raíz delante del stemmer. Por la ley de Zipf
+    casi todos los tokens son formas ya vistas, así que cada forma distinta se
+    pasa por el stemmer una sola vez.
+    """
+
+    def __init__(self, maxsize: int = STEM_CACHE_SIZE, stem = stemmer.stem):
+        self.maxsize = maxsize
+        self._stem = stem
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def stem(self, token: str) -> str:
+        cache = self._cache
+        stemmed = cache.get(token)
+
+        if stemmed is not None:
+            self.hits += 1
+            try:
+                cache.move_to_end(token)
+            except KeyError:
+                # Expulsada por otro hilo entre get y move_to_end
+                pass
+            return stemmed
+
+        self.misses += 1
+        stemmed = self._stem(token)
+        cache[token] = stemmed
+        if len(cache) > self.maxsize:
+            try:
+                cache.popitem(last = False)
+            except KeyError:
+                pass
+
+        return stemmed
+
+    def update(self, lexicon: dict):
+        # Precarga un léxico forma -> raíz (p. ej. el guardado junto al índice)
+        for token, stemmed in lexicon.items():
+            if len(self._cache) >= self.maxsize:
+                break
+            self._cache[token] = stemmed
+
+    def lexicon(self) -> dict:
+        return dict(self._cache)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+stem_cache = StemCache()
+
 def stem_tokens(tokens: list) -> list:
     if not isinstance(tokens, list):
         return []
     
-    stemmed = [stemmer.stem(token) for token in tokens]
+    stem = stem_cache.stem
+    stemmed = [stem(token) for token in tokens]
+
+    return stemmed
+
+def _normalize(text: str) -> str:
+    # NFKC (no cambia un texto ASCII) y minúsculas
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text)
+    return text.lower()
+
+def iter_terms(text: str, stem: bool = True):
+    """
+    Análisis completo en una sola pasada: normalización, tokenización,
+    palabras vacías, tokens cortos y stemming, generando los términos uno a
+    uno. Equivale a
+    stem_tokens(meaningful_tokens(remove_stopwords(tokenize(lexical_analysis(text))))).
+    """
+    if not isinstance(text, str):
+        return
+
+    stem_fn = stem_cache.stem
+
+    for token in TOKEN_RE.findall(_normalize(text)):
+        if token in STOP_WORDS or len(token) <= 2:
+            continue
+        yield stem_fn(token) if stem else token
+
+def analyze(text: str, stem: bool = True) -> list:
+    # Lo mismo que iter_terms, pero construyendo directamente la lista
+    if not isinstance(text, str):
+        return []
+
+    stop_words = STOP_WORDS
+    tokens = [
+        token
+        for token in TOKEN_RE.findall(_normalize(text))
+        if token not in stop_words and len(token) > 2
+    ]
+
+    if stem:
+        stem_fn = stem_cache.stem
+        tokens = [stem_fn(token) for token in tokens]
+
+    return tokens
+
+def analyze_positions(text: str, stem: bool = True) -> list:
+    """
+    Lo mismo que analyze, pero con la posición de cada término: su número de
+    token en el texto contando también palabras vacías y tokens cortos, para
+    que una frase como "recuperación de información" conserve el hueco.
+    """
+    if not isinstance(text, str):
+        return []
+
+    stop_words = STOP_WORDS
+    pairs = [
+        (token, position)
+        for position, token in enumerate(TOKEN_RE.findall(_normalize(text)))
+        if token not in stop_words and len(token) > 2
+    ]
+
+    if stem:
+        stem_fn = stem_cache.stem
+        pairs = [(stem_fn(token), position) for token, position in pairs]
+
+    return pairs
+
+def analyze_batch(texts: list, stem: bool = True) -> list:
+    # Análisis de muchos textos reutilizando regex, palabras vacías y caché de raíces
+    if not isinstance(texts, list):
+        return []
 
-    return stemmed
\ No newline at end of file
+    return [analyze(text, stem) for text in texts]
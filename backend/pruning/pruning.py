@@ -0,0 +1,189 @@
+"""
+Poda estática del índice: cada documento conserva solo sus términos de
+mayor impacto y cada lista invertida solo sus entradas de mayor impacto, a
+cambio de perder algo de calidad frente al índice completo. El impacto de una
+entrada es su aportación máxima al coseno, peso TF-IDF / norma del documento.
+
+La pérdida se mide con las mismas queries sobre los dos índices: recall@k
+(documentos del top-k completo que siguen en el top-k podado) y NDCG@k (con
+los scores del índice completo como relevancia).
+"""
+import math
+import random
+import time
+from collections import Counter
+import numpy as np
+from indexer.indexer import (
+    compute_sparse_tfidf_from_counts,
+    select_relevant_terms,
+    IndexStatistics,
+    make_scorer,
+    search_scored,
+    document_matrix_nbytes,
+    SCORERS
+)
+
+# Queries y profundidad con que se mide la pérdida de calidad
+EVALUATION_QUERIES = 200
+EVALUATION_K = 10
+QUERY_TERMS = (1, 3)
+
+def pruning_options(max_terms: int = None, min_impact: float = None, max_postings: int = None) -> dict:
+    """
+    Opciones de poda para build_corpus_index (None si no se poda nada):
+    - max_terms: términos de mayor peso TF-IDF que conserva cada documento,
+    - min_impact: impacto mínimo (peso / norma, entre 0 y 1) de un término
+      para conservarlo en un documento,
+    - max_postings: entradas de mayor impacto que conserva cada lista.
+    """
+    options = {"max_terms": max_terms, "min_impact": min_impact, "max_postings": max_postings}
+    options = {name: value for name, value in options.items() if value is not None}
+    return options or None
+
+def prune_counts(doc_counts: list, idf: dict, max_terms: int = None, min_impact: float = None,
+                 max_postings: int = None) -> list:
+    """
+    Frecuencias de cada documento solo con los términos que sobreviven a la
+    poda. Los impactos se calculan con los documentos completos; con varias
+    opciones un término tiene que cumplirlas todas. Una lista con más de
+    max_postings entradas conserva las de mayor impacto (a igual impacto, la
+    del documento anterior).
+    """
+    impacts = []
+    for counts in doc_counts:
+        tfidf = compute_sparse_tfidf_from_counts(counts, idf)
+        norm = math.sqrt(sum(w * w for _, w in sorted(tfidf.items())))
+        if norm == 0:
+            impacts.append({})
+            continue
+
+        kept = select_relevant_terms(tfidf, max_terms) if max_terms is not None else tfidf
+        impacts.append({
+            term: tfidf[term] / norm
+            for term in kept
+            if min_impact is None or tfidf[term] / norm >= min_impact
+        })
+
+    if max_postings is not None:
+        postings = {}
+        for position, doc_impacts in enumerate(impacts):
+            for term, impact in doc_impacts.items():
+                postings.setdefault(term, []).append((impact, position))
+
+        for term, entries in postings.items():
+            if len(entries) <= max_postings:
+                continue
+            entries.sort(key = lambda entry: (-entry[0], entry[1]))
+            for _, position in entries[max_postings:]:
+                del impacts[position][term]
+
+    return [
+        Counter({term: counts[term] for term in sorted(doc_impacts)})
+        for counts, doc_impacts in zip(doc_counts, impacts)
+    ]
+
+def sample_queries(index: dict, num_queries: int = EVALUATION_QUERIES, seed: int = 0) -> list:
+    """
+    Queries (listas de términos ya analizados) de 1 a 3 términos de un mismo
+    documento del índice, elegidos según su frecuencia en él, como las que
+    escribiría alguien que busca ese documento.
+    """
+    rng = random.Random(seed)
+    matrix = index["matrix"]
+    indptr = np.asarray(matrix["indptr"])
+    vocabulary = index["vocabulary"]
+    rows = [row for row in range(len(indptr) - 1) if indptr[row + 1] > indptr[row]]
+    if not rows:
+        return []
+
+    queries = []
+    for _ in range(num_queries):
+        row = rng.choice(rows)
+        start, end = int(indptr[row]), int(indptr[row + 1])
+        columns = matrix["indices"][start:end].tolist()
+        counts = matrix["counts"][start:end].tolist()
+        size = min(rng.randint(*QUERY_TERMS), len(columns))
+        terms = set()
+        while len(terms) < size:
+            terms.add(vocabulary[rng.choices(columns, weights = counts)[0]])
+        queries.append(sorted(terms))
+    return queries
+
+def ranking_quality(reference: dict, candidate: dict, k: int) -> tuple:
+    """
+    (recall@k, NDCG@k) del ranking candidate ({doc_id: score} ordenado)
+    respecto a reference: la relevancia de un documento es su score en
+    reference dividido entre el mejor (0 si no está en su top-k).
+    """
+    ideal = list(reference.items())[:k]
+    if not ideal or ideal[0][1] <= 0:
+        return None
+
+    best = ideal[0][1]
+    gains = {doc_id: score / best for doc_id, score in ideal}
+    retrieved = list(candidate)[:k]
+
+    recall = len(gains.keys() & set(retrieved)) / len(gains)
+    dcg = sum(gains.get(doc_id, 0.0) / math.log2(i + 2) for i, doc_id in enumerate(retrieved))
+    idcg = sum(gain / math.log2(i + 2) for i, gain in enumerate(sorted(gains.values(), reverse = True)))
+    return recall, dcg / idcg
+
+def index_size(index: dict) -> dict:
+    return {
+        "vocabulary": len(index["vocabulary"]),
+        "postings": int(len(index["matrix"]["indices"])),
+        "postings_bytes": index["wand_index"].nbytes(),
+        "matrix_bytes": document_matrix_nbytes(index["matrix"])
+    }
+
+def _timed_search(statistics, wand_index, tokens: list, k: int, scorer_name: str) -> tuple:
+    scorer = make_scorer(scorer_name, statistics)
+    stats = {}
+    start = time.perf_counter()
+    ranking = search_scored(scorer.prepare(tokens), wand_index, scorer, k, stats)
+    return ranking, time.perf_counter() - start, stats["postings_scored"]
+
+def evaluate_pruning(reference: dict, pruned: dict, queries: list, k: int = EVALUATION_K,
+                     scorer_names: list = None) -> dict:
+    """
+    Tamaño de los dos índices y, por scorer, recall@k y NDCG@k medios del
+    índice podado respecto al completo, con la latencia media y las entradas
+    evaluadas por query en cada uno. Las queries sin resultados en el índice
+    completo no cuentan.
+    """
+    reference_statistics = IndexStatistics(reference)
+    pruned_statistics = IndexStatistics(pruned)
+
+    report = {"k": k, "reference": index_size(reference), "pruned": index_size(pruned), "scorers": {}}
+    for scorer_name in scorer_names or sorted(SCORERS):
+        recalls = []
+        ndcgs = []
+        times = [0.0, 0.0]
+        postings = [0, 0]
+        for tokens in queries:
+            expected, elapsed, scored = _timed_search(reference_statistics, reference["wand_index"], tokens, k, scorer_name)
+            if not expected:
+                continue
+            times[0] += elapsed
+            postings[0] += scored
+
+            ranking, elapsed, scored = _timed_search(pruned_statistics, pruned["wand_index"], tokens, k, scorer_name)
+            times[1] += elapsed
+            postings[1] += scored
+
+            recall, ndcg = ranking_quality(expected, ranking, k)
+            recalls.append(recall)
+            ndcgs.append(ndcg)
+
+        count = len(recalls)
+        report["scorers"][scorer_name] = {
+            "queries": count,
+            "recall": sum(recalls) / count if count else None,
+            "ndcg": sum(ndcgs) / count if count else None,
+            "reference_ms": times[0] / count * 1000 if count else None,
+            "pruned_ms": times[1] / count * 1000 if count else None,
+            "reference_postings": postings[0] / count if count else None,
+            "pruned_postings": postings[1] / count if count else None
+        }
+
+    return report
@@ -0,0 +1,320 @@
+import re
+from processing.processing import analyze_positions
+from positions.positions import phrase_starts, within_distance, min_window
+from postings.postings import SortedCursor
+
+# Piezas de una query: "frase", paréntesis y palabras (incluidos AND, OR, NOT y NEAR/k)
+QUERY_TOKEN_RE = re.compile(r'"[^"]*"|[()]|[^\s()"]+')
+NEAR_OPERATOR_RE = re.compile(r"NEAR(?:/(\d+))?")
+BOOLEAN_OPERATORS = {"AND", "OR", "NOT"}
+DEFAULT_NEAR = 10
+# Peso de la proximidad en la ordenación con proximity: score * (1 + PROXIMITY_WEIGHT * cercanía)
+PROXIMITY_WEIGHT = 0.5
+# Documentos del top-k por coseno que se reordenan por proximidad
+PROXIMITY_CANDIDATES = 100
+
+class QueryParser:
+    """
+    Descenso recursivo sobre las piezas de la query. Gramática (de menor a
+    mayor precedencia):
+
+        or      := and ("OR" and)*
+        and     := unary (["AND"] unary)*
+        unary   := "NOT" unary | primary
+        primary := "(" or ")" | "frase" | palabra ("NEAR/k" palabra)*
+
+    Los nodos son tuplas (hashables, sirven de clave de caché):
+    ("term", t), ("phrase", ((t, desplazamiento), ...)), ("near", t1, t2, k),
+    ("and", (hijos...)), ("or", (hijos...)) y ("not", hijo).
+
+    Sin operadores booleanos (boolean = False) las palabras sueltas no
+    filtran: solo puntúan, y las frases y NEAR se combinan con AND.
+    Las palabras que no están bajo un NOT se guardan en positive: son las que
+    puntúan en el ranking.
+    """
+
+    def __init__(self, tokens: list, boolean: bool):
+        self.tokens = tokens
+        self.boolean = boolean
+        self.i = 0
+        self.positive = []
+        self.quoted = []
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.i += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or(False)
+        # Lo que quede (p. ej. un paréntesis sin abrir) se ignora
+        while self.peek() is not None:
+            self.take()
+            node = _combine("and", [node, self.parse_or(False)])
+        return node
+
+    def parse_or(self, negated: bool):
+        children = [self.parse_and(negated)]
+        while self.peek() == "OR":
+            self.take()
+            children.append(self.parse_and(negated))
+        return _combine("or", children)
+
+    def parse_and(self, negated: bool):
+        children = [self.parse_unary(negated)]
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            children.append(self.parse_unary(negated))
+        return _combine("and", children)
+
+    def parse_unary(self, negated: bool):
+        if self.peek() == "NOT":
+            self.take()
+            child = self.parse_unary(not negated)
+            return ("not", child) if child is not None else None
+        return self.parse_primary(negated)
+
+    def parse_primary(self, negated: bool):
+        token = self.take()
+        if token is None or token in BOOLEAN_OPERATORS:
+            return None
+
+        if token == "(":
+            node = self.parse_or(negated)
+            if self.peek() == ")":
+                self.take()
+            return node
+        if token == ")":
+            return None
+
+        if token.startswith('"'):
+            text = token.strip('"')
+            if not negated:
+                self.positive.append(text)
+                self.quoted.append(text)
+            return _phrase_node(text)
+
+        # Palabra, posiblemente encadenada con NEAR/k
+        if not negated:
+            self.positive.append(token)
+        node = _word_node(token) if self.boolean else None
+        near = []
+        left = token
+        while self.peek() is not None and NEAR_OPERATOR_RE.fullmatch(self.peek()):
+            distance = NEAR_OPERATOR_RE.fullmatch(self.take()).group(1)
+            right = self.take()
+            if right is None:
+                break
+            if not negated:
+                self.positive.append(right)
+            near_node = _near_node(left, right, int(distance) if distance else DEFAULT_NEAR)
+            if near_node is not None:
+                near.append(near_node)
+            left = right
+
+        if near:
+            return _combine("and", near)
+        return node
+
+def _combine(operator: str, children: list):
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return (operator, tuple(children))
+
+def _word_node(word: str):
+    # Una palabra puede dar varios términos (p. ej. "ciencia-ficción"): frase
+    pairs = analyze_positions(word)
+    if not pairs:
+        return None
+    if len(pairs) == 1:
+        return ("term", pairs[0][0])
+    return _phrase_node(word)
+
+def _phrase_node(text: str):
+    pairs = analyze_positions(text)
+    if not pairs:
+        return None
+    if len(pairs) == 1:
+        return ("term", pairs[0][0])
+    first = pairs[0][1]
+    return ("phrase", tuple((term, position - first) for term, position in pairs))
+
+def _near_node(left: str, right: str, distance: int):
+    left_terms = analyze_positions(left)
+    right_terms = analyze_positions(right)
+    if not left_terms or not right_terms:
+        return None
+    return ("near", left_terms[-1][0], right_terms[0][0], distance)
+
+def parse_query(query: str) -> dict:
+    """
+    Analiza la query:
+    - "frase exacta": los términos en posiciones consecutivas (respetando los
+      huecos de las palabras vacías),
+    - a NEAR/k b: a y b a k tokens o menos, en cualquier orden (se pueden
+      encadenar: a NEAR/3 b NEAR/5 c),
+    - AND, OR, NOT y paréntesis (en mayúsculas): filtro booleano; entre dos
+      operandos sin operador se entiende AND.
+    Devuelve el texto para el ranking (sin operadores ni lo negado), el texto
+    de las frases en quoted y el filtro como árbol de nodos (None si no hay).
+    """
+    if not isinstance(query, str):
+        return {"text": "", "quoted": [], "filter": None}
+
+    tokens = QUERY_TOKEN_RE.findall(query)
+    boolean = any(token in BOOLEAN_OPERATORS or token in "()" for token in tokens)
+
+    parser = QueryParser(tokens, boolean)
+    node = parser.parse()
+
+    return {"text": " ".join(parser.positive), "quoted": parser.quoted, "filter": node}
+
+def has_constraints(parsed: dict) -> bool:
+    return parsed["filter"] is not None
+
+def constraint_key(parsed: dict) -> tuple:
+    # Parte de la clave de caché que distingue "a b" de a b, de a NEAR b y de a AND b
+    return parsed["filter"]
+
+# Evaluación sobre las listas de index (SegmentedIndex): postings_cursor,
+# df, term_positions y live_ids
+
+def node_cost(index, node) -> int:
+    # Estimación del nº de documentos del nodo para ordenar las intersecciones
+    kind = node[0]
+    if kind == "term":
+        return index.df(node[1])
+    if kind == "phrase":
+        return min(index.df(term) for term, _ in node[1])
+    if kind == "near":
+        return min(index.df(node[1]), index.df(node[2]))
+    if kind == "and":
+        positive = [node_cost(index, child) for child in node[1] if child[0] != "not"]
+        return min(positive) if positive else len(index.live_ids())
+    if kind == "or":
+        return sum(node_cost(index, child) for child in node[1])
+    return len(index.live_ids())
+
+def _cursor(index, node):
+    # Los términos se recorren con el cursor de sus listas (saltos por bloques);
+    # el resto de nodos se evalúa y se recorre su lista con búsqueda galopante
+    if node[0] == "term":
+        return index.postings_cursor(node[1])
+    return SortedCursor(evaluate(index, node))
+
+def intersect(cursors: list, excluded: list = ()) -> list:
+    """
+    Intersección de cursores ordenados (el primero, el más corto, marca el
+    ritmo): se avanza cada uno hasta el candidato con advance y, si alguno lo
+    supera, ese doc id pasa a ser el nuevo candidato. Los documentos de
+    excluded (NOT) se descartan con advance sobre sus cursores.
+    """
+    if not cursors or any(cursor.doc is None for cursor in cursors):
+        return []
+
+    result = []
+    target = cursors[0].doc
+
+    while True:
+        for cursor in cursors:
+            doc = cursor.advance(target)
+            if doc is None:
+                return result
+            if doc > target:
+                target = doc
+                break
+        else:
+            if not any(cursor.advance(target) == target for cursor in excluded):
+                result.append(target)
+            target = cursors[0].next()
+            if target is None:
+                return result
+
+def evaluate(index, node) -> list:
+    # Doc ids (ordenados) de los documentos vivos que cumplen el nodo
+    kind = node[0]
+
+    if kind == "term":
+        cursor = index.postings_cursor(node[1])
+        doc_ids = []
+        while cursor.doc is not None:
+            doc_ids.append(cursor.doc)
+            cursor.next()
+        return doc_ids
+
+    if kind == "phrase":
+        terms = sorted({term for term, _ in node[1]}, key = index.df)
+        candidates = intersect([index.postings_cursor(term) for term in terms])
+        return [doc_id for doc_id in candidates if _matches_phrase(index, doc_id, node[1])]
+
+    if kind == "near":
+        _, a, b, distance = node
+        candidates = intersect([index.postings_cursor(term) for term in sorted({a, b}, key = index.df)])
+        return [
+            doc_id for doc_id in candidates
+            if within_distance(index.term_positions(doc_id, a), index.term_positions(doc_id, b), distance)
+        ]
+
+    if kind == "and":
+        positive = sorted((child for child in node[1] if child[0] != "not"), key = lambda child: node_cost(index, child))
+        negative = [child[1] for child in node[1] if child[0] == "not"]
+
+        if positive:
+            cursors = [_cursor(index, child) for child in positive]
+        else:
+            cursors = [SortedCursor(index.live_ids())]
+        return intersect(cursors, [_cursor(index, child) for child in negative])
+
+    if kind == "or":
+        doc_ids = set()
+        for child in node[1]:
+            doc_ids.update(evaluate(index, child))
+        return sorted(doc_ids)
+
+    # NOT sin nada con qué intersecar: el complemento (recorre todo el corpus)
+    excluded = set(evaluate(index, node[1]))
+    return [doc_id for doc_id in index.live_ids() if doc_id not in excluded]
+
+def match_documents(index, parsed: dict) -> set:
+    """
+    Documentos que cumplen el filtro de la query (frases, proximidades y
+    operadores booleanos). Las intersecciones van de la lista más corta a la
+    más larga y avanzan con saltos, así que el coste depende de las listas
+    implicadas y no del tamaño del corpus.
+    """
+    if parsed["filter"] is None:
+        return set()
+
+    return set(evaluate(index, parsed["filter"]))
+
+def _matches_phrase(index, doc_id, phrase: tuple) -> bool:
+    lists = [index.term_positions(doc_id, term) for term, _ in phrase]
+    return len(phrase_starts(lists, [offset for _, offset in phrase])) > 0
+
+def proximity_boost(index, ranking: dict, terms: list, k: int) -> dict:
+    """
+    Reordena un ranking premiando los documentos donde los términos de la
+    query aparecen juntos: cuanto menor es la ventana mínima que los contiene,
+    mayor el factor (1 + PROXIMITY_WEIGHT si están seguidos).
+    """
+    terms = sorted(set(terms))
+    boosted = {}
+
+    for doc_id, score in ranking.items():
+        lists = [index.term_positions(doc_id, term) for term in terms]
+        lists = [positions for positions in lists if len(positions)]
+        factor = 1.0
+        if len(lists) > 1:
+            factor += PROXIMITY_WEIGHT * (len(lists) - 1) / max(min_window(lists), 1)
+        boosted[doc_id] = score * factor
+
+    top = sorted(boosted.items(), key = lambda x: (-x[1], x[0]))[:k]
+
+    return dict(top)
@@ -0,0 +1,172 @@
+"""
+Lectores de documentos por extensión: cada tipo registra cómo sacar su texto
+completo (read) y, si puede, en trozos sin cargarlo entero (iter_chunks).
+crawler.py elige el lector de cada fichero con reader_for y guarda el texto
+de los que son caros de extraer (PDF, HTML) en la caché de extracción.
+
+Para añadir un tipo nuevo basta con register_reader(nombre, extensiones, read).
+"""
+import os
+import re
+import math
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Procesos para extraer las páginas de un PDF y nº mínimo de páginas para repartirlas
+PDF_WORKERS = os.cpu_count() or 1
+PDF_PARALLEL_PAGES = 32
+# Tramos de páginas por proceso (más de uno para repartir mejor las páginas caras)
+PDF_RANGES_PER_WORKER = 4
+# Analizador de HTML: "lxml" (si está instalado) o "html.parser" (BeautifulSoup, Python puro)
+HTML_PARSER = os.environ.get("RI_HTML_PARSER") or ("lxml" if lxml is not None else "html.parser")
+# Elementos cuyo contenido no es texto del documento (tampoco lo es para get_text)
+HTML_SKIPPED_TAGS = ("script", "style", "template")
+# Cierres de body y html: libxml2 descarta lo que venga detrás y BeautifulSoup no
+HTML_CLOSING_TAGS = re.compile(r"</(?:body|html)\s*>", re.IGNORECASE)
+
+READERS = {}
+_EXTENSIONS = {}
+
+def register_reader(name: str, extensions: tuple, read, iter_chunks = None, cacheable: bool = True,
+                    parallel: bool = False, cache_key: str = None):
+    """
+    Registra el lector name para las extensiones dadas (".pdf"; sustituye al
+    que hubiera para ellas):
+    - read(ruta) devuelve el texto completo ("" si no se puede leer) o, con
+      parallel, read(ruta, workers) para repartirlo entre procesos,
+    - iter_chunks(ruta), opcional, lo devuelve en trozos,
+    - cacheable indica si su texto se guarda en la caché de extracción (no
+      compensa para los que solo leen el fichero, como .txt); cache_key
+      (por defecto, name) separa en la caché los textos de versiones del
+      lector que no dan exactamente el mismo texto.
+    """
+    READERS[name] = {
+        "name": name,
+        "extensions": tuple(extension.lower() for extension in extensions),
+        "read": read,
+        "iter_chunks": iter_chunks,
+        "cacheable": cacheable,
+        "parallel": parallel,
+        "cache_key": cache_key or name
+    }
+    for extension in READERS[name]["extensions"]:
+        _EXTENSIONS[extension] = name
+
+def reader_for(filepath: str) -> dict:
+    # Lector de un fichero por su extensión (None si no es un tipo soportado)
+    extension = os.path.splitext(filepath)[1].lower()
+    name = _EXTENSIONS.get(extension)
+    return READERS[name] if name is not None else None
+
+def document_extensions() -> tuple:
+    return tuple(sorted(_EXTENSIONS))
+
+# Texto plano
+
+def read_txt(filepath) -> str:
+    with open(filepath, "r", encoding = "utf-8", errors = "ignore") as f:
+        return f.read()
+
+def iter_txt(filepath, chunk_chars: int = 256 * 1024):
+    # Texto en trozos de unos chunk_chars caracteres, cortados tras un salto de línea
+    with open(filepath, "r", encoding = "utf-8", errors = "ignore") as f:
+        while True:
+            chunk = f.read(chunk_chars)
+            if not chunk:
+                break
+            yield chunk + f.readline()
+
+# PDF
+
+def iter_pdf(filepath):
+    # Texto página a página
+    try:
+        with open(filepath, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            for page in reader.pages:
+                extracted = page.extract_text()
+                if extracted:
+                    yield extracted + "\n"
+    except Exception as e:
+        print(f"Error leyendo PDF {filepath}: {e}")
+
+def pdf_pages_text(filepath, start: int, end: int) -> list:
+    # Texto de las páginas [start, end) de un PDF (cada proceso abre el fichero)
+    with open(filepath, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def read_pdf(filepath, workers: int = PDF_WORKERS) -> str:
+    """
+    Texto de un PDF con el mismo formato que iter_pdf. Si tiene al menos
+    PDF_PARALLEL_PAGES páginas, se reparten por tramos entre workers procesos
+    y se juntan en orden.
+    """
+    try:
+        with open(filepath, "rb") as f:
+            num_pages = len(PyPDF2.PdfReader(f).pages)
+
+        if workers <= 1 or num_pages < PDF_PARALLEL_PAGES:
+            pages = pdf_pages_text(filepath, 0, num_pages)
+        else:
+            size = math.ceil(num_pages / (workers * PDF_RANGES_PER_WORKER))
+            starts = list(range(0, num_pages, size))
+            ends = [min(start + size, num_pages) for start in starts]
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                ranges = executor.map(pdf_pages_text, [filepath] * len(starts), starts, ends)
+                pages = [text for texts in ranges for text in texts]
+    except Exception as e:
+        # Con un error, lo que se pueda leer página a página
+        print(f"Error leyendo PDF {filepath} por páginas: {e}")
+        return "".join(iter_pdf(filepath))
+
+    return "".join(text + "\n" for text in pages if text)
+
+# HTML
+
+def _read_html_file(filepath) -> str:
+    with open(filepath, "r", encoding = "utf-8", errors = "ignore") as f:
+        return f.read()
+
+def html_text_soup(html: str, parser: str = "html.parser") -> str:
+    return BeautifulSoup(html, parser).get_text(separator = " ")
+
+def html_text_lxml(html: str) -> str:
+    """
+    Texto de un HTML con lxml, unas diez veces más rápido que BeautifulSoup:
+    los mismos textos que get_text(separator = " ") (sin scripts, estilos ni
+    comentarios), aunque los espacios entre bloques pueden variar.
+    """
+    document = lxml.html.document_fromstring(HTML_CLOSING_TAGS.sub("", html))
+    for element in list(document.iter(*HTML_SKIPPED_TAGS)):
+        element.text = None
+        for child in list(element):
+            element.remove(child)
+    return " ".join(document.itertext())
+
+def read_html(filepath, parser: str = None) -> str:
+    parser = parser or HTML_PARSER
+    try:
+        html = _read_html_file(filepath)
+        if not html.strip():
+            return ""
+        if parser == "lxml" and lxml is not None:
+            try:
+                return html_text_lxml(html)
+            except (ValueError, lxml.etree.LxmlError):
+                # p. ej. una declaración de codificación en el texto ya decodificado
+                pass
+        return html_text_soup(html, "html.parser" if parser == "lxml" else parser)
+    except Exception as e:
+        print(f"Error leyendo HTML {filepath}: {e}")
+        return ""
+
+register_reader("txt", (".txt",), read_txt, iter_txt, cacheable = False)
+register_reader("pdf", (".pdf",), read_pdf, iter_pdf, parallel = True)
+register_reader("html", (".html", ".htm"), read_html, cache_key = f"html-{HTML_PARSER}")
@@ -0,0 +1,490 @@
+import math
+import threading
+from collections import Counter
+import numpy as np
+from corpus.corpus import build_index_from_counts, title_terms
+from snippets.snippets import build_passages, document_passages
+from positions.positions import text_positions, document_positions, entry_positions
+from postings.postings import SortedCursor
+from indexer.indexer import TfidfCosineScorer
+
+# Documentos en el segmento en memoria antes de sellarlo
+MEMTABLE_DOCS = 8
+# Segmentos sellados a partir de los cuales se fusionan en uno
+MAX_SEGMENTS = 4
+# Cambios pendientes (altas + bajas) respecto al tamaño de la base que disparan
+# la compactación en un índice base nuevo
+COMPACTION_RATIO = 0.25
+
+def new_segment() -> dict:
+    return {"documents": {}, "counts": {}, "positions": {}, "postings": {}}
+
+def add_to_segment(segment: dict, doc: dict, counts: Counter, positions: dict):
+    doc_id = doc["id"]
+    segment["documents"][doc_id] = doc
+    segment["counts"][doc_id] = counts
+    segment["positions"][doc_id] = positions
+
+    for term in counts:
+        segment["postings"].setdefault(term, set()).add(doc_id)
+
+def merge_segments(segments: list, deleted: set) -> dict:
+    # Fusiona varios segmentos en uno descartando los documentos borrados
+    merged = new_segment()
+
+    for segment in segments:
+        for doc_id, doc in segment["documents"].items():
+            if doc_id not in deleted:
+                add_to_segment(merged, doc, segment["counts"][doc_id], segment["positions"][doc_id])
+
+    return merged
+
+class SegmentedIndex:
+    """
+    Índice incremental estilo LSM sobre el índice base (inmutable, el de
+    build_corpus_index o el cargado de disco):
+
+    - las altas van a un segmento en memoria que se sella al llenarse,
+    - las bajas de documentos de la base o de segmentos sellados son lápidas,
+    - df y N se mantienen con deltas, así que el IDF está siempre al día,
+    - en segundo plano se fusionan segmentos y, cuando hay bastantes cambios,
+      se compacta todo en un índice base nuevo a partir de las frecuencias ya
+      calculadas (sin reprocesar textos) y se publica con on_compact.
+
+    Mientras haya cambios pendientes, search puntúa (por defecto con el coseno
+    TF-IDF) con las estadísticas actuales, igual que daría un índice
+    reconstruido. Ofrece la misma interfaz de estadísticas que
+    IndexStatistics, así que sirve para cualquier scorer de indexer.
+    """
+
+    def __init__(self, base: dict, on_compact = None, memtable_docs: int = MEMTABLE_DOCS,
+                 max_segments: int = MAX_SEGMENTS, compaction_ratio: float = COMPACTION_RATIO):
+        self._lock = threading.RLock()
+        self.on_compact = on_compact
+        self._maintenance = None
+        self.memtable_docs = memtable_docs
+        self.max_segments = max_segments
+        self.compaction_ratio = compaction_ratio
+        self.version = 0
+        self.next_id = 0
+        self._reset(base)
+
+    def _reset(self, base: dict):
+        self.base = base
+        self._base_term_index = {term: i for i, term in enumerate(base["vocabulary"])}
+        self._base_rows = {doc_id: row for row, doc_id in enumerate(base["matrix"]["doc_ids"])}
+        self._base_documents = {doc["id"]: doc for doc in base["documents"]}
+        self.names = {doc["name"]: doc["id"] for doc in base["documents"]}
+        self.num_docs = len(base["documents"])
+        self.total_length = int(np.sum(base["lengths"]))
+        self.total_title_length = sum(len(doc["title_terms"]) for doc in base["documents"])
+        self.df_delta = Counter()
+        self.deleted = set()
+        self.memtable = new_segment()
+        self.segments = []
+        self.next_id = max(self.next_id, max(self._base_documents, default = -1) + 1)
+        self._doc_stats = {}
+
+    def with_base(self, fn):
+        # Llama a fn con el índice base actual sin que una compactación lo
+        # sustituya mientras tanto (p. ej. para publicarlo)
+        with self._lock:
+            return fn(self.base)
+
+    # Estadísticas globales
+
+    def df(self, term: str) -> int:
+        base_df = 0
+        i = self._base_term_index.get(term)
+        if i is not None:
+            base_df = int(self.base["df"][i])
+        return base_df + self.df_delta.get(term, 0)
+
+    def idf(self, term: str) -> float:
+        # Misma fórmula que compute_idf; 0 si el término no está en el corpus
+        term_df = self.df(term)
+        if term_df <= 0 or self.num_docs == 0:
+            return 0
+        return math.log(self.num_docs / (1 + term_df)) + 1
+
+    def avg_length(self) -> float:
+        return self.total_length / self.num_docs if self.num_docs else 0.0
+
+    def avg_title_length(self) -> float:
+        return self.total_title_length / self.num_docs if self.num_docs else 0.0
+
+    def has_pending(self) -> bool:
+        return bool(self.memtable["documents"] or self.segments or self.deleted)
+
+    def pending_changes(self) -> int:
+        added = len(self.memtable["documents"]) + sum(len(s["documents"]) for s in self.segments)
+        return added + len(self.deleted)
+
+    # Acceso a documentos
+
+    def _segment_of(self, doc_id):
+        if doc_id in self.memtable["documents"]:
+            return self.memtable
+        for segment in self.segments:
+            if doc_id in segment["documents"]:
+                return segment
+        return None
+
+    def get_document(self, doc_id):
+        if doc_id in self.deleted:
+            return None
+
+        segment = self._segment_of(doc_id)
+        if segment is not None:
+            return segment["documents"][doc_id]
+
+        return self._base_documents.get(doc_id)
+
+    def live_documents(self) -> list:
+        with self._lock:
+            return [self.get_document(doc_id) for doc_id in sorted(self.names.values())]
+
+    def _doc_counts(self, doc_id) -> Counter:
+        segment = self._segment_of(doc_id)
+        if segment is not None:
+            return segment["counts"][doc_id]
+
+        # Fila de la matriz CSR de la base
+        matrix = self.base["matrix"]
+        row = self._base_rows[doc_id]
+        start, end = matrix["indptr"][row], matrix["indptr"][row + 1]
+        vocabulary = self.base["vocabulary"]
+
+        return Counter({
+            vocabulary[column]: count
+            for column, count in zip(matrix["indices"][start:end].tolist(), matrix["counts"][start:end].tolist())
+        })
+
+    def _doc_passages(self, doc_id) -> dict:
+        # Los pasajes de la base se reutilizan; solo se segmentan los documentos nuevos
+        segment = self._segment_of(doc_id)
+        if segment is not None:
+            return build_passages(segment["documents"][doc_id]["text"])
+
+        return document_passages(self.base["passages"], self.base["matrix"], self.base["vocabulary"], self._base_rows[doc_id])
+
+    def _doc_positions(self, doc_id) -> dict:
+        segment = self._segment_of(doc_id)
+        if segment is not None:
+            return segment["positions"][doc_id]
+
+        return document_positions(self.base["positions"], self.base["matrix"], self.base["vocabulary"], self._base_rows[doc_id])
+
+    def _base_entry(self, doc_id, term: str):
+        # Entrada de la matriz CSR de la base para (documento, término), o None
+        column = self._base_term_index.get(term)
+        if column is None:
+            return None
+
+        matrix = self.base["matrix"]
+        row = self._base_rows[doc_id]
+        start, end = matrix["indptr"][row], matrix["indptr"][row + 1]
+        pos = start + int(np.searchsorted(matrix["indices"][start:end], column))
+        if pos < end and matrix["indices"][pos] == column:
+            return pos
+        return None
+
+    def _term_count(self, doc_id, term: str) -> int:
+        segment = self._segment_of(doc_id)
+        if segment is not None:
+            return segment["counts"][doc_id].get(term, 0)
+
+        entry = self._base_entry(doc_id, term)
+        if entry is None:
+            return 0
+        return int(self.base["matrix"]["counts"][entry])
+
+    def term_positions(self, doc_id, term: str) -> np.ndarray:
+        # Posiciones (ordenadas) de un término en un documento vivo
+        with self._lock:
+            segment = self._segment_of(doc_id)
+            if segment is not None:
+                return np.asarray(segment["positions"][doc_id].get(term, []), dtype = np.int64)
+
+            entry = self._base_entry(doc_id, term)
+            if entry is None:
+                return np.zeros(0, dtype = np.int64)
+            return entry_positions(self.base["positions"], entry)
+
+    def documents_with(self, term: str) -> set:
+        # Documentos vivos que contienen el término (base y segmentos)
+        with self._lock:
+            doc_ids = set()
+            if term in self._base_term_index:
+                doc_ids.update(self.base["wand_index"][term].doc_ids())
+            for segment in [self.memtable] + self.segments:
+                doc_ids.update(segment["postings"].get(term, ()))
+            return doc_ids - self.deleted
+
+    def postings_cursor(self, term: str):
+        """
+        Cursor (doc, next, advance) sobre los documentos vivos con el término.
+        Sin cambios pendientes es el de las listas comprimidas de la base, que
+        salta bloques sin decodificarlos; si no, la lista ya combinada.
+        """
+        with self._lock:
+            if not self.has_pending() and term in self._base_term_index:
+                return self.base["wand_index"][term].iterator()
+            return SortedCursor(sorted(self.documents_with(term)))
+
+    def live_ids(self) -> list:
+        with self._lock:
+            return sorted(self.names.values())
+
+    def _length_and_norm(self, doc_id) -> tuple:
+        # Longitud y norma TF-IDF del documento con el IDF actual (cacheadas por versión)
+        stats = self._doc_stats.get(doc_id)
+        if stats is None:
+            counts = self._doc_counts(doc_id)
+            # En la base, la longitud guardada (la del documento completo si está podada)
+            row = None if self._segment_of(doc_id) is not None else self._base_rows[doc_id]
+            length = sum(counts.values()) if row is None else int(self.base["lengths"][row])
+            if length == 0:
+                return (0, 0.0)
+            weights = [(count / length) * self.idf(term) for term, count in sorted(counts.items())]
+            stats = (length, math.sqrt(sum(w * w for w in weights)))
+            self._doc_stats[doc_id] = stats
+        return stats
+
+    def doc_length(self, doc_id) -> int:
+        return self._length_and_norm(doc_id)[0]
+
+    def doc_norm(self, doc_id) -> float:
+        return self._length_and_norm(doc_id)[1]
+
+    def title_counts(self, doc_id) -> Counter:
+        doc = self.get_document(doc_id)
+        return Counter(doc.get("title_terms", ())) if doc is not None else Counter()
+
+    # Altas, modificaciones y bajas
+
+    def _insert(self, doc: dict, counts: Counter, positions: dict):
+        add_to_segment(self.memtable, doc, counts, positions)
+        for term in counts:
+            self.df_delta[term] += 1
+        self.num_docs += 1
+        self.total_length += sum(counts.values())
+        self.total_title_length += len(doc["title_terms"])
+        self.names[doc["name"]] = doc["id"]
+
+    def _remove(self, doc_id):
+        doc = self.get_document(doc_id)
+        counts = self._doc_counts(doc_id)
+
+        for term in counts:
+            self.df_delta[term] -= 1
+        self.num_docs -= 1
+        self.total_length -= self.doc_length(doc_id)
+        self.total_title_length -= len(doc["title_terms"])
+        self.names.pop(doc["name"], None)
+
+        if doc_id in self.memtable["documents"]:
+            del self.memtable["documents"][doc_id]
+            del self.memtable["counts"][doc_id]
+            del self.memtable["positions"][doc_id]
+            for term in counts:
+                postings = self.memtable["postings"][term]
+                postings.discard(doc_id)
+                if not postings:
+                    del self.memtable["postings"][term]
+        else:
+            self.deleted.add(doc_id)
+
+    def _mutated(self):
+        self.version += 1
+        self._doc_stats = {}
+
+        if len(self.memtable["documents"]) >= self.memtable_docs:
+            self.segments.append(self.memtable)
+            self.memtable = new_segment()
+
+        self._schedule_maintenance()
+
+    def add_document(self, name: str, text: str) -> int:
+        # El procesamiento del texto se hace fuera del cerrojo
+        positions = text_positions(text)
+        counts = Counter({term: len(term_positions) for term, term_positions in positions.items()})
+        title = title_terms(name)
+
+        with self._lock:
+            if name in self.names:
+                raise ValueError(f"El documento {name} ya está indexado")
+
+            doc_id = self.next_id
+            self.next_id += 1
+            self._insert({"id": doc_id, "name": name, "text": text, "title_terms": title}, counts, positions)
+            self._mutated()
+
+        return doc_id
+
+    def update_document(self, name: str, text: str) -> int:
+        positions = text_positions(text)
+        counts = Counter({term: len(term_positions) for term, term_positions in positions.items()})
+        title = title_terms(name)
+
+        with self._lock:
+            if name not in self.names:
+                raise KeyError(name)
+
+            self._remove(self.names[name])
+            doc_id = self.next_id
+            self.next_id += 1
+            self._insert({"id": doc_id, "name": name, "text": text, "title_terms": title}, counts, positions)
+            self._mutated()
+
+        return doc_id
+
+    def delete_document(self, name: str):
+        with self._lock:
+            if name not in self.names:
+                raise KeyError(name)
+
+            self._remove(self.names[name])
+            self._mutated()
+
+    # Búsqueda
+
+    def search(self, tokens: list, k: int, doc_ids: set = None, scorer = None, stats: dict = None) -> dict:
+        """
+        Top-k según scorer (por defecto, similitud coseno TF-IDF) con las
+        estadísticas actuales, recorriendo solo los documentos que contienen
+        algún término de la query (y, si se indica doc_ids, solo entre esos
+        documentos). Si se pasa stats, se rellena con los documentos
+        puntuados y las entradas (documento, término) evaluadas, como en
+        search_scored.
+        """
+        if not isinstance(tokens, list) or not tokens or k <= 0:
+            return {}
+
+        with self._lock:
+            if scorer is None:
+                scorer = TfidfCosineScorer(self)
+
+            query_terms = scorer.prepare(tokens)
+            if not query_terms:
+                return {}
+
+            # Candidatos: los documentos pedidos o las listas de la base y de
+            # los segmentos, sin lápidas
+            if doc_ids is not None:
+                candidates = set(doc_ids) - self.deleted
+            else:
+                candidates = set()
+                for term, _ in query_terms:
+                    if term in self._base_term_index:
+                        candidates.update(self.base["wand_index"][term].doc_ids())
+                    for segment in [self.memtable] + self.segments:
+                        candidates.update(segment["postings"].get(term, ()))
+                candidates -= self.deleted
+
+            results = {}
+            postings_scored = 0
+            for doc_id in candidates:
+                length = self.doc_length(doc_id)
+                if length == 0:
+                    continue
+
+                total = 0.0
+                for term, q_weight in query_terms:
+                    count = self._term_count(doc_id, term)
+                    if count:
+                        total += scorer.score(doc_id, term, q_weight, count, length)
+                        postings_scored += 1
+
+                score = scorer.finalize(doc_id, total)
+                if score > 0:
+                    results[doc_id] = score
+
+            if stats is not None:
+                stats["postings_scored"] = postings_scored
+                stats["documents_scored"] = len(candidates)
+
+        top = sorted(results.items(), key = lambda x: (-x[1], x[0]))[:k]
+
+        return dict(top)
+
+    # Mantenimiento en segundo plano
+
+    def _needs_compaction(self) -> bool:
+        threshold = max(1, self.compaction_ratio * len(self._base_documents))
+        return self.pending_changes() >= threshold
+
+    def _schedule_maintenance(self):
+        if self._maintenance is not None and self._maintenance.is_alive():
+            return
+        if len(self.segments) <= self.max_segments and not self._needs_compaction():
+            return
+
+        self._maintenance = threading.Thread(target = self._maintain, daemon = True)
+        self._maintenance.start()
+
+    def _maintain(self):
+        try:
+            with self._lock:
+                if len(self.segments) > self.max_segments:
+                    merged = merge_segments(self.segments, self.deleted)
+                    merged_ids = set().union(*(s["documents"] for s in self.segments))
+                    self.deleted -= merged_ids
+                    self.segments = [merged]
+
+            with self._lock:
+                needs_compaction = self._needs_compaction()
+            if needs_compaction:
+                self.compact()
+        except Exception as e:
+            print(f"Error en el mantenimiento del índice incremental: {e}")
+
+    def compact(self):
+        """
+        Construye un índice base nuevo con todos los documentos vivos a partir
+        de sus frecuencias. Los cambios que lleguen mientras tanto se vuelven a
+        aplicar sobre la base nueva.
+        """
+        with self._lock:
+            if not self.has_pending():
+                return
+            live_ids = sorted(self.names.values())
+            documents = [self.get_document(doc_id) for doc_id in live_ids]
+            doc_counts = [self._doc_counts(doc_id) for doc_id in live_ids]
+            doc_passages = [self._doc_passages(doc_id) for doc_id in live_ids]
+            doc_positions = [self._doc_positions(doc_id) for doc_id in live_ids]
+
+            # Con una base podada, sus frecuencias ya no dan el df de la
+            # colección: se usa el que se lleva aquí y se poda igual la nueva
+            pruning = self.base.get("pruning")
+            statistics = None
+            if pruning:
+                terms = set().union(*doc_counts)
+                statistics = {"num_docs": len(live_ids), "df": {term: self.df(term) for term in terms}}
+
+            doc_lengths = [self.doc_length(doc_id) for doc_id in live_ids]
+
+        index = build_index_from_counts(documents, doc_counts, doc_passages = doc_passages, doc_positions = doc_positions,
+                                        statistics = statistics, pruning = pruning, doc_lengths = doc_lengths)
+
+        with self._lock:
+            snapshot = set(live_ids)
+            current = set(self.names.values())
+            added = [
+                (self.get_document(doc_id), self._doc_counts(doc_id), self._doc_positions(doc_id))
+                for doc_id in sorted(current - snapshot)
+            ]
+            removed = snapshot - current
+
+            # on_compact puede devolver el índice a usar (p. ej. el recargado de disco)
+            if self.on_compact is not None:
+                index = self.on_compact(index) or index
+
+            self._reset(index)
+            for doc_id in removed:
+                self._remove(doc_id)
+            for doc, counts, positions in added:
+                self._insert(doc, counts, positions)
+            self.version += 1
+
+        print(f"Índice incremental compactado: {len(documents)} documentos.")
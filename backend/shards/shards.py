@@ -0,0 +1,310 @@
+"""
+Índice repartido por documentos en N shards, cada uno con su propio índice
+(build_corpus_index) y su propio proceso, y búsqueda scatter-gather: la query
+se manda a todos los shards, cada uno calcula su top-k con WAND y el
+coordinador mezcla los top-k en el global.
+
+Los shards se construyen con las estadísticas de la colección completa (N,
+df, IDF y longitudes medias, corpus_statistics), que se guardan en el
+manifiesto junto a los índices. Así los pesos de cada shard y los scores de
+tfidf, bm25 y bm25f son exactamente los de un índice único, y el top-k
+mezclado (por score y, a igual score, por doc id) también.
+
+Uso (desde backend/):
+    python build_index.py --shards 4
+    python -m shards.shards "molinos de viento" --k 10 --scorer bm25
+"""
+import argparse
+import heapq
+import itertools
+import json
+import multiprocessing
+import threading
+from crawler.crawler import iter_docs
+from corpus.corpus import analyze_corpus, build_analyzed_index, corpus_statistics, ingest_workers, INDEX_WORKERS
+from indexer.indexer import IndexStatistics, compute_idf_from_df, make_scorer, search_scored
+from processing.processing import analyze, stem_cache
+from storage.storage import (
+    save_index,
+    load_index,
+    load_stem_lexicon,
+    default_index_path,
+    shard_index_path,
+    save_shard_manifest,
+    load_shard_manifest
+)
+from metrics.metrics import span
+
+DEFAULT_SHARDS = 4
+# Segundos que se espera a que un shard termine al pararlo
+STOP_TIMEOUT = 5
+
+def shard_of(doc_id: int, num_shards: int) -> int:
+    # Reparto de los documentos por id (round-robin)
+    return doc_id % num_shards
+
+def build_shards(num_shards: int = DEFAULT_SHARDS, index_path: str = None, workers: int = INDEX_WORKERS,
+                 progress = None, pruning: dict = None) -> dict:
+    """
+    Construye el índice de cada shard de docs/ y el manifiesto con las
+    estadísticas globales junto a index_path. Los documentos tienen los mismos
+    ids que en el índice único y cada uno va al shard shard_of(id).
+    Los documentos se leen y se analizan una sola vez (analyze_corpus); con
+    ese análisis se calculan las estadísticas y se construye cada shard con
+    los suyos. Con pruning (pruning_options) cada shard se poda con el IDF
+    de toda la colección; max_postings se aplica a las listas de cada shard.
+    Devuelve el manifiesto (None si no hay documentos).
+    """
+    index_path = index_path or default_index_path()
+    stem_cache.update(load_stem_lexicon(index_path))
+
+    workers = ingest_workers(workers)
+    analysis = analyze_corpus(iter_docs(workers), workers, progress = progress)
+    statistics = corpus_statistics(analysis)
+    if not statistics["num_docs"]:
+        return None
+
+    statistics.pop("ids")
+    num_shards = max(1, min(num_shards, statistics["num_docs"]))
+
+    shards = []
+    kept_terms = set()
+    for shard in range(num_shards):
+        positions = [
+            position for position, doc in enumerate(analysis["documents"])
+            if shard_of(doc["id"], num_shards) == shard
+        ]
+        with span("shards.build"):
+            index = build_analyzed_index(analysis, positions, statistics = statistics, pruning = pruning)
+        save_index(index, shard_index_path(shard, index_path))
+        kept_terms.update(index["vocabulary"])
+        shards.append({"shard": shard, "num_docs": len(index["documents"])})
+        if progress is not None:
+            progress("shards", shard + 1)
+
+    if pruning:
+        # Como en un índice único podado, los términos que la poda quita de
+        # todos los shards no tienen IDF (ni cuentan en la norma de la query)
+        statistics["df"] = {term: df for term, df in statistics["df"].items() if term in kept_terms}
+    manifest = {"num_shards": num_shards, "shards": shards, **statistics}
+    # El manifiesto se escribe al final: hasta entonces se siguen usando los shards anteriores
+    save_shard_manifest(manifest, index_path)
+    return manifest
+
+class ShardStatistics(IndexStatistics):
+    """
+    Estadísticas de un shard para los scorers: las de cada documento
+    (longitud, norma TF-IDF y título) salen de su índice y las de la colección
+    (N, df, IDF y longitudes medias) del manifiesto. Como el IDF es el de toda
+    la colección, la norma de la query de tfidf incluye también los términos
+    que no aparecen en el shard.
+    """
+
+    def __init__(self, index: dict, manifest: dict):
+        super().__init__(index)
+        self.num_docs = manifest["num_docs"]
+        self._df = manifest["df"]
+        self._idf = compute_idf_from_df(self._df, self.num_docs)
+        self._avg_length = manifest["total_length"] / self.num_docs if self.num_docs else 0.0
+        self._avg_title_length = manifest["total_title_length"] / self.num_docs if self.num_docs else 0.0
+
+def _shard_main(connection, shard: int, index_path: str):
+    # Proceso de un shard: carga su índice y atiende búsquedas hasta recibir None
+    manifest = load_shard_manifest(index_path)
+    index = load_index(shard_index_path(shard, index_path))
+    statistics = ShardStatistics(index, manifest)
+    wand_index = index["wand_index"]
+    connection.send(("ready", {doc["id"]: doc["name"] for doc in index["documents"]}))
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        tokens, k, scorer_name = request
+        try:
+            scorer = make_scorer(scorer_name, statistics)
+            stats = {}
+            ranking = search_scored(scorer.prepare(tokens), wand_index, scorer, k, stats)
+            connection.send(("result", (list(ranking.items()), stats)))
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}"))
+
+    connection.close()
+
+class ShardWorker:
+    # Proceso local de un shard; atiende las búsquedas de una en una por su tubería
+
+    def __init__(self, shard: int, index_path: str):
+        self.shard = shard
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.process = None
+        self.connection = None
+
+    def start(self):
+        # spawn, como run_in_process: el proceso no hereda los hilos del servidor
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target = _shard_main, args = (child, self.shard, self.index_path), daemon = True)
+        self.process.start()
+        child.close()
+
+    def send(self, request):
+        self.connection.send(request)
+
+    def receive(self):
+        try:
+            kind, value = self.connection.recv()
+        except EOFError:
+            self.process.join(STOP_TIMEOUT)
+            raise RuntimeError(f"El shard {self.shard} terminó (código {self.process.exitcode})") from None
+        if kind == "error":
+            raise RuntimeError(f"Shard {self.shard}: {value}")
+        return value
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self):
+        if self.process is None:
+            return
+        with self.lock:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(STOP_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.connection.close()
+
+def merge_rankings(rankings: list, k: int) -> dict:
+    """
+    Top-k global a partir de los top-k de los shards (listas de (doc_id,
+    score) ordenadas): por score descendente y, a igual score, por doc id,
+    que es como desempata search_scored en un índice único.
+    """
+    merged = heapq.merge(*rankings, key = lambda item: (-item[1], item[0]))
+    return dict(itertools.islice(merged, k))
+
+class ShardedIndex:
+    """
+    Coordinador de los shards construidos con build_shards: arranca un
+    proceso por shard y reparte cada búsqueda entre todos (scatter) para
+    mezclar sus top-k en el global (gather).
+    Las búsquedas pueden llegar desde varios hilos: cada shard atiende una
+    cada vez, y sus locks se toman siempre en el mismo orden y se sueltan al
+    recibir su respuesta, así que una búsqueda ya puede entrar en los primeros
+    shards mientras la anterior espera a los últimos.
+    """
+
+    def __init__(self, index_path: str = None):
+        self.index_path = index_path or default_index_path()
+        self.manifest = load_shard_manifest(self.index_path)
+        self.workers = [ShardWorker(shard, self.index_path) for shard in range(self.manifest["num_shards"])]
+        # Nombre de cada documento (los shards devuelven solo ids y scores)
+        self.names = {}
+
+    @property
+    def num_docs(self) -> int:
+        return self.manifest["num_docs"]
+
+    def start(self):
+        # Los shards cargan sus índices en paralelo
+        for worker in self.workers:
+            worker.start()
+        for worker in self.workers:
+            self.names.update(worker.receive())
+        return self
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def search(self, tokens: list, k: int, scorer_name: str = "tfidf", stats: dict = None) -> dict:
+        """
+        Los k documentos con mayor score para los términos ya analizados de la
+        query, {doc_id: score} como search_scored. Si se pasa stats, se suman
+        en él las entradas y documentos evaluados por todos los shards.
+        """
+        request = (list(tokens), k, scorer_name)
+        failure = None
+
+        sent = []
+        with span("shards.scatter"):
+            for worker in self.workers:
+                worker.lock.acquire()
+                try:
+                    worker.send(request)
+                except OSError as e:
+                    worker.lock.release()
+                    failure = RuntimeError(f"El shard {worker.shard} no responde: {e}")
+                    break
+                sent.append(worker)
+
+        # Se recoge la respuesta de todos los shards que recibieron la query,
+        # aunque alguno falle, para que sus tuberías queden en orden
+        responses = []
+        with span("shards.gather"):
+            for worker in sent:
+                try:
+                    responses.append(worker.receive())
+                except RuntimeError as e:
+                    failure = failure or e
+                finally:
+                    worker.lock.release()
+
+        if failure is not None:
+            raise failure
+
+        if stats is not None:
+            for _, shard_stats in responses:
+                for key, value in shard_stats.items():
+                    stats[key] = stats.get(key, 0) + value
+
+        with span("shards.merge"):
+            return merge_rankings([ranking for ranking, _ in responses], k)
+
+    def status(self) -> dict:
+        return {
+            "num_shards": len(self.workers),
+            "num_docs": self.num_docs,
+            "shards": [
+                {
+                    "shard": worker.shard,
+                    "num_docs": shard["num_docs"],
+                    "pid": worker.process.pid if worker.process is not None else None,
+                    "alive": worker.alive()
+                }
+                for worker, shard in zip(self.workers, self.manifest["shards"])
+            ]
+        }
+
+def main():
+    # Búsqueda de prueba con los shards como procesos locales
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query")
+    parser.add_argument("--k", type = int, default = 10)
+    parser.add_argument("--scorer", default = "tfidf")
+    parser.add_argument("--index", default = None)
+    args = parser.parse_args()
+
+    sharded = ShardedIndex(args.index).start()
+    try:
+        stats = {}
+        ranking = sharded.search(analyze(args.query), args.k, args.scorer, stats)
+        results = [
+            {"doc_id": doc_id, "doc_name": sharded.names.get(doc_id), "score": score}
+            for doc_id, score in ranking.items()
+        ]
+        print(json.dumps({"shards": sharded.status(), "results": results, "stats": stats}, indent = 2, ensure_ascii = False))
+    finally:
+        sharded.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import time
+import threading
+from indexer.indexer import IndexStatistics
+from suggest.suggest import build_suggester
+
+class IndexSnapshot:
+    """
+    Índice base ya construido junto con todo lo que se deriva de él (accesos
+    por término y por documento, estadísticas de los scorers) y el
+    SegmentedIndex con sus cambios incrementales. No se modifica después de
+    crearlo: se publica entero con una sola asignación y cada búsqueda lee
+    la referencia una vez, así que nunca ve mezclados dos índices.
+    """
+
+    def __init__(self, index: dict, version: int, segmented):
+        self.index = index
+        self.version = version
+        self.segmented = segmented
+
+        self.documents = index["documents"]
+        self.vocabulary = index["vocabulary"]
+        self.idf = index["idf"]
+        self.matrix = index["matrix"]
+        self.norms = index["norms"]
+        self.wand_index = index["wand_index"]
+        # Pasajes precalculados para los snippets y accesos O(1) por término y documento
+        self.passages = index.get("passages", {})
+        self.term_index = {term: i for i, term in enumerate(self.vocabulary)}
+        self.document_rows = {doc_id: row for row, doc_id in enumerate(self.matrix["doc_ids"])}
+        self.documents_by_id = {doc["id"]: doc for doc in self.documents}
+        # Longitudes, df y normas del índice base para los scorers
+        self.statistics = IndexStatistics(index)
+        # Trie de sugerencias; los índices compactados (y los guardados antes
+        # de tenerlo) no lo traen y se construye aquí con el df de las raíces
+        self.suggester = index.get("suggester")
+        if self.suggester is None:
+            self.suggester = build_suggester(self.vocabulary, index["df"], index.get("lexicon", {}))
+
+    def find_document(self, doc_id):
+        if self.segmented is not None:
+            return self.segmented.get_document(doc_id)
+        return self.documents_by_id.get(doc_id)
+
+def replay_changes(segmented, changes: list):
+    # Aplica altas, modificaciones y bajas anotadas durante una reconstrucción
+    for operation, name, text in changes:
+        if operation == "delete":
+            if name in segmented.names:
+                segmented.delete_document(name)
+        elif name in segmented.names:
+            segmented.update_document(name, text)
+        else:
+            segmented.add_document(name, text)
+
+class ReindexJob:
+    """
+    Reconstrucción del índice en segundo plano. build(job) construye el índice
+    nuevo sin tocar el publicado (o lo escribe aparte y devuelve su ruta),
+    informando del progreso con job.update, y publish(index, job) lo publica. Mientras tanto las búsquedas siguen
+    usando el índice anterior.
+
+    Las altas, modificaciones y bajas que lleguen durante la construcción se
+    anotan con record_change; publish las recoge con stop_recording y las
+    vuelve a aplicar sobre el índice nuevo antes de publicarlo.
+    """
+
+    def __init__(self, build, publish):
+        self._build = build
+        self._publish = publish
+        self._lock = threading.Lock()
+        self._thread = None
+        self._changes = []
+        self._recording = True
+        self.state = "pending"
+        self.stage = None
+        self.processed = 0
+        self.total = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def update(self, stage: str, processed: int = None, total: int = None):
+        with self._lock:
+            self.stage = stage
+            if processed is not None:
+                self.processed = processed
+            if total is not None:
+                self.total = total
+
+    def record_change(self, operation: str, name: str, text: str = None) -> bool:
+        with self._lock:
+            if self._recording:
+                self._changes.append((operation, name, text))
+            return self._recording
+
+    def stop_recording(self) -> list:
+        with self._lock:
+            self._recording = False
+            changes, self._changes = self._changes, []
+            return changes
+
+    def running(self) -> bool:
+        with self._lock:
+            return self.state in ("pending", "running")
+
+    def progress(self) -> dict:
+        with self._lock:
+            elapsed = None
+            if self.started is not None:
+                elapsed = (self.finished or time.time()) - self.started
+            return {
+                "state": self.state,
+                "stage": self.stage,
+                "documents_processed": self.processed,
+                "documents_total": self.total,
+                "pending_changes": len(self._changes),
+                "elapsed_seconds": elapsed,
+                "error": self.error
+            }
+
+    def start(self):
+        self._thread = threading.Thread(target = self.run, daemon = True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        with self._lock:
+            self.state = "running"
+            self.started = time.time()
+
+        try:
+            index = self._build(self)
+            if index is None:
+                self.stop_recording()
+                state, error = "failed", "No hay documentos para indexar."
+            else:
+                self.update("publishing")
+                self._publish(index, self)
+                state, error = "done", None
+        except Exception as e:
+            self.stop_recording()
+            print(f"Error en la reconstrucción del índice: {e}")
+            state, error = "failed", f"{type(e).__name__}: {e}"
+
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.stage = "done" if state == "done" else self.stage
+            self.finished = time.time()
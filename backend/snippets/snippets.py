@@ -0,0 +1,173 @@
+import re
+import numpy as np
+from processing.processing import analyze
+
+# Longitud mínima (sin espacios) de una línea para ser un pasaje
+MIN_PASSAGE_CHARS = 50
+# Pasajes candidatos que se leen para buscar la frase exacta
+PHRASE_CANDIDATES = 20
+
+GUTENBERG_HEADER_PATTERNS = [
+    re.compile(r"\*\*\*\s*start of.*?\*\*\*", re.DOTALL),
+    re.compile(r"start of the project gutenberg ebook"),
+    re.compile(r"start of this project gutenberg"),
+]
+
+def header_end(text: str) -> int:
+    # Posición (en caracteres) donde empieza el contenido tras la cabecera de Gutenberg
+    lower = text.lower()
+
+    for pattern in GUTENBERG_HEADER_PATTERNS:
+        match = pattern.search(lower)
+        if match:
+            return match.end()
+
+    return min(5000, len(text))
+
+def remove_gutenberg_header(text: str) -> str:
+    return text[header_end(text):]
+
+def split_into_paragraphs(text: str) -> list:
+    paragraphs = [
+        p.strip()
+        for p in text.split("\n")
+        if len(p.strip()) > MIN_PASSAGE_CHARS
+    ]
+    return paragraphs
+
+def extract_snippet_phrase(text: str, query_phrase: str) -> str:
+    if not text or not query_phrase:
+        return ""
+
+    clean_text = remove_gutenberg_header(text)
+    paragraphs = split_into_paragraphs(clean_text)
+
+    phrase_lower = query_phrase.lower()
+
+    for paragraph in paragraphs:
+        if phrase_lower in paragraph.lower():
+            return paragraph.replace("\n", " ").strip()
+
+    return ""
+
+def extract_snippet_tokens(text: str, tokens: list) -> str:
+    if not text or not tokens:
+        return ""
+
+    clean_text = remove_gutenberg_header(text)
+    paragraphs = split_into_paragraphs(clean_text)
+
+    for paragraph in paragraphs:
+        p_lower = paragraph.lower()
+        for token in tokens:
+            if token in p_lower:
+                return paragraph.replace("\n", " ").strip()
+
+    return ""
+
+def build_passages(text: str) -> dict:
+    """
+    Segmentación en pasajes hecha una sola vez al indexar: los mismos párrafos
+    que split_into_paragraphs(remove_gutenberg_header(text)), guardados como
+    posiciones en bytes (UTF-8) dentro del texto, más el mapa
+    término -> pasajes en los que aparece.
+    """
+    start_char = header_end(text)
+    byte_pos = len(text[:start_char].encode("utf-8"))
+
+    spans = []
+    terms = {}
+
+    for line in text[start_char:].split("\n"):
+        line_bytes = len(line.encode("utf-8"))
+        paragraph = line.strip()
+
+        if len(paragraph) > MIN_PASSAGE_CHARS:
+            leading = len(line) - len(line.lstrip())
+            start = byte_pos + len(line[:leading].encode("utf-8"))
+            end = start + len(paragraph.encode("utf-8"))
+
+            passage = len(spans)
+            spans.append((start, end))
+            for term in set(analyze(paragraph)):
+                terms.setdefault(term, []).append(passage)
+
+        byte_pos += line_bytes + 1
+
+    return {"spans": spans, "terms": terms}
+
+def build_passage_arrays(doc_passages: list, matrix: dict, vocabulary: list) -> dict:
+    """
+    Empaqueta los pasajes de todos los documentos en arrays NumPy:
+    - doc_ptr/starts/ends: pasajes de la fila i en starts[doc_ptr[i]:doc_ptr[i + 1]],
+    - term_ptr/ids: lista de pasajes de cada entrada no nula de la matriz CSR
+      (alineada con matrix["indices"]), con números de pasaje locales al documento.
+    """
+    doc_ptr = [0]
+    starts = []
+    ends = []
+    term_ptr = [0]
+    ids = []
+
+    indptr = matrix["indptr"].tolist()
+    indices = matrix["indices"].tolist()
+
+    for row, passages in enumerate(doc_passages):
+        passages = passages or {"spans": [], "terms": {}}
+
+        for start, end in passages["spans"]:
+            starts.append(start)
+            ends.append(end)
+        doc_ptr.append(len(starts))
+
+        for column in indices[indptr[row]:indptr[row + 1]]:
+            ids.extend(passages["terms"].get(vocabulary[column], ()))
+            term_ptr.append(len(ids))
+
+    return {
+        "doc_ptr": np.array(doc_ptr, dtype = np.int64),
+        "starts": np.array(starts, dtype = np.int64),
+        "ends": np.array(ends, dtype = np.int64),
+        "term_ptr": np.array(term_ptr, dtype = np.int64),
+        "ids": np.array(ids, dtype = np.int32)
+    }
+
+def document_passages(passages: dict, matrix: dict, vocabulary: list, row: int) -> dict:
+    # Pasajes de una fila en el mismo formato que build_passages (para compactar)
+    first, last = passages["doc_ptr"][row], passages["doc_ptr"][row + 1]
+    spans = list(zip(passages["starts"][first:last].tolist(), passages["ends"][first:last].tolist()))
+
+    terms = {}
+    start, end = matrix["indptr"][row], matrix["indptr"][row + 1]
+    for j, column in zip(range(start, end), matrix["indices"][start:end].tolist()):
+        ids = passages["ids"][passages["term_ptr"][j]:passages["term_ptr"][j + 1]]
+        if len(ids):
+            terms[vocabulary[column]] = ids.tolist()
+
+    return {"spans": spans, "terms": terms}
+
+def rank_passages(passages: dict, matrix: dict, row: int, columns: list) -> list:
+    """
+    Pasajes de la fila con más términos distintos de la query (columnas de la
+    matriz), en orden de aparición. Solo se leen las listas de esos términos.
+    """
+    start, end = matrix["indptr"][row], matrix["indptr"][row + 1]
+    row_indices = matrix["indices"][start:end]
+
+    hits = {}
+    for column in columns:
+        pos = int(np.searchsorted(row_indices, column))
+        if pos < len(row_indices) and row_indices[pos] == column:
+            j = start + pos
+            for passage in passages["ids"][passages["term_ptr"][j]:passages["term_ptr"][j + 1]].tolist():
+                hits[passage] = hits.get(passage, 0) + 1
+
+    if not hits:
+        return []
+
+    best = max(hits.values())
+    return sorted(passage for passage, count in hits.items() if count == best)
+
+def passage_span(passages: dict, row: int, passage: int) -> tuple:
+    i = passages["doc_ptr"][row] + passage
+    return int(passages["starts"][i]), int(passages["ends"][i])
@@ -0,0 +1,355 @@
+import os
+import json
+import mmap
+import struct
+import tempfile
+import numpy as np
+from postings.postings import PostingsIndex
+from suggest.suggest import Suggester
+
+# Formato binario del índice:
+#   MAGIC (8 bytes) | versión (uint32) | longitud cabecera (uint32) | cabecera JSON
+#   | relleno hasta múltiplo de 8 | arrays NumPy contiguos (alineados a 8 bytes)
+# La cabecera guarda vocabulario, metadatos de documentos (con la posición de su
+# texto en el bloque "texts") y la tabla de arrays (nombre -> desplazamiento,
+# dtype, nº de elementos).
+INDEX_MAGIC = b"RIINDEX\0"
+INDEX_FORMAT_VERSION = 9
+# Tamaño de lectura al copiar textos entre ficheros
+TEXT_COPY_BYTES = 1024 * 1024
+
+class TextStore:
+    """
+    Textos de los documentos escritos en un fichero temporal durante la
+    construcción del índice, leídos después por desplazamiento.
+    """
+
+    def __init__(self, directory: str = None):
+        self._file = tempfile.TemporaryFile(dir = directory)
+        self.size = 0
+
+    def append(self, text: str) -> int:
+        data = text.encode("utf-8")
+        self._file.seek(self.size)
+        self._file.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def truncate(self, size: int):
+        self._file.truncate(size)
+        self.size = size
+
+    def read_bytes(self, offset: int, length: int) -> bytes:
+        self._file.flush()
+        return os.pread(self._file.fileno(), length, offset)
+
+class MappedTexts:
+    # Bloque de textos dentro del fichero del índice mapeado en memoria
+
+    def __init__(self, data):
+        self._data = data
+
+    def read_bytes(self, offset: int, length: int) -> bytes:
+        return self._data[offset:offset + length].tobytes()
+
+def document_text(doc: dict) -> str:
+    """
+    Texto de un documento: el que lleve en memoria o, si es del índice, el que
+    se lee de su almacén de textos por desplazamiento.
+    """
+    if "text" in doc:
+        return doc["text"]
+
+    data = doc["text_store"].read_bytes(doc["text_offset"], doc["text_length"])
+    return data.decode("utf-8")
+
+def document_text_range(doc: dict, start: int, end: int) -> str:
+    # Fragmento [start, end) del texto de un documento, en bytes UTF-8
+    if "text" in doc:
+        return doc["text"].encode("utf-8")[start:end].decode("utf-8")
+
+    data = doc["text_store"].read_bytes(doc["text_offset"] + start, end - start)
+    return data.decode("utf-8")
+
+def _text_length(doc: dict) -> int:
+    if "text" in doc:
+        return len(doc["text"].encode("utf-8"))
+    return doc["text_length"]
+
+def _iter_text_bytes(doc: dict):
+    if "text" in doc:
+        yield doc["text"].encode("utf-8")
+        return
+
+    store = doc["text_store"]
+    offset = doc["text_offset"]
+    end = offset + doc["text_length"]
+    while offset < end:
+        length = min(TEXT_COPY_BYTES, end - offset)
+        yield store.read_bytes(offset, length)
+        offset += length
+
+def default_index_path() -> str:
+    # RI_INDEX_PATH permite usar otro fichero de índice (como RI_DOCS_PATH en crawler)
+    if os.environ.get("RI_INDEX_PATH"):
+        return os.path.abspath(os.environ["RI_INDEX_PATH"])
+    base_dir = os.path.dirname(__file__)
+    return os.path.abspath(os.path.join(base_dir, "..", "..", "index", "corpus.idx"))
+
+def lexicon_path(index_path: str = None) -> str:
+    # El léxico forma -> raíz se guarda junto al índice: corpus.idx -> corpus.lexicon.json
+    index_path = index_path or default_index_path()
+    return os.path.splitext(index_path)[0] + ".lexicon.json"
+
+def extraction_cache_path(index_path: str = None) -> str:
+    """
+    Carpeta de la caché de textos extraídos (cache.ExtractionCache) junto al
+    índice: corpus.idx -> corpus.extraction/. RI_EXTRACTION_CACHE permite
+    usar otra o desactivarla con "0" (entonces devuelve None).
+    """
+    configured = os.environ.get("RI_EXTRACTION_CACHE")
+    if configured == "0":
+        return None
+    if configured:
+        return os.path.abspath(configured)
+    return os.path.splitext(index_path or default_index_path())[0] + ".extraction"
+
+def staging_index_path(index_path: str = None) -> str:
+    # Índice en construcción junto al publicado: corpus.idx -> corpus.staging.idx
+    root, extension = os.path.splitext(index_path or default_index_path())
+    return root + ".staging" + extension
+
+def replace_index(source: str, path: str = None) -> str:
+    # Sustituye el índice de path (y su léxico) por el escrito con save_index en source
+    path = path or default_index_path()
+    if os.path.exists(lexicon_path(source)):
+        os.replace(lexicon_path(source), lexicon_path(path))
+    os.replace(source, path)
+    return path
+
+def shard_index_path(shard: int, index_path: str = None) -> str:
+    # Índice de un shard junto al único: corpus.idx -> corpus.shard0.idx
+    root, extension = os.path.splitext(index_path or default_index_path())
+    return f"{root}.shard{shard}{extension}"
+
+def shard_manifest_path(index_path: str = None) -> str:
+    # Descripción de los shards y estadísticas globales: corpus.idx -> corpus.shards.json
+    return os.path.splitext(index_path or default_index_path())[0] + ".shards.json"
+
+def save_shard_manifest(manifest: dict, index_path: str = None) -> str:
+    path = shard_manifest_path(index_path)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding = "utf-8") as f:
+        json.dump(manifest, f, ensure_ascii = False)
+    os.replace(tmp_path, path)
+
+    return path
+
+def load_shard_manifest(index_path: str = None) -> dict:
+    # FileNotFoundError si no se han construido shards (build_index.py --shards N)
+    with open(shard_manifest_path(index_path), "r", encoding = "utf-8") as f:
+        return json.load(f)
+
+def save_stem_lexicon(lexicon: dict, index_path: str = None) -> str:
+    path = lexicon_path(index_path)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding = "utf-8") as f:
+        json.dump(lexicon, f, ensure_ascii = False)
+    os.replace(tmp_path, path)
+
+    return path
+
+def load_stem_lexicon(index_path: str = None) -> dict:
+    path = lexicon_path(index_path)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, "r", encoding = "utf-8") as f:
+        return json.load(f)
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def save_index(index: dict, path: str = None) -> str:
+    """
+    Escribe el índice construido por build_corpus_index en un único fichero
+    binario versionado. Se escribe a un temporal y se renombra al final.
+    """
+    path = path or default_index_path()
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    vocabulary = index["vocabulary"]
+    documents = index["documents"]
+    matrix = index["matrix"]
+    postings = index["wand_index"].arrays
+
+    # Textos originales en un único bloque UTF-8 al final del fichero
+    text_offsets = [0]
+    for doc in documents:
+        text_offsets.append(text_offsets[-1] + _text_length(doc))
+
+    arrays = {
+        "idf": np.array([index["idf"][term] for term in vocabulary], dtype = np.float64),
+        "df": np.array(index["df"], dtype = np.int64),
+        # Listas comprimidas de build_postings
+        **{"post_" + name: array for name, array in postings.items()},
+        "norms": np.array([index["norms"].get(doc["id"], 0.0) for doc in documents], dtype = np.float64),
+        "indptr": matrix["indptr"],
+        "indices": matrix["indices"],
+        "data": matrix["data"],
+        "counts": matrix["counts"],
+        "row_norms": matrix["norms"],
+        "lengths": np.asarray(index["lengths"], dtype = np.int64),
+        "passage_doc_ptr": index["passages"]["doc_ptr"],
+        "passage_starts": index["passages"]["starts"],
+        "passage_ends": index["passages"]["ends"],
+        "passage_term_ptr": index["passages"]["term_ptr"],
+        "passage_ids": index["passages"]["ids"],
+        "position_ptr": index["positions"]["ptr"],
+        "position_data": index["positions"]["data"],
+        "text_offsets": np.array(text_offsets, dtype = np.int64)
+    }
+    # Trie de sugerencias (build_suggester), si se ha construido con el índice
+    suggester = index.get("suggester")
+    if suggester is not None:
+        arrays.update({"suggest_" + name: array for name, array in suggester.arrays.items()})
+
+    table = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        table[name] = [offset, array.dtype.str, int(array.size)]
+        offset += array.nbytes
+    table["texts"] = [_align(offset), np.dtype(np.uint8).str, text_offsets[-1]]
+
+    header = json.dumps({
+        "vocabulary": vocabulary,
+        "documents": [
+            {"id": doc["id"], "name": doc["name"], "title_terms": doc.get("title_terms", [])}
+            for doc in documents
+        ],
+        "matrix_shape": list(matrix["shape"]),
+        "matrix_doc_ids": matrix["doc_ids"],
+        "pruning": index.get("pruning"),
+        "suggest_keys": suggester.keys if suggester is not None else None,
+        "arrays": table
+    }, ensure_ascii = False).encode("utf-8")
+
+    data_start = _align(len(INDEX_MAGIC) + 8 + len(header))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(struct.pack("<II", INDEX_FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.write(b"\0" * (data_start + table[name][0] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+        # Los textos se copian documento a documento sin cargarlos enteros
+        f.write(b"\0" * (data_start + table["texts"][0] - f.tell()))
+        for doc in documents:
+            for data in _iter_text_bytes(doc):
+                f.write(data)
+
+    os.replace(tmp_path, path)
+
+    if index.get("lexicon"):
+        save_stem_lexicon(index["lexicon"], path)
+
+    return path
+
+def load_index(path: str = None) -> dict:
+    """
+    Carga un índice escrito por save_index mapeando el fichero en memoria: los
+    arrays son vistas sobre el mmap y las páginas se comparten entre procesos.
+    Lanza ValueError si el fichero no es un índice o es de otra versión.
+    """
+    path = path or default_index_path()
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+    if mapped[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        raise ValueError(f"{path} no es un índice válido")
+
+    version, header_len = struct.unpack_from("<II", mapped, len(INDEX_MAGIC))
+    if version != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Versión de índice {version} no soportada (se esperaba {INDEX_FORMAT_VERSION})")
+
+    header_start = len(INDEX_MAGIC) + 8
+    header = json.loads(mapped[header_start:header_start + header_len].decode("utf-8"))
+    data_start = _align(header_start + header_len)
+
+    arrays = {}
+    for name, (offset, dtype, count) in header["arrays"].items():
+        arrays[name] = np.frombuffer(mapped, dtype = np.dtype(dtype), count = count, offset = data_start + offset)
+
+    vocabulary = header["vocabulary"]
+    idf = dict(zip(vocabulary, arrays["idf"].tolist()))
+    texts = MappedTexts(arrays["texts"])
+    text_offsets = arrays["text_offsets"].tolist()
+
+    # Los textos no se decodifican: se leen del mmap cuando hacen falta
+    documents = []
+    for i, meta in enumerate(header["documents"]):
+        documents.append({
+            "id": meta["id"],
+            "name": meta["name"],
+            "title_terms": meta["title_terms"],
+            "text_store": texts,
+            "text_offset": text_offsets[i],
+            "text_length": text_offsets[i + 1] - text_offsets[i]
+        })
+
+    matrix = {
+        "doc_ids": header["matrix_doc_ids"],
+        "indptr": arrays["indptr"],
+        "indices": arrays["indices"],
+        "data": arrays["data"],
+        "counts": arrays["counts"],
+        "norms": arrays["row_norms"],
+        "shape": tuple(header["matrix_shape"])
+    }
+
+    norms = dict(zip([doc["id"] for doc in documents], arrays["norms"].tolist()))
+
+    return {
+        "documents": documents,
+        "vocabulary": vocabulary,
+        "idf": idf,
+        "df": arrays["df"],
+        "matrix": matrix,
+        "norms": norms,
+        "lengths": arrays["lengths"],
+        "passages": {
+            "doc_ptr": arrays["passage_doc_ptr"],
+            "starts": arrays["passage_starts"],
+            "ends": arrays["passage_ends"],
+            "term_ptr": arrays["passage_term_ptr"],
+            "ids": arrays["passage_ids"]
+        },
+        "positions": {
+            "ptr": arrays["position_ptr"],
+            "data": arrays["position_data"]
+        },
+        "lexicon": load_stem_lexicon(path),
+        "pruning": header.get("pruning"),
+        "suggester": Suggester(
+            vocabulary,
+            header["suggest_keys"],
+            {name[len("suggest_"):]: array for name, array in arrays.items() if name.startswith("suggest_")}
+        ) if header.get("suggest_keys") is not None else None,
+        "wand_index": PostingsIndex(
+            vocabulary,
+            idf,
+            {name[len("post_"):]: array for name, array in arrays.items() if name.startswith("post_")},
+            matrix["doc_ids"],
+            arrays["lengths"],
+            [norms.get(doc_id, 0.0) for doc_id in matrix["doc_ids"]]
+        )
+    }
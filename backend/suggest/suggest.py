@@ -0,0 +1,240 @@
+"""
+Sugerencias mientras se escribe: trie de las formas de las palabras del
+corpus (léxico forma -> raíz) y de las raíces del vocabulario sin ninguna
+forma conocida, cada una con su df (documentos en que aparece) como peso. El trie se construye con el
+índice, se guarda en él en arrays planos y se recorre sin decodificar nada:
+las k mejores terminaciones de un prefijo se sacan con una búsqueda
+primero-el-mejor guiada por el peso máximo de cada subárbol, así que solo se
+visitan los nodos que llevan a ellas.
+
+Uso (desde backend/):
+    python -m suggest.suggest "moli" --k 10
+"""
+import argparse
+import heapq
+import json
+import time
+import numpy as np
+from processing.processing import lexical_analysis
+
+SUGGEST_K = 10
+MAX_SUGGEST_K = 100
+
+def suggestion_entries(vocabulary: list, df, lexicon: dict, form_df: dict = None) -> tuple:
+    """
+    Entradas del trie ordenadas: (claves, pesos, raíz de cada una como
+    posición en vocabulary). Cada forma del léxico pesa su propio df si se
+    conoce (form_df) o, si no, el de su raíz. Las raíces no son palabras
+    (moliend, moliner) y solo se sugieren las que no tienen ninguna forma en
+    el léxico, con su df. Las formas cuya raíz no está en el vocabulario
+    (p. ej. si la poda la ha quitado de todos los documentos) no se sugieren.
+    """
+    term_index = {term: i for i, term in enumerate(vocabulary)}
+    df = [int(value) for value in df]
+    entries = {}
+
+    for form, stemmed in lexicon.items():
+        term_id = term_index.get(stemmed)
+        if term_id is None:
+            continue
+        weight = form_df[form] if form_df is not None and form in form_df else df[term_id]
+        entries[form] = (weight, term_id)
+
+    with_forms = {term_id for _, term_id in entries.values()}
+    for term_id, term in enumerate(vocabulary):
+        if term_id not in with_forms and term not in entries:
+            entries[term] = (df[term_id], term_id)
+
+    keys = sorted(entries)
+    weights = [entries[key][0] for key in keys]
+    stems = [entries[key][1] for key in keys]
+    return keys, weights, stems
+
+def build_trie(keys: list, weights: list) -> dict:
+    """
+    Trie de las claves (ordenadas) en arrays, con los nodos numerados por
+    niveles: los hijos del nodo i son los nodos child_ptr[i] + 1 a
+    child_ptr[i + 1] y labels[j - 1] es el carácter (código) que lleva al
+    nodo j, en orden dentro de cada nodo. entries es la clave que termina en
+    cada nodo (-1 si ninguna), max_weights el mayor peso de su subárbol y
+    best la primera clave con ese peso, que es la primera que se sugiere.
+    """
+    child_ptr = [0]
+    labels = []
+    entries = []
+    # Cada nodo es el rango [lo, hi) de claves que empiezan por su prefijo
+    ranges = [(0, len(keys), 0)]
+
+    node = 0
+    while node < len(ranges):
+        lo, hi, depth = ranges[node]
+        own = lo if lo < hi and len(keys[lo]) == depth else -1
+        entries.append(own)
+
+        start = lo + 1 if own >= 0 else lo
+        while start < hi:
+            char = keys[start][depth]
+            end = start + 1
+            while end < hi and keys[end][depth] == char:
+                end += 1
+            labels.append(ord(char))
+            ranges.append((start, end, depth + 1))
+            start = end
+        child_ptr.append(len(labels))
+        node += 1
+
+    # Pesos de los subárboles de abajo arriba (los hijos tienen números mayores);
+    # a igual peso gana la clave anterior, que es la del propio nodo o la del primer hijo
+    num_nodes = len(ranges)
+    best = [-1] * num_nodes
+    for node in range(num_nodes - 1, -1, -1):
+        candidate = entries[node]
+        for child in range(child_ptr[node] + 1, child_ptr[node + 1] + 1):
+            child_best = best[child]
+            if candidate < 0 or weights[child_best] > weights[candidate]:
+                candidate = child_best
+        best[node] = candidate
+
+    weights_array = np.array(weights, dtype = np.int64)
+    best_array = np.array(best, dtype = np.int32)
+    return {
+        "child_ptr": np.array(child_ptr, dtype = np.int32),
+        "labels": np.array(labels, dtype = np.int32),
+        "entries": np.array(entries, dtype = np.int32),
+        "best": best_array,
+        "max_weights": weights_array[best_array] if len(keys) else np.zeros(num_nodes, dtype = np.int64),
+        "weights": weights_array
+    }
+
+class Suggester:
+    """
+    Consultas sobre el trie de build_trie (en memoria o mapeado desde el
+    fichero del índice). keys son las claves en orden y stems la raíz de cada
+    una (posición en vocabulary).
+    """
+
+    def __init__(self, vocabulary: list, keys: list, arrays: dict):
+        self.vocabulary = vocabulary
+        self.keys = keys
+        self.arrays = arrays
+        self._child_ptr = arrays["child_ptr"]
+        self._labels = arrays["labels"]
+        self._entries = arrays["entries"]
+        self._best = arrays["best"]
+        self._max_weights = arrays["max_weights"]
+        self._weights = arrays["weights"]
+        self._stems = arrays["stems"]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def find(self, prefix: str) -> int:
+        # Nodo del prefijo (None si ninguna clave empieza por él)
+        child_ptr = self._child_ptr
+        labels = self._labels
+        node = 0
+        for char in prefix:
+            lo = int(child_ptr[node])
+            hi = int(child_ptr[node + 1])
+            code = ord(char)
+            position = lo + int(labels[lo:hi].searchsorted(code))
+            if position == hi or labels[position] != code:
+                return None
+            node = position + 1
+        return node
+
+    def complete(self, prefix: str, k: int = SUGGEST_K) -> list:
+        """
+        Las k claves que empiezan por prefix con más peso, por peso
+        descendente y, a igual peso, en orden alfabético: [(clave, peso,
+        raíz)]. Se van abriendo los nodos por el peso máximo de su subárbol y
+        una clave sale en cuanto no queda nada pendiente que pese más.
+        """
+        node = self.find(prefix)
+        if node is None or k <= 0 or self._best[node] < 0:
+            return []
+
+        child_ptr = self._child_ptr
+        best = self._best
+        max_weights = self._max_weights
+        # (-peso, primera clave con ese peso, es un nodo, nodo o clave)
+        heap = [(-int(max_weights[node]), int(best[node]), 1, node)]
+        found = []
+
+        while heap and len(found) < k:
+            weight, entry, is_node, value = heapq.heappop(heap)
+            if not is_node:
+                found.append(entry)
+                continue
+
+            own = int(self._entries[value])
+            if own >= 0:
+                heapq.heappush(heap, (-int(self._weights[own]), own, 0, own))
+            first = int(child_ptr[value]) + 1
+            last = int(child_ptr[value + 1]) + 1
+            for child, child_weight, child_best in zip(range(first, last), max_weights[first:last].tolist(),
+                                                       best[first:last].tolist()):
+                heapq.heappush(heap, (-child_weight, child_best, 1, child))
+
+        return [
+            (self.keys[entry], int(self._weights[entry]), self.vocabulary[int(self._stems[entry])])
+            for entry in found
+        ]
+
+def build_suggester(vocabulary: list, df, lexicon: dict, form_df: dict = None) -> Suggester:
+    # Trie de sugerencias de un índice (suggestion_entries y build_trie)
+    keys, weights, stems = suggestion_entries(vocabulary, df, lexicon, form_df)
+    arrays = build_trie(keys, weights)
+    arrays["stems"] = np.array(stems, dtype = np.int32)
+    return Suggester(vocabulary, keys, arrays)
+
+def suggest(suggester: Suggester, text: str, k: int = SUGGEST_K) -> list:
+    """
+    Sugerencias para lo que se lleva escrito de una query: terminaciones de
+    su última palabra (normalizada como las queries) con la query completa
+    que resultaría. Si el texto acaba en espacio, la palabra ya está
+    terminada y no se sugiere nada.
+    """
+    if not isinstance(text, str) or not text or text[-1].isspace():
+        return []
+
+    words = lexical_analysis(text).split(" ")
+    prefix = words[-1]
+    if not prefix:
+        return []
+
+    head = " ".join(words[:-1])
+    return [
+        {
+            "term": term,
+            "stem": stem,
+            "df": weight,
+            "query": f"{head} {term}" if head else term
+        }
+        for term, weight, stem in suggester.complete(prefix, k)
+    ]
+
+def main():
+    # Sugerencias de prueba con el índice guardado (storage.py importa este módulo)
+    from storage.storage import load_index
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("text")
+    parser.add_argument("--k", type = int, default = SUGGEST_K)
+    parser.add_argument("--index", default = None)
+    args = parser.parse_args()
+
+    index = load_index(args.index)
+    suggester = index["suggester"]
+    if suggester is None:
+        suggester = build_suggester(index["vocabulary"], index["df"], index["lexicon"])
+    start = time.perf_counter()
+    suggestions = suggest(suggester, args.text, args.k)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"suggestions": suggestions, "ms": elapsed * 1000}, indent = 2, ensure_ascii = False))
+
+if __name__ == "__main__":
+    main()
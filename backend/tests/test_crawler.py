@@ -0,0 +1,209 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import formatdate
+from types import SimpleNamespace
+import pytest
+import crawler.crawler
+from crawler.crawler import (
+    CrawlJob,
+    response_text,
+    _retry_delay,
+    document_files,
+    load_docs,
+    FETCH_STATE_FILE,
+    MAX_RETRY_DELAY
+)
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Servidor de prueba: cada ruta responde según su guion y se anotan las
+    peticiones (ruta, cabeceras condicionales y hora) en server.requests.
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("If-None-Match"), time.monotonic()))
+            count = sum(1 for path, _, _ in server.requests if path == self.path)
+
+        if self.path == "/flaky" and count <= 2:
+            self.reply(503)
+        elif self.path == "/limited" and count == 1:
+            self.reply(429, headers = {"Retry-After": "1"})
+        elif self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+            self.reply(304)
+        elif self.path == "/etag":
+            self.reply(200, "molinos de viento", {"ETag": '"v1"'})
+        elif self.path == "/missing":
+            self.reply(404)
+        elif self.path == "/created":
+            self.reply(201, "caballero andante")
+        else:
+            self.reply(200, f"texto de {self.path}")
+
+    def reply(self, status: int, body: str = "", headers: dict = None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    httpd.requests = []
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target = httpd.serve_forever, daemon = True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def url(server, path: str) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+def source(filename: str, source_url: str) -> dict:
+    return {"filename": filename, "url": source_url, "params": None, "parse": response_text}
+
+def run_job(sources: list, docs_path, **options) -> dict:
+    options = {"host_interval": 0.0, "backoff": 0.01, "retries": 2, "timeout": 5, **options}
+    return CrawlJob(sources, docs_path = str(docs_path), **options).run_sync()
+
+def test_retries_server_errors_until_success(server, tmp_path):
+    progress = run_job([source("flaky.txt", url(server, "/flaky"))], tmp_path)
+
+    result = progress["files"]["flaky.txt"]
+    assert progress["state"] == "done"
+    assert result["status"] == "downloaded"
+    assert result["attempts"] == 3
+    assert (tmp_path / "flaky.txt").read_text(encoding = "utf-8") == "texto de /flaky"
+
+def test_client_errors_are_not_retried_and_any_2xx_is_stored(server, tmp_path):
+    progress = run_job([
+        source("missing.txt", url(server, "/missing")),
+        source("created.txt", url(server, "/created"))
+    ], tmp_path)
+
+    assert progress["files"]["missing.txt"] == {"status": "failed", "attempts": 1, "error": "HTTP 404"}
+    assert progress["files"]["created.txt"]["status"] == "downloaded"
+    assert (tmp_path / "created.txt").read_text(encoding = "utf-8") == "caballero andante"
+
+def test_waits_for_retry_after(server, tmp_path):
+    progress = run_job([source("limited.txt", url(server, "/limited"))], tmp_path)
+
+    assert progress["files"]["limited.txt"]["status"] == "downloaded"
+    times = [moment for path, _, moment in server.requests if path == "/limited"]
+    assert len(times) == 2
+    # Retry-After: 1 manda sobre la espera exponencial (0.01 s)
+    assert times[1] - times[0] >= 0.9
+
+def test_retry_after_is_capped():
+    def response(retry_after):
+        return SimpleNamespace(headers = {"Retry-After": retry_after})
+
+    assert _retry_delay(response("2"), 0, 1.0) == 2.0
+    assert _retry_delay(response("86400"), 0, 1.0) == MAX_RETRY_DELAY
+    assert _retry_delay(response(formatdate(time.time() + 86400, usegmt = True)), 0, 1.0) == MAX_RETRY_DELAY
+    assert _retry_delay(None, 20, 1.0) == MAX_RETRY_DELAY
+
+def test_etag_turns_the_second_download_into_304(server, tmp_path):
+    sources = [source("etag.txt", url(server, "/etag"))]
+
+    first = run_job(sources, tmp_path)
+    assert first["files"]["etag.txt"]["status"] == "downloaded"
+    state = json.loads((tmp_path / FETCH_STATE_FILE).read_text(encoding = "utf-8"))
+    assert state["etag.txt"]["etag"] == '"v1"'
+
+    second = run_job(sources, tmp_path)
+    assert second["files"]["etag.txt"]["status"] == "not_modified"
+    assert [etag for path, etag, _ in server.requests if path == "/etag"] == [None, '"v1"']
+    assert (tmp_path / "etag.txt").read_text(encoding = "utf-8") == "molinos de viento"
+
+def test_connection_failure_is_reported_after_the_retries(tmp_path):
+    # Un puerto en el que no escucha nadie
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    progress = run_job([source("down.txt", f"http://127.0.0.1:{port}/")], tmp_path)
+
+    result = progress["files"]["down.txt"]
+    assert progress["state"] == "done"
+    assert result["status"] == "failed"
+    assert result["attempts"] == 3
+    assert result["error"].startswith("ConnectError")
+    assert not (tmp_path / "down.txt").exists()
+
+def test_write_errors_fail_only_their_file(server, tmp_path):
+    # Un directorio en el sitio del temporal hace fallar la escritura de
+    # page.txt (como un docs/ sin permisos, también ejecutando como root)
+    (tmp_path / "page.txt.tmp").mkdir()
+
+    progress = run_job([
+        source("page.txt", url(server, "/page")),
+        source("etag.txt", url(server, "/etag"))
+    ], tmp_path)
+
+    assert progress["state"] == "done"
+    assert progress["files"]["page.txt"]["status"] == "failed"
+    assert progress["files"]["page.txt"]["error"].startswith("IsADirectoryError")
+    assert not (tmp_path / "page.txt").exists()
+    assert progress["files"]["etag.txt"]["status"] == "downloaded"
+    # Los validadores de lo que sí se descargó no se pierden
+    state = json.loads((tmp_path / FETCH_STATE_FILE).read_text(encoding = "utf-8"))
+    assert state["etag.txt"]["etag"] == '"v1"'
+
+def test_unwritable_docs_path_fails_every_file(server, tmp_path):
+    # docs_path bajo un fichero: ni se puede crear la carpeta ni guardar nada
+    (tmp_path / "blocked").write_text("", encoding = "utf-8")
+
+    progress = run_job([source("page.txt", url(server, "/page"))], tmp_path / "blocked" / "docs")
+
+    assert progress["state"] == "failed"
+    assert progress["files"]["page.txt"]["status"] == "failed"
+    assert progress["completed"] == 1
+
+def test_documents_are_listed_by_name(tmp_path, monkeypatch):
+    names = ["b.txt", "a.txt", "c.txt"]
+    for name in names:
+        (tmp_path / name).write_text(f"texto de {name}", encoding = "utf-8")
+    (tmp_path / "notas.xyz").write_text("sin lector", encoding = "utf-8")
+    monkeypatch.setenv("RI_DOCS_PATH", str(tmp_path))
+    monkeypatch.setenv("RI_EXTRACTION_CACHE", "0")
+    # El orden del directorio al revés que el de los nombres
+    listdir = crawler.crawler.os.listdir
+    monkeypatch.setattr(crawler.crawler.os, "listdir", lambda path: sorted(listdir(path), reverse = True))
+
+    assert document_files() == ["a.txt", "b.txt", "c.txt"]
+    documents = load_docs()
+    assert [(doc["id"], doc["name"]) for doc in documents] == [(0, "a.txt"), (1, "b.txt"), (2, "c.txt")]
+
+def test_finished_crawl_jobs_are_evicted(monkeypatch):
+    import main
+
+    now = time.time()
+    jobs = {
+        "running": SimpleNamespace(finished = None),
+        "old": SimpleNamespace(finished = now - main.CRAWL_JOB_TTL - 1),
+        **{f"recent{i}": SimpleNamespace(finished = now - i) for i in range(main.CRAWL_JOBS_KEPT + 2)}
+    }
+    monkeypatch.setattr(main, "CRAWL_JOBS", dict(jobs))
+
+    main.prune_crawl_jobs(now)
+
+    assert "running" in main.CRAWL_JOBS
+    assert "old" not in main.CRAWL_JOBS
+    assert sorted(job_id for job_id in main.CRAWL_JOBS if job_id.startswith("recent")) == sorted(
+        f"recent{i}" for i in range(main.CRAWL_JOBS_KEPT)
+    )
@@ -0,0 +1,84 @@
+import random
+import pytest
+from build_index import build_index_file
+from corpus.corpus import process_text
+from indexer.indexer import IndexStatistics, make_scorer, search_scored
+from shards.shards import ShardStatistics, build_shards, merge_rankings
+from storage.storage import load_index, load_shard_manifest, shard_index_path
+
+WORDS = (
+    "molino viento caballero hidalgo escudero lanza rocinante aldea venta ventero "
+    "gigante batalla señora doncella castillo camino ínsula gobernador encantador libro"
+).split()
+
+QUERIES = [
+    "molinos de viento",
+    "caballero andante",
+    "escudero de la ínsula",
+    "gigantes",
+    "doncella del castillo encantado",
+    "xyzzy caballero"
+]
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    # Documentos de texto con frecuencias y longitudes variadas y términos en los títulos
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    rng = random.Random(7)
+    for i in range(23):
+        words = rng.sample(WORDS, 6)
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(20, 400)))
+        (docs / f"{WORDS[i % len(WORDS)]}_{i}.txt").write_text(text, encoding = "utf-8")
+    (docs / "vacio.txt").write_text("   \n", encoding = "utf-8")
+
+    monkeypatch.setenv("RI_DOCS_PATH", str(docs))
+    monkeypatch.setenv("RI_EXTRACTION_CACHE", "0")
+    return tmp_path / "index" / "corpus.idx"
+
+def shard_search(shards: list, tokens: list, k: int, scorer_name: str) -> dict:
+    # Lo que hace cada proceso de ShardedIndex, seguido de la mezcla del coordinador
+    rankings = []
+    for index, statistics in shards:
+        scorer = make_scorer(scorer_name, statistics)
+        ranking = search_scored(scorer.prepare(tokens), index["wand_index"], scorer, k)
+        rankings.append(list(ranking.items()))
+    return merge_rankings(rankings, k)
+
+@pytest.mark.parametrize("pruning", [None, {"max_terms": 3}])
+def test_shards_score_exactly_like_a_single_index(corpus, pruning):
+    path = str(corpus)
+    num_docs = build_index_file(path, workers = 1, pruning = pruning)
+    manifest = build_shards(3, path, workers = 1, pruning = pruning)
+
+    assert manifest["num_shards"] == 3
+    assert manifest["num_docs"] == num_docs == 23
+    assert sum(shard["num_docs"] for shard in manifest["shards"]) == num_docs
+
+    single = load_index(path)
+    single_statistics = IndexStatistics(single)
+    manifest = load_shard_manifest(path)
+    shards = []
+    for shard in range(manifest["num_shards"]):
+        index = load_index(shard_index_path(shard, path))
+        assert index["pruning"] == pruning
+        shards.append((index, ShardStatistics(index, manifest)))
+
+    # Mismos ids y nombres que en el índice único
+    names = {doc["id"]: doc["name"] for doc in single["documents"]}
+    for index, _ in shards:
+        for doc in index["documents"]:
+            assert names[doc["id"]] == doc["name"]
+
+    matched = 0
+    for query in QUERIES:
+        tokens = process_text(query)
+        for scorer_name in ("tfidf", "bm25", "bm25f"):
+            for k in (1, 5, 30):
+                scorer = make_scorer(scorer_name, single_statistics)
+                expected = search_scored(scorer.prepare(tokens), single["wand_index"], scorer, k)
+                matched += bool(expected)
+                # Scores idénticos bit a bit y en el mismo orden
+                assert list(shard_search(shards, tokens, k, scorer_name).items()) == list(expected.items())
+
+    assert matched
@@ -0,0 +1,30 @@
+from suggest.suggest import build_suggester, suggest
+
+VOCABULARY = ["moliend", "moliner", "molin", "mol", "xyzzy"]
+DF = [2, 2, 4, 1, 3]
+LEXICON = {
+    "molienda": "moliend",
+    "molinero": "moliner",
+    "molineros": "moliner",
+    "molino": "molin",
+    "molinos": "molin",
+    "molido": "mol",
+    "molinillo": "ausente"
+}
+FORM_DF = {"molienda": 2, "molinero": 2, "molineros": 1, "molino": 4, "molinos": 3, "molido": 1}
+
+def test_suggests_words_not_stems():
+    suggester = build_suggester(VOCABULARY, DF, LEXICON, FORM_DF)
+
+    terms = [entry["term"] for entry in suggest(suggester, "moli", k = 10)]
+
+    # Las raíces con alguna forma en el léxico no salen como sugerencias
+    assert terms == ["molino", "molinos", "molienda", "molinero", "molido", "molineros"]
+    assert not {"moliend", "moliner", "molin", "mol"} & set(terms)
+    # Ni las formas cuya raíz no está en el vocabulario
+    assert "molinillo" not in terms
+
+def test_suggests_stems_without_known_forms():
+    suggester = build_suggester(VOCABULARY, DF, LEXICON, FORM_DF)
+
+    assert suggest(suggester, "el xy") == [{"term": "xyzzy", "stem": "xyzzy", "df": 3, "query": "el xyzzy"}]
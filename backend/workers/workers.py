@@ -0,0 +1,141 @@
+import os
+import asyncio
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# Hilos para puntuar búsquedas y huecos en cola por hilo antes de responder 429
+SEARCH_WORKERS = os.cpu_count() or 1
+SEARCH_QUEUE_PER_WORKER = 8
+# Hilos para lecturas y escrituras de documentos en docs/
+IO_WORKERS = 4
+IO_QUEUE_PER_WORKER = 4
+# Prioridad (nice) del proceso que reconstruye el índice: cede la CPU a las búsquedas
+BACKGROUND_NICE = 10
+
+def env_int(name: str, default: int) -> int:
+    # Límites configurables por variable de entorno (RI_SEARCH_WORKERS=4 ...)
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Valor no válido para {name}: {value!r}, se usa {default}.")
+        return default
+
+class ExecutorSaturated(RuntimeError):
+    pass
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor con un límite de tareas admitidas (en ejecución más en
+    cola). Cuando está lleno submit no encola: lanza ExecutorSaturated para
+    que el endpoint responda 429 en vez de acumular trabajo que llegaría
+    tarde. Con run se espera el resultado desde una corrutina sin bloquear el
+    bucle de eventos.
+    """
+
+    def __init__(self, workers: int, queue_size: int, name: str):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = name)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking = False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorSaturated(f"Demasiadas peticiones en cola ({self.name}), inténtalo más tarde.")
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            # La tarea ve el contexto de quien la lanza (p. ej. la traza de la petición)
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future is not None:
+                self.completed += 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": min(self.in_flight, self.workers),
+                "queued": max(0, self.in_flight - self.workers),
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait = wait)
+
+def _process_main(connection, fn, args: tuple, nice: int):
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+    def progress(*values):
+        connection.send(("progress", values))
+
+    try:
+        connection.send(("result", fn(*args, progress = progress)))
+    except Exception as e:
+        connection.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+def run_in_process(fn, args: tuple = (), progress = None, nice: int = BACKGROUND_NICE):
+    """
+    Ejecuta fn(*args, progress = ...) en un proceso aparte con menor prioridad
+    y espera su resultado. Así el trabajo de CPU largo (reconstruir el índice)
+    no compite por el GIL con las búsquedas del servidor. Los avisos de
+    progreso del hijo llegan por una tubería y se pasan a progress. fn y su
+    resultado tienen que poderse serializar con pickle (funciones de módulo).
+    El proceso se arranca con spawn: no hereda los hilos ni los locks del
+    servidor.
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex = False)
+    process = context.Process(target = _process_main, args = (sender, fn, args, nice))
+    process.start()
+    sender.close()
+
+    try:
+        while True:
+            try:
+                kind, value = receiver.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError(f"El proceso terminó sin resultado (código {process.exitcode})") from None
+            if kind == "progress":
+                if progress is not None:
+                    progress(*value)
+            elif kind == "error":
+                raise RuntimeError(value)
+            else:
+                return value
+    finally:
+        receiver.close()
+        process.join()